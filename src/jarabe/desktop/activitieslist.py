@@ -42,6 +42,7 @@ from jarabe.model import desktop
 from jarabe.view.palettes import ActivityPalette
 from jarabe.journal import misc
 from jarabe.util.normalize import normalize_string
+from jarabe.util.normalize import is_narrowing
 
 
 class ActivitiesTreeView(Gtk.TreeView):
@@ -57,6 +58,9 @@ class ActivitiesTreeView(Gtk.TreeView):
         self.set_can_focus(False)
 
         self._query = ''
+        self._narrowing = False
+        self._matches = set()
+        self._previous_matches = set()
 
         self.set_headers_visible(False)
         self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK |
@@ -243,15 +247,34 @@ class ActivitiesTreeView(Gtk.TreeView):
         of matching activities.
 
         """
-        self._query = normalize_string(query.decode('utf-8'))
+        query = normalize_string(query.decode('utf-8'))
+        # when the query only grows, rows hidden so far stay hidden
+        self._narrowing = is_narrowing(self._query, query)
+        self._query = query
+
+        self._previous_matches = self._matches
+        self._matches = set()
         self.get_model().refilter()
+        self._narrowing = False
+        self._previous_matches = set()
+
         matches = self.get_model().iter_n_children(None)
         return matches
 
     def __model_visible_cb(self, model, tree_iter, data):
-        title = model[tree_iter][self._model.column_title]
-        title = normalize_string(title.decode('utf-8'))
-        return title is not None and title.find(self._query) > -1
+        row = model[tree_iter]
+        key = (row[self._model.column_bundle_id],
+               row[self._model.column_version])
+        if self._narrowing and key not in self._previous_matches:
+            return False
+
+        search_key = row[self._model.column_search_key]
+        visible = search_key is not None and search_key.find(self._query) > -1
+        if visible:
+            self._matches.add(key)
+        else:
+            self._matches.discard(key)
+        return visible
 
     def create_palette(self, path, column):
         if column == self._icon_column:
@@ -330,8 +353,9 @@ class ListModel(Gtk.TreeModelSort):
         self.column_date = self.column_version_text + 1
         self.column_date_text = self.column_date + 1
         self.column_activity_name = self.column_date_text + 1
+        self.column_search_key = self.column_activity_name + 1
 
-        column_types = [str, str, str, str, str, int, str, str]
+        column_types = [str, str, str, str, str, int, str, str, str]
         for i in range(desktop.get_number_of_views()):
             column_types.insert(1, bool)
 
@@ -341,12 +365,21 @@ class ListModel(Gtk.TreeModelSort):
         Gtk.TreeModelSort.__init__(self, model=self._model_filter)
         self.set_sort_column_id(self.column_title, Gtk.SortType.ASCENDING)
 
+        # (bundle id, version) -> Gtk.TreeRowReference into self._model
+        self._rows = {}
+
         GLib.idle_add(self.__connect_to_bundle_registry_cb)
 
     def __connect_to_bundle_registry_cb(self):
         registry = bundleregistry.get_registry()
+
+        # sort once after loading, rather than on every insertion
+        self.set_sort_column_id(Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID,
+                                Gtk.SortType.ASCENDING)
         for info in registry:
             self._add_activity(info)
+        self.set_sort_column_id(self.column_title, Gtk.SortType.ASCENDING)
+
         registry.connect('bundle-added', self.__activity_added_cb)
         registry.connect('bundle-changed', self.__activity_changed_cb)
         registry.connect('bundle-removed', self.__activity_removed_cb)
@@ -361,21 +394,25 @@ class ListModel(Gtk.TreeModelSort):
         for i in range(desktop.get_number_of_views()):
             favorites.append(
                 activity_registry.is_bundle_favorite(bundle_id, version, i))
-        for row in self._model:
-            if row[self.column_bundle_id] == bundle_id and \
-                    row[self.column_version] == version:
-                for i in range(desktop.get_number_of_views()):
-                    row[self.column_favorites[i]] = favorites[i]
-                return
+        tree_iter = self._get_iter(bundle_id, version)
+        if tree_iter is not None:
+            row = self._model[tree_iter]
+            for i in range(desktop.get_number_of_views()):
+                row[self.column_favorites[i]] = favorites[i]
 
     def __activity_removed_cb(self, activity_registry, activity_info):
         bundle_id = activity_info.get_bundle_id()
         version = activity_info.get_activity_version()
-        for row in self._model:
-            if row[self.column_bundle_id] == bundle_id and \
-                    row[self.column_version] == version:
-                self._model.remove(row.iter)
-                return
+        tree_iter = self._get_iter(bundle_id, version)
+        if tree_iter is not None:
+            del self._rows[(bundle_id, version)]
+            self._model.remove(tree_iter)
+
+    def _get_iter(self, bundle_id, version):
+        row_reference = self._rows.get((bundle_id, version))
+        if row_reference is None or not row_reference.valid():
+            return None
+        return self._model.get_iter(row_reference.get_path())
 
     def _add_activity(self, activity_info):
         if activity_info.get_bundle_id() == 'org.laptop.JournalActivity':
@@ -414,7 +451,12 @@ class ListModel(Gtk.TreeModelSort):
         model_list.append(int(timestamp))
         model_list.append(util.timestamp_to_elapsed_string(timestamp))
         model_list.append(activity_info.get_name())
-        self._model.append(model_list)
+        model_list.append(normalize_string(title.decode('utf-8')))
+        tree_iter = self._model.append(model_list)
+
+        path = self._model.get_path(tree_iter)
+        self._rows[(activity_info.get_bundle_id(), version)] = \
+            Gtk.TreeRowReference.new(self._model, path)
 
     def set_visible_func(self, func):
         self._model_filter.set_visible_func(func)
@@ -36,7 +36,6 @@ from sugar3.graphics.alert import Alert, ErrorAlert
 from sugar3.graphics.xocolor import XoColor
 from sugar3.activity import activityfactory
 from sugar3 import dispatch
-from sugar3.datastore import datastore
 
 from jarabe.view.palettes import JournalPalette
 from jarabe.view.palettes import CurrentActivityPalette
@@ -47,6 +46,7 @@ from jarabe.model.buddy import get_owner_instance
 from jarabe.model import shell
 from jarabe.model import bundleregistry
 from jarabe.model import desktop
+from jarabe.model import recententries
 from jarabe.journal import misc
 
 from jarabe.desktop import schoolserver
@@ -54,6 +54,7 @@ from jarabe.desktop.schoolserver import RegisterError
 from jarabe.desktop import favoriteslayout
 from jarabe.desktop.viewcontainer import ViewContainer
 from jarabe.util.normalize import normalize_string
+from jarabe.util.normalize import is_narrowing
 
 _logger = logging.getLogger('FavoritesView')
 
@@ -148,6 +149,9 @@ class FavoritesView(ViewContainer):
         self._hot_y = None
         self._last_clicked_icon = None
 
+        self._query = ''
+        self._matches = set()
+
         self._alert = None
         self._resume_mode = Gio.Settings(
             'org.sugarlabs.user').get_boolean('resume-activity')
@@ -313,6 +317,7 @@ class FavoritesView(ViewContainer):
         icon = ActivityIcon(activity_info)
         icon.props.pixel_size = style.STANDARD_ICON_SIZE
         # icon.set_resume_mode(self._resume_mode)
+        self._filter_icon(icon)
         self.add(icon)
         icon.show()
 
@@ -352,23 +357,31 @@ class FavoritesView(ViewContainer):
 
     def set_filter(self, query):
         query = query.strip()
+        narrowing = is_narrowing(self._query, query)
+        self._query = query
+
+        previous_matches = self._matches
+        self._matches = set()
         for icon in self.get_children():
             if icon not in [self._owner_icon, self._activity_icon]:
-                activity_name = icon.get_activity_name().decode('utf-8')
-                normalized_name = normalize_string(activity_name)
-                if normalized_name.find(query) > -1:
-                    icon.alpha = 1.0
-                else:
-                    icon.alpha = 0.33
+                if narrowing and icon not in previous_matches:
+                    # already dimmed, and cannot match a longer query
+                    continue
+                self._filter_icon(icon)
+
+    def _filter_icon(self, icon):
+        if icon.get_search_key().find(self._query) > -1:
+            icon.alpha = 1.0
+            self._matches.add(icon)
+        else:
+            icon.alpha = 0.33
 
     def _get_selected(self, query):
         query = query.strip()
         selected = []
         for icon in self.get_children():
             if icon not in [self._owner_icon, self._activity_icon]:
-                activity_name = icon.get_activity_name().decode('utf-8')
-                normalized_name = normalize_string(activity_name)
-                if normalized_name.find(query) > -1:
+                if icon.get_search_key().find(query) > -1:
                     selected.append(icon)
         return selected
 
@@ -410,66 +423,42 @@ class ActivityIcon(CanvasIcon):
     __gtype_name__ = 'SugarFavoriteActivityIcon'
 
     _BORDER_WIDTH = style.zoom(9)
-    _MAX_RESUME_ENTRIES = 5
 
     def __init__(self, activity_info):
         CanvasIcon.__init__(self, cache=True,
                             file_name=activity_info.get_icon())
 
         self._activity_info = activity_info
-        self._journal_entries = []
+        self._search_key = normalize_string(
+            activity_info.get_name().decode('utf-8'))
         self._resume_mode = Gio.Settings(
             'org.sugarlabs.user').get_boolean('resume-activity')
 
         self.connect_after('activate', self.__button_activate_cb)
+        self.connect('destroy', self.__destroy_cb)
 
-        datastore.updated.connect(self.__datastore_listener_updated_cb)
-        datastore.deleted.connect(self.__datastore_listener_deleted_cb)
+        # the journal entries of all the favorites are looked up together
+        self._recent_entries = recententries.get_model()
+        self._recent_entries_hid = self._recent_entries.connect(
+            'changed', self.__recent_entries_changed_cb)
+        self._recent_entries.watch(self.bundle_id)
+        self._journal_entries = self._recent_entries.get_entries(
+            self.bundle_id)
 
-        self._refresh()
         self._update()
 
-    def _refresh(self):
-        bundle_id = self._activity_info.get_bundle_id()
-        properties = ['uid', 'title', 'icon-color', 'activity', 'activity_id',
-                      'mime_type', 'mountpoint']
-        self._get_last_activity_async(bundle_id, properties)
-
-    def __datastore_listener_updated_cb(self, **kwargs):
-        bundle_id = self._activity_info.get_bundle_id()
-        if kwargs['metadata'].get('activity', '') == bundle_id:
-            self._refresh()
-
-    def __datastore_listener_deleted_cb(self, **kwargs):
-        for entry in self._journal_entries:
-            if entry['uid'] == kwargs['object_id']:
-                self._refresh()
-                break
-
-    def _get_last_activity_async(self, bundle_id, properties):
-        query = {'activity': bundle_id}
-        datastore.find(query, sorting=['+timestamp'],
-                       limit=self._MAX_RESUME_ENTRIES,
-                       properties=properties,
-                       reply_handler=self.__get_last_activity_reply_handler_cb,
-                       error_handler=self.__get_last_activity_error_handler_cb)
-
-    def __get_last_activity_reply_handler_cb(self, entries, total_count):
-        # If there's a problem with the DS index, we may get entries not
-        # related to this activity.
-        checked_entries = []
-        for entry in entries:
-            if entry['activity'] == self.bundle_id:
-                checked_entries.append(entry)
-
-        self._journal_entries = checked_entries
-        self._update()
+    def __destroy_cb(self, icon):
+        self._recent_entries.disconnect(self._recent_entries_hid)
+        self._recent_entries.unwatch(self.bundle_id)
 
-    def __get_last_activity_error_handler_cb(self, error):
-        logging.error('Error retrieving most recent activities: %r', error)
+    def __recent_entries_changed_cb(self, recent_entries, bundle_id):
+        if bundle_id == self.bundle_id:
+            self._journal_entries = recent_entries.get_entries(bundle_id)
+            self._update()
 
     def _update(self):
-        self.palette = None
+        if self.palette is not None:
+            self.palette.set_journal_entries(self._journal_entries)
         if not self._resume_mode or not self._journal_entries:
             xo_color = XoColor('%s,%s' % (style.COLOR_BUTTON_GREY.get_svg(),
                                           style.COLOR_WHITE.get_svg()))
@@ -478,6 +467,9 @@ class ActivityIcon(CanvasIcon):
         self.props.xo_color = xo_color
 
     def create_palette(self):
+        # the grouped lookup may have left this list short
+        self._recent_entries.fetch(self.bundle_id)
+
         palette = FavoritePalette(self._activity_info, self._journal_entries)
         palette.connect('activate', self.__palette_activate_cb)
         palette.connect('entry-activate', self.__palette_entry_activate_cb)
@@ -531,6 +523,9 @@ class ActivityIcon(CanvasIcon):
     def get_activity_name(self):
         return self._activity_info.get_name()
 
+    def get_search_key(self):
+        return self._search_key
+
     def _get_installation_time(self):
         return self._activity_info.get_installation_time()
     installation_time = property(_get_installation_time, None)
@@ -556,16 +551,24 @@ class FavoritePalette(ActivityPalette):
     def __init__(self, activity_info, journal_entries):
         ActivityPalette.__init__(self, activity_info)
 
+        self._menu_items = []
+        self.set_journal_entries(journal_entries)
+
+    def set_journal_entries(self, journal_entries):
         if not journal_entries:
             xo_color = XoColor('%s,%s' % (style.COLOR_BUTTON_GREY.get_svg(),
                                           style.COLOR_WHITE.get_svg()))
         else:
             xo_color = misc.get_icon_color(journal_entries[0])
 
-        self.props.icon = Icon(file=activity_info.get_icon(),
+        self.props.icon = Icon(file=self._activity_info.get_icon(),
                                xo_color=xo_color,
                                pixel_size=style.STANDARD_ICON_SIZE)
 
+        for menu_item in self._menu_items:
+            self.menu_box.remove(menu_item)
+        self._menu_items = []
+
         if journal_entries:
             self.props.secondary_text = journal_entries[0]['title']
 
@@ -588,6 +591,9 @@ class FavoritePalette(ActivityPalette):
 
             for i in range(0, len(menu_items)):
                 self.menu_box.pack_start(menu_items[i], True, True, 0)
+            self._menu_items = menu_items
+        else:
+            self.props.secondary_text = None
 
     def __resume_entry_cb(self, menu_item, entry):
         if entry is not None:
@@ -25,7 +25,22 @@ from gi.repository import SugarExt
 _PLACE_TRIALS = 20
 _MAX_WEIGHT = 255
 _REFRESH_RATE = 200
-_MAX_COLLISIONS_PER_REFRESH = 20
+# Side, in grid cells, of the buckets of the spatial index
+_BUCKET_SIZE = 8
+
+
+def _intersects(rect1, rect2):
+    return rect1.x < rect2.x + rect2.width and \
+        rect2.x < rect1.x + rect1.width and \
+        rect1.y < rect2.y + rect2.height and \
+        rect2.y < rect1.y + rect1.height
+
+
+def _create_rectangle(x, y, width, height):
+    rect = Gdk.Rectangle()
+    rect.x, rect.y = x, y
+    rect.width, rect.height = width, height
+    return rect
 
 
 class Grid(SugarExt.Grid):
@@ -42,34 +57,100 @@ class Grid(SugarExt.Grid):
         self._locked_children = set()
         self._collisions = []
         self._collisions_sid = 0
+        # spatial index, (column, row) of a bucket -> children over it
+        self._buckets = {}
 
         self.setup(width, height)
 
+    def _get_buckets(self, rect):
+        first_column = rect.x // _BUCKET_SIZE
+        last_column = (rect.x + max(rect.width, 1) - 1) // _BUCKET_SIZE
+        first_row = rect.y // _BUCKET_SIZE
+        last_row = (rect.y + max(rect.height, 1) - 1) // _BUCKET_SIZE
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                yield column, row
+
+    def _index(self, child):
+        for bucket in self._get_buckets(self._child_rects[child]):
+            self._buckets.setdefault(bucket, set()).add(child)
+
+    def _unindex(self, child):
+        for bucket in self._get_buckets(self._child_rects[child]):
+            children = self._buckets[bucket]
+            children.discard(child)
+            if not children:
+                del self._buckets[bucket]
+
+    def _get_overlapping(self, rect, exclude=None):
+        overlapping = set()
+        for bucket in self._get_buckets(rect):
+            for child in self._buckets.get(bucket, ()):
+                if child is not exclude and \
+                        _intersects(rect, self._child_rects[child]):
+                    overlapping.add(child)
+        return overlapping
+
+    def _is_free(self, rect):
+        for bucket in self._get_buckets(rect):
+            for child in self._buckets.get(bucket, ()):
+                if _intersects(rect, self._child_rects[child]):
+                    return False
+        return True
+
+    def _find_free_rect(self, width, height, x, y):
+        """Find the free position closest to (x, y) for a width x height
+        rectangle, or None if there is no room left in the grid.
+        """
+        max_x = self.width - width
+        max_y = self.height - height
+        if max_x < 0 or max_y < 0:
+            return None
+
+        # positions are probed on a lattice aligned with the preferred one
+        step_x = max(width // 2, 1)
+        step_y = max(height // 2, 1)
+        columns = range(x % step_x, max_x + 1, step_x)
+        rows = range(y % step_y, max_y + 1, step_y)
+
+        candidates = [(cx, cy) for cx in columns for cy in rows]
+        candidates.sort(key=lambda c: (c[0] - x) ** 2 + (c[1] - y) ** 2)
+        for cx, cy in candidates:
+            rect = _create_rectangle(cx, cy, width, height)
+            if self._is_free(rect):
+                return rect
+        return None
+
     def add(self, child, width, height, x=None, y=None, locked=False):
         if x is not None and y is not None:
-            rect = Gdk.Rectangle()
-            rect.x = x
-            rect.y = y
-            rect.width = width
-            rect.height = height
+            rect = _create_rectangle(x, y, width, height)
             weight = self.compute_weight(rect)
         else:
-            trials = _PLACE_TRIALS
-            weight = _MAX_WEIGHT
-            while trials > 0 and weight:
-                rect = Gdk.Rectangle()
-                rect.x = int(random.random() * (self.width - width))
-                rect.y = int(random.random() * (self.height - height))
-                rect.width = width
-                rect.height = height
-                new_weight = self.compute_weight(rect)
-                if weight > new_weight:
-                    weight = new_weight
-
-                trials -= 1
+            rect = self._find_free_rect(
+                width, height,
+                int(random.random() * max(self.width - width, 0)),
+                int(random.random() * max(self.height - height, 0)))
+            if rect is not None:
+                weight = 0
+            else:
+                # the grid is full, settle for the least crowded trial
+                trials = _PLACE_TRIALS
+                weight = _MAX_WEIGHT
+                while trials > 0 and weight:
+                    new_rect = _create_rectangle(
+                        int(random.random() * (self.width - width)),
+                        int(random.random() * (self.height - height)),
+                        width, height)
+                    new_weight = self.compute_weight(new_rect)
+                    if rect is None or weight > new_weight:
+                        rect = new_rect
+                        weight = new_weight
+
+                    trials -= 1
 
         self._child_rects[child] = rect
         self._children.append(child)
+        self._index(child)
         self.add_weight(self._child_rects[child])
         if locked:
             self._locked_children.add(child)
@@ -82,6 +163,7 @@ class Grid(SugarExt.Grid):
 
     def remove(self, child):
         self._children.remove(child)
+        self._unindex(child)
         self.remove_weight(self._child_rects[child])
         self._locked_children.discard(child)
         del self._child_rects[child]
@@ -91,12 +173,14 @@ class Grid(SugarExt.Grid):
 
     def move(self, child, x, y, locked=False):
         self.remove_weight(self._child_rects[child])
+        self._unindex(child)
 
         rect = self._child_rects[child]
         rect.x = x
         rect.y = y
 
         weight = self.compute_weight(rect)
+        self._index(child)
         self.add_weight(self._child_rects[child])
 
         if locked:
@@ -112,12 +196,6 @@ class Grid(SugarExt.Grid):
 
         new_rects = []
 
-        def _create_rectangle(x, y, width, height):
-            rect = Gdk.Rectangle()
-            rect.x, rect.y = x, y
-            rect.width, rect.height = width, height
-            return rect
-
         # Get rects right, left, bottom and top
         if (rect.x + rect.width < self.width - 1):
             new_rects.append(_create_rectangle(rect.x + 1, rect.y,
@@ -168,43 +246,60 @@ class Grid(SugarExt.Grid):
 
         return weight
 
+    def _relocate_child(self, child):
+        """Move a colliding child to the nearest free position, or shift it
+        away from the crowd when the grid has no room left.
+        """
+        old_rect = self._child_rects[child]
+        self.remove_weight(old_rect)
+        self._unindex(child)
+
+        rect = self._find_free_rect(old_rect.width, old_rect.height,
+                                    old_rect.x, old_rect.y)
+        if rect is not None:
+            self._child_rects[child] = rect
+            weight = 0
+        else:
+            weight = self.compute_weight(old_rect)
+            weight = self._shift_child(child, weight)
+
+        self._index(child)
+        self.add_weight(self._child_rects[child])
+        return old_rect, weight
+
     def __solve_collisions_cb(self):
-        for i_ in range(_MAX_COLLISIONS_PER_REFRESH):
+        # collisions are resolved in a single pass; only children that
+        # could not be placed without overlap are retried later
+        retry = []
+        while self._collisions:
             collision = self._collisions.pop(0)
+            if not self._get_overlapping(self._child_rects[collision],
+                                         exclude=collision):
+                # already solved by moving its neighbours
+                continue
 
-            old_rect = self._child_rects[collision]
-            self.remove_weight(old_rect)
-            weight = self.compute_weight(old_rect)
-            weight = self._shift_child(collision, weight)
-            self.add_weight(self._child_rects[collision])
-
-            # TODO: we shouldn't give up the first time we failed to find a
-            # better position.
+            old_rect, weight = self._relocate_child(collision)
             if old_rect != self._child_rects[collision]:
-                self._detect_collisions(collision)
                 self.emit('child-changed', collision)
                 if weight > 0:
-                    self._collisions.append(collision)
+                    retry.append(collision)
 
-            if not self._collisions:
-                self._collisions_sid = 0
-                return False
+        self._collisions = retry
+        if not self._collisions:
+            self._collisions_sid = 0
+            return False
 
         return True
 
     def _detect_collisions(self, child):
-        collision_found = False
-        child_rect = self._child_rects[child]
-        for c in self._children:
-            intersects_, intersection = Gdk.rectangle_intersect(
-                child_rect, self._child_rects[c])
-            if c != child and intersection.width > 0:
-                collision_found = True
-                if (c not in self._locked_children and
-                        c not in self._collisions):
-                    self._collisions.append(c)
-
-        if collision_found:
+        overlapping = self._get_overlapping(self._child_rects[child],
+                                            exclude=child)
+        for c in overlapping:
+            if (c not in self._locked_children and
+                    c not in self._collisions):
+                self._collisions.append(c)
+
+        if overlapping:
             if child not in self._collisions:
                 self._collisions.append(child)
 
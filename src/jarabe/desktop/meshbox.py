@@ -41,7 +41,6 @@ from jarabe.desktop.viewcontainer import ViewContainer
 from jarabe.desktop.favoriteslayout import SpreadLayout
 from jarabe.util.normalize import normalize_string
 from jarabe.model import network
-from jarabe.model.network import AccessPoint
 from jarabe.model.olpcmesh import OlpcMeshManager
 from jarabe.model.adhoc import get_adhoc_manager_instance
 from jarabe.journal import misc
@@ -111,6 +110,8 @@ class ActivityView(SnowflakeLayout):
         SnowflakeLayout.__init__(self)
 
         self._model = model
+        self._search_key = self._model.bundle.get_name().lower() + \
+            self._model.bundle.get_bundle_id().lower()
         self._model.connect('current-buddy-added', self.__buddy_added_cb)
         self._model.connect('current-buddy-removed', self.__buddy_removed_cb)
 
@@ -156,10 +157,8 @@ class ActivityView(SnowflakeLayout):
         icon.destroy()
 
     def set_filter(self, query):
-        text_to_check = self._model.bundle.get_name().lower() + \
-            self._model.bundle.get_bundle_id().lower()
         self._icon.props.xo_color = self._model.get_color()
-        if text_to_check.find(query) == -1:
+        if self._search_key.find(query) == -1:
             self._icon.alpha = _FILTERED_ALPHA
         else:
             self._icon.alpha = 1.0
@@ -183,6 +182,7 @@ class DeviceObserver(GObject.GObject):
         GObject.GObject.__init__(self)
         self._bus = dbus.SystemBus()
         self.device = device
+        self.access_points = network.AccessPointMonitor(device)
 
         wireless = dbus.Interface(device, network.NM_WIRELESS_IFACE)
         wireless.GetAccessPoints(
@@ -214,6 +214,7 @@ class DeviceObserver(GObject.GObject):
         self.emit('access-point-removed', access_point_o)
 
     def disconnect(self):
+        self.access_points.disconnect()
         self._bus.remove_signal_receiver(
             self.__access_point_added_cb,
             signal_name='AccessPointAdded',
@@ -313,6 +314,8 @@ class NetworkManagerObserver(object):
                                             self.__ap_added_cb)
             self._devices[device_o].connect('access-point-removed',
                                             self.__ap_removed_cb)
+            self._devices[device_o].access_points.connect(
+                'strength-changed', self.__ap_strength_changed_cb)
             if self._have_adhoc_networks:
                 self._box.add_adhoc_networks(device)
         elif device_type == network.NM_DEVICE_TYPE_OLPC_MESH:
@@ -341,11 +344,15 @@ class NetworkManagerObserver(object):
             self._olpc_mesh_device_o = None
 
     def __ap_added_cb(self, device_observer, access_point):
-        self._box.add_access_point(device_observer.device, access_point)
+        self._box.add_access_point(device_observer.access_points,
+                                   access_point)
 
     def __ap_removed_cb(self, device_observer, access_point_o):
         self._box.remove_access_point(access_point_o)
 
+    def __ap_strength_changed_cb(self, monitor, access_points):
+        self._box.update_strengths(access_points)
+
     def __properties_changed_cb(self, properties):
         if 'WirelessHardwareEnabled' in properties:
             if properties['WirelessHardwareEnabled']:
@@ -519,11 +526,18 @@ class MeshBox(ViewContainer):
                                   old_hash_value)
         self._add_ap_to_network(ap)
 
-    def add_access_point(self, device, ap_o):
-        ap = AccessPoint(device, ap_o)
+    def add_access_point(self, monitor, ap_o):
+        ap = monitor.add(ap_o)
         ap.connect('props-changed', self._ap_props_changed_cb)
         ap.initialize()
 
+    def update_strengths(self, access_points):
+        # refresh each affected network once per batch
+        hash_values = set([ap.network_hash() for ap in access_points])
+        for hash_value in hash_values:
+            if hash_value in self.wireless_networks:
+                self.wireless_networks[hash_value].update_strength()
+
     def remove_access_point(self, ap_o):
         if self._adhoc_manager is not None:
             if self._adhoc_manager.is_sugar_adhoc_access_point(ap_o):
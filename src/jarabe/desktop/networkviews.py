@@ -64,6 +64,7 @@ class WirelessNetworkView(EventPulsingIcon):
         self._filtered = False
         self._ssid = initial_ap.ssid
         self._display_name = network.ssid_to_display_name(self._ssid)
+        self._search_key = normalize_string(self._display_name.decode('utf-8'))
         self._mode = initial_ap.mode
         self._strength = initial_ap.strength
         self._flags = initial_ap.flags
@@ -74,6 +75,14 @@ class WirelessNetworkView(EventPulsingIcon):
         self._color = None
         self._removed_hid = None
 
+        # saved connections are loaded asynchronously, update the badge
+        # when the one for this network shows up or changes
+        connections = network.get_connections()
+        self._connection_added_hid = connections.connect(
+            'connection-added', self.__connection_changed_cb)
+        self._connection_updated_hid = connections.connect(
+            'connection-updated', self.__connection_changed_cb)
+
         if self._mode == network.NM_802_11_MODE_ADHOC and \
                 network.is_sugar_adhoc_network(self._ssid):
             self._color = profile.get_color()
@@ -221,7 +230,8 @@ class WirelessNetworkView(EventPulsingIcon):
                 icon_name = _AP_ICON_NAME
 
             icon_name = get_icon_state(icon_name, self._strength)
-            if icon_name:
+            # only redraw when the strength bucket shown actually changes
+            if icon_name and icon_name != self.props.icon_name:
                 self.props.icon_name = icon_name
                 icon = self._palette.props.icon
                 icon.props.icon_name = icon_name
@@ -259,6 +269,10 @@ class WirelessNetworkView(EventPulsingIcon):
         self._update_badge()
         self._disconnect_removed(connection)
 
+    def __connection_changed_cb(self, connections, connection):
+        if connection.get_ssid() == self._ssid:
+            self._update_badge()
+
     def _update_state(self):
         if self._active_ap is not None:
             state = self._device_state
@@ -405,10 +419,11 @@ class WirelessNetworkView(EventPulsingIcon):
                                             self.get_first_ap().model)
 
     def set_filter(self, query):
-        normalized_name = normalize_string(self._display_name.decode('utf-8'))
-        self._filtered = normalized_name.find(query) == -1
-        self._update_icon()
-        self._update_color()
+        filtered = self._search_key.find(query) == -1
+        if filtered != self._filtered:
+            self._filtered = filtered
+            self._update_icon()
+            self._update_color()
 
     def create_keydialog(self, response):
         keydialog.create(self._ssid, self._flags, self._wpa_flags,
@@ -475,6 +490,10 @@ class WirelessNetworkView(EventPulsingIcon):
             path=self._device.object_path,
             dbus_interface=network.NM_WIRELESS_IFACE)
 
+        connections = network.get_connections()
+        connections.disconnect(self._connection_added_hid)
+        connections.disconnect(self._connection_updated_hid)
+
     def get_positioning_data(self):
         return str(self.get_first_ap().network_hash())
 
@@ -501,6 +520,7 @@ class SugarAdhocView(EventPulsingIcon):
         self._connect_item = None
         self._palette_icon = None
         self._filtered = False
+        self._search_key = (self._NAME + str(channel)).lower()
 
         get_adhoc_manager_instance().connect('members-changed',
                                              self.__members_changed_cb)
@@ -618,9 +638,10 @@ class SugarAdhocView(EventPulsingIcon):
                 self.alpha = _FILTERED_ALPHA
 
     def set_filter(self, query):
-        name = self._NAME + str(self._channel)
-        self._filtered = name.lower().find(query) == -1
-        self._update_color()
+        filtered = self._search_key.find(query) == -1
+        if filtered != self._filtered:
+            self._filtered = filtered
+            self._update_color()
 
     def get_positioning_data(self):
         return str(type(self)) + str(self._channel)
@@ -751,8 +772,10 @@ class OlpcMeshView(EventPulsingIcon):
         self._mesh_mgr.user_activate_channel(self._channel)
 
     def set_filter(self, query):
-        self._filtered = (query != '')
-        self._update_color()
+        filtered = (query != '')
+        if filtered != self._filtered:
+            self._filtered = filtered
+            self._update_color()
 
     def disconnect(self):
         device_object_path = self._mesh_mgr.mesh_device.object_path
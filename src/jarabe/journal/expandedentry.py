@@ -29,13 +29,13 @@ from sugar3.graphics.icon import CanvasIcon, get_icon_file_name
 from sugar3.graphics.icon import Icon, CellRendererIcon
 from sugar3.graphics.alert import Alert
 from sugar3.util import format_size
-from sugar3.graphics.objectchooser import get_preview_pixbuf
 from sugar3.activity.activity import PREVIEW_SIZE
 
 from jarabe.journal.keepicon import KeepIcon
 from jarabe.journal.palettes import ObjectPalette, BuddyPalette
 from jarabe.journal import misc
 from jarabe.journal import model
+from jarabe.journal import previewcache
 from jarabe.journal import journalwindow
 
 
@@ -374,7 +374,9 @@ class ExpandedEntry(Gtk.EventBox, BaseExpandedEntry):
         box.modify_bg(Gtk.StateType.NORMAL, style.COLOR_WHITE.get_gdk_color())
 
         metadata = self._metadata
-        pixbuf = get_preview_pixbuf(metadata.get('preview', ''))
+        pixbuf = previewcache.get_pixbuf(metadata['uid'],
+                                         metadata.get('timestamp', ''),
+                                         metadata.get('preview', ''))
         has_preview = pixbuf is not None
 
         if has_preview:
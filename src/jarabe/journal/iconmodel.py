@@ -13,12 +13,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
+
 from gi.repository import GObject
 from gi.repository import Gtk
 
 from gettext import gettext as _
 
 from jarabe.journal import model
+from jarabe.journal.rowcache import RowCache
 
 DS_DBUS_SERVICE = 'org.laptop.sugar.DataStore'
 DS_DBUS_INTERFACE = 'org.laptop.sugar.DataStore'
@@ -36,20 +39,22 @@ class IconModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
     COLUMN_UID = 0
     COLUMN_TITLE = 1
     COLUMN_PREVIEW = 2
+    COLUMN_TIMESTAMP = 3
 
     _COLUMN_TYPES = {
         COLUMN_UID: str,
         COLUMN_TITLE: str,
         COLUMN_PREVIEW: str,
+        COLUMN_TIMESTAMP: str,
     }
 
     _PAGE_SIZE = 100
+    _ROW_CACHE_SIZE = 200
 
     def __init__(self, query):
         GObject.GObject.__init__(self)
 
-        self._last_requested_index = None
-        self._cached_row = None
+        self._row_cache = RowCache(IconModel._ROW_CACHE_SIZE)
         self._result_set = model.find(query, IconModel._PAGE_SIZE)
         self._temp_drag_file_path = None
 
@@ -60,16 +65,32 @@ class IconModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
         self._result_set.ready.connect(self.__result_set_ready_cb)
         self._result_set.progress.connect(self.__result_set_progress_cb)
 
+        model.updated.connect(self.__model_changed_cb)
+        model.deleted.connect(self.__model_changed_cb)
+        model.batch_changed.connect(self.__model_batch_changed_cb)
+
     def __result_set_ready_cb(self, **kwargs):
         self.emit('ready')
 
     def __result_set_progress_cb(self, **kwargs):
         self.emit('progress')
 
+    def __model_changed_cb(self, sender, signal, object_id):
+        self._row_cache.invalidate(object_id)
+
+    def __model_batch_changed_cb(self, sender, signal, changes):
+        for object_id in changes:
+            self._row_cache.invalidate(object_id)
+
     def setup(self):
         self._result_set.setup()
 
     def stop(self):
+        model.updated.disconnect(self.__model_changed_cb)
+        model.deleted.disconnect(self.__model_changed_cb)
+        model.batch_changed.disconnect(self.__model_batch_changed_cb)
+        logging.debug('row cache hits: %r misses: %r',
+                      self._row_cache.hits, self._row_cache.misses)
         self._result_set.stop()
 
     def get_metadata(self, path):
@@ -92,26 +113,26 @@ class IconModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
             return None
 
         index = iterator.user_data
-        if index == self._last_requested_index:
-            return self._cached_row[column]
-
         if index >= self._result_set.length:
             return None
 
         self._result_set.seek(index)
         metadata = self._result_set.read()
 
-        self._last_requested_index = index
-        self._cached_row = []
-        self._cached_row.append(metadata['uid'])
+        row = self._row_cache.get(metadata['uid'])
+        if row is None:
+            row = []
+            row.append(metadata['uid'])
 
-        title = GObject.markup_escape_text(metadata.get('title',
-                                                        _('Untitled')))
-        self._cached_row.append(title)
+            title = GObject.markup_escape_text(metadata.get('title',
+                                                            _('Untitled')))
+            row.append(title)
 
-        self._cached_row.append(metadata.get('preview', ''))
+            row.append(metadata.get('preview', ''))
+            row.append(str(metadata.get('timestamp', '')))
+            self._row_cache.set(metadata['uid'], row)
 
-        return self._cached_row[column]
+        return row[column]
 
     def do_iter_nth_child(self, parent_iter, n):
         return (False, None)
@@ -24,7 +24,7 @@ from gi.repository import GLib
 from jarabe.journal.iconmodel import IconModel
 from sugar3.graphics.icon import Icon
 from jarabe.journal import model
-from sugar3.graphics.objectchooser import get_preview_pixbuf
+from jarabe.journal import previewcache
 from sugar3.graphics import style
 from sugar3.activity.activity import PREVIEW_SIZE
 
@@ -34,12 +34,17 @@ class PreviewRenderer(Gtk.CellRendererPixbuf):
     def __init__(self, **kwds):
         Gtk.CellRendererPixbuf.__init__(self, **kwds)
         self._preview_data = None
+        self._uid = None
+        self._timestamp = None
 
-    def set_preview_data(self, data):
+    def set_preview_data(self, data, uid, timestamp):
         self._preview_data = data
+        self._uid = uid
+        self._timestamp = timestamp
 
     def do_render(self, cr, widget, background_area, cell_area, flags):
-        self.props.pixbuf = get_preview_pixbuf(self._preview_data)
+        self.props.pixbuf = previewcache.get_pixbuf(
+            self._uid, self._timestamp, self._preview_data)
         Gtk.CellRendererPixbuf.do_render(self, cr, widget, background_area,
                                          cell_area, flags)
 
@@ -53,11 +58,13 @@ class PreviewRenderer(Gtk.CellRendererPixbuf):
 
 class PreviewIconView(Gtk.IconView):
 
-    def __init__(self, title_col, preview_col):
+    def __init__(self, title_col, preview_col, uid_col, timestamp_col):
         Gtk.IconView.__init__(self)
 
         self._preview_col = preview_col
         self._title_col = title_col
+        self._uid_col = uid_col
+        self._timestamp_col = timestamp_col
 
         self.set_spacing(3)
 
@@ -75,7 +82,8 @@ class PreviewIconView(Gtk.IconView):
 
     def _preview_data_func(self, view, cell, store, i, data):
         preview_data = store.get_value(i, self._preview_col)
-        cell.set_preview_data(preview_data)
+        cell.set_preview_data(preview_data, store.get_value(i, self._uid_col),
+                              store.get_value(i, self._timestamp_col))
 
     def _title_data_func(self, view, cell, store, i, data):
         title = store.get_value(i, self._title_col)
@@ -112,7 +120,9 @@ class IconView(Gtk.Bin):
         self._scrolled_window.show()
 
         self.icon_view = PreviewIconView(IconModel.COLUMN_TITLE,
-                                         IconModel.COLUMN_PREVIEW)
+                                         IconModel.COLUMN_PREVIEW,
+                                         IconModel.COLUMN_UID,
+                                         IconModel.COLUMN_TIMESTAMP)
         self.icon_view.connect('item-activated', self.__item_activated_cb)
 
         self.icon_view.connect('button-release-event',
@@ -129,6 +139,7 @@ class IconView(Gtk.Bin):
         model.created.connect(self.__model_created_cb)
         model.updated.connect(self.__model_updated_cb)
         model.deleted.connect(self.__model_deleted_cb)
+        model.batch_changed.connect(self.__model_batch_changed_cb)
 
     def __button_release_event_cb(self, icon_view, event):
         path = icon_view.get_path_at_pos(int(event.x), int(event.y))
@@ -143,8 +154,10 @@ class IconView(Gtk.Bin):
         self.emit('entry-activated', uid)
 
     def _thumb_data_func(self, view, cell, store, i, data):
-        preview_data = store.get_value(i, IconModel.COLUMN_PREVIEW)
-        cell.props.pixbuf = get_preview_pixbuf(preview_data)
+        cell.props.pixbuf = previewcache.get_pixbuf(
+            store.get_value(i, IconModel.COLUMN_UID),
+            store.get_value(i, IconModel.COLUMN_TIMESTAMP),
+            store.get_value(i, IconModel.COLUMN_PREVIEW))
 
     def __model_created_cb(self, sender, signal, object_id):
         if self._is_new_item_visible(object_id):
@@ -158,6 +171,12 @@ class IconView(Gtk.Bin):
         if self._is_new_item_visible(object_id):
             self._set_dirty()
 
+    def __model_batch_changed_cb(self, sender, signal, changes):
+        for object_id in changes:
+            if self._is_new_item_visible(object_id):
+                self._set_dirty()
+                return
+
     def _is_new_item_visible(self, object_id):
         """Check if the created item is part of the currently selected view"""
         if self._query['mountpoints'] == ['/']:
@@ -223,6 +223,7 @@ class JournalActivity(JournalWindow):
         model.created.connect(self.__model_created_cb)
         model.updated.connect(self.__model_updated_cb)
         model.deleted.connect(self.__model_deleted_cb)
+        model.batch_changed.connect(self.__model_batch_changed_cb)
 
         self._dbus_service = JournalActivityDBusService(self)
 
@@ -513,6 +514,24 @@ class JournalActivity(JournalWindow):
                 kwargs['object_id'] == self._detail_view.props.metadata['uid']:
             self.show_main_view()
 
+    def __model_batch_changed_cb(self, sender, **kwargs):
+        changes = kwargs['changes']
+        object_ids = [object_id for object_id, change in changes.iteritems()
+                      if change != 'deleted']
+        for metadata in model.get_many(object_ids):
+            misc.handle_bundle_installation(metadata)
+
+        if self.canvas == self._secondary_view:
+            change = changes.get(self._detail_view.props.metadata['uid'])
+            if change == 'deleted':
+                self.show_main_view()
+            elif change == 'updated':
+                self._detail_view.refresh()
+
+        if 'created' in changes.values():
+            self._main_toolbox.refresh_filters()
+        self._check_available_space()
+
     def _focus_in_event_cb(self, window, event):
         self._set_is_visible(True)
 
@@ -849,9 +849,10 @@ class BatchEraseButton(ToolButton):
                         'Do you want to erase %d entries?',
                         entries_len) % (entries_len)
 
-    def _operate(self, metadata):
+    def _operate(self, metadata, done_cb):
         model.delete(metadata['uid'])
         self._model.set_selected(metadata['uid'], False)
+        done_cb(metadata)
 
 
 class BatchCopyButton(ToolButton):
@@ -17,6 +17,7 @@ import logging
 import time
 
 import json
+import dbus
 from gi.repository import GObject
 from gi.repository import Gtk
 from gettext import gettext as _
@@ -27,6 +28,7 @@ from sugar3 import util
 
 from jarabe.journal import model
 from jarabe.journal import misc
+from jarabe.journal.rowcache import RowCache
 
 
 DS_DBUS_SERVICE = 'org.laptop.sugar.DataStore'
@@ -73,17 +75,19 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
     }
 
     _PAGE_SIZE = 10
+    _ROW_CACHE_SIZE = 100
 
     def __init__(self, query):
         GObject.GObject.__init__(self)
 
-        self._last_requested_index = None
         self._temp_drag_file_uid = None
-        self._cached_row = None
+        self._row_cache = RowCache(ListModel._ROW_CACHE_SIZE)
         self._query = query
         self._all_ids = []
+        self._all_ids_set = set()
         t = time.time()
-        self._result_set = model.find(query, ListModel._PAGE_SIZE)
+        self._result_set = model.find(query, ListModel._PAGE_SIZE,
+                                      read_ahead=True)
         logging.debug('init resultset: %r', time.time() - t)
         self._temp_drag_file_path = None
         self._selected = []
@@ -96,8 +100,18 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
         # to regenerate the model and stuff up the scroll position
         self._updated_entries = {}
 
+        # Rows that were shown empty while their entries were being read
+        self._placeholder_rows = set()
+
         self._result_set.ready.connect(self.__result_set_ready_cb)
         self._result_set.progress.connect(self.__result_set_progress_cb)
+        self._result_set.entries_ready.connect(
+            self.__result_set_entries_ready_cb)
+
+        model.updated.connect(self.__model_changed_cb)
+        model.deleted.connect(self.__model_changed_cb)
+        model.batch_changed.connect(self.__model_batch_changed_cb)
+        misc.icon_resolved.connect(self.__icon_resolved_cb)
 
     def get_all_ids(self):
         return self._all_ids
@@ -105,17 +119,130 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
     def __result_set_ready_cb(self, **kwargs):
         t = time.time()
         self._all_ids = self._result_set.find_ids(self._query)
+        self._all_ids_set = set(self._all_ids)
         logging.debug('get all ids: %r', time.time() - t)
         self.emit('ready')
 
     def __result_set_progress_cb(self, **kwargs):
         self.emit('progress')
 
+    def __result_set_entries_ready_cb(self, **kwargs):
+        placeholder_rows = self._placeholder_rows
+        self._placeholder_rows = set()
+        for index in sorted(placeholder_rows):
+            if index >= self._result_set.length:
+                continue
+            path = Gtk.TreePath((index,))
+            self.row_changed(path, self.get_iter(path))
+
+    def __model_changed_cb(self, sender, signal, object_id):
+        self._row_cache.invalidate(object_id)
+
+    def __model_batch_changed_cb(self, sender, signal, changes):
+        for object_id in changes:
+            self._row_cache.invalidate(object_id)
+
+    def __icon_resolved_cb(self, sender, signal, uid):
+        self._row_cache.invalidate(uid)
+        position = self._result_set.get_cached_position(uid)
+        if position is not None:
+            path = Gtk.TreePath((position,))
+            self.row_changed(path, self.get_iter(path))
+
+    def invalidate_rows(self):
+        """Forget all computed rows, eg. to refresh the elapsed times"""
+        self._row_cache.clear()
+
+    def apply_changes(self, changes):
+        """Apply datastore changes to the rows without querying again
+
+        changes maps uids to 'created', 'updated' or 'deleted'. Returns
+        False if the model has to be rebuilt instead, because the query
+        filters entries or because a change could reorder the rows.
+        """
+        if set(self._query.keys()) - set(['mountpoints', 'order_by']) or \
+                self._query.get('mountpoints') != ['/']:
+            return False
+
+        # Make sure the result set has been read at least once
+        self._result_set.length
+
+        # the changed entries of the whole burst are read in one go
+        changed_uids = [uid for uid, change in changes.iteritems()
+                        if change != 'deleted']
+        try:
+            metadata_by_uid = dict(
+                (metadata['uid'], metadata)
+                for metadata in model.get_many(changed_uids))
+        except dbus.DBusException:
+            logging.exception('Could not read the changed entries')
+            return False
+
+        for uid, change in changes.iteritems():
+            if change == 'deleted':
+                if uid not in self._all_ids_set:
+                    continue
+                position = self._result_set.get_cached_position(uid)
+                if position is None:
+                    return False
+                self._remove_row(uid, position)
+                continue
+
+            metadata = metadata_by_uid.get(uid)
+            if metadata is None:
+                logging.debug('Changed entry %r is gone', uid)
+                return False
+
+            new_position = self._result_set.get_sorted_position(metadata)
+            if new_position is None:
+                return False
+
+            # the row may have been cached again from the old metadata
+            # since the change was signalled
+            self._row_cache.invalidate(uid)
+            if uid in self._all_ids_set:
+                position = self._result_set.get_cached_position(uid)
+                if position != new_position:
+                    return False
+                self._updated_entries.pop(uid, None)
+                self._result_set.update_entry(position, metadata)
+                path = Gtk.TreePath((position,))
+                self.row_changed(path, self.get_iter(path))
+            else:
+                self._result_set.insert_entry(new_position, metadata)
+                self._all_ids.append(uid)
+                self._all_ids_set.add(uid)
+                self._placeholder_rows = set(
+                    index + 1 if index >= new_position else index
+                    for index in self._placeholder_rows)
+                path = Gtk.TreePath((new_position,))
+                self.row_inserted(path, self.get_iter(path))
+
+        return True
+
+    def _remove_row(self, uid, position):
+        self._result_set.remove_entry(position)
+        self._all_ids.remove(uid)
+        self._all_ids_set.discard(uid)
+        if uid in self._selected:
+            self._selected.remove(uid)
+        self._updated_entries.pop(uid, None)
+        self._placeholder_rows = set(
+            index - 1 if index > position else index
+            for index in self._placeholder_rows if index != position)
+        self.row_deleted(Gtk.TreePath((position,)))
+
     def setup(self, updated_callback=None):
         self._result_set.setup()
         self._updated_callback = updated_callback
 
     def stop(self):
+        model.updated.disconnect(self.__model_changed_cb)
+        model.deleted.disconnect(self.__model_changed_cb)
+        model.batch_changed.disconnect(self.__model_batch_changed_cb)
+        misc.icon_resolved.disconnect(self.__icon_resolved_cb)
+        logging.debug('row cache hits: %r misses: %r',
+                      self._row_cache.hits, self._row_cache.misses)
         self._result_set.stop()
 
     def get_metadata(self, path):
@@ -137,11 +264,15 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
         index = iterator.user_data
         self._result_set.seek(index)
         metadata = self._result_set.read()
+        if metadata is None:
+            logging.warning('Entry %r is not read yet, not updating', index)
+            return
         if column == ListModel.COLUMN_FAVORITE:
             metadata['keep'] = value
         if column == ListModel.COLUMN_TITLE:
             metadata['title'] = value
         self._updated_entries[metadata['uid']] = metadata
+        self._row_cache.invalidate(metadata['uid'])
         if self._updated_callback is not None:
             model.updated.disconnect(self._updated_callback)
         model.write(metadata, update_mtime=False,
@@ -156,32 +287,41 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
             return None
 
         index = iterator.user_data
-        if index == self._last_requested_index:
-            return self._cached_row[column]
-
         if index >= self._result_set.length:
             return None
 
         self._result_set.seek(index)
         metadata = self._result_set.read()
+        if metadata is None:
+            # Still being read from the datastore, the row will be
+            # updated when the entries arrive
+            self._placeholder_rows.add(index)
+            return None
+
+        row = self._row_cache.get(metadata['uid'])
+        if row is None:
+            row = self._compute_row(metadata)
+            self._row_cache.set(metadata['uid'], row)
+        return row[column]
+
+    def _compute_row(self, metadata):
         metadata.update(self._updated_entries.get(metadata['uid'], {}))
 
-        self._last_requested_index = index
-        self._cached_row = []
-        self._cached_row.append(metadata['uid'])
-        self._cached_row.append(metadata.get('keep', '0') == '1')
-        self._cached_row.append(misc.get_icon_name(metadata))
+        row = []
+        row.append(metadata['uid'])
+        row.append(metadata.get('keep', '0') == '1')
+        row.append(misc.get_icon_name(metadata, blocking=False))
 
         if misc.is_activity_bundle(metadata):
             xo_color = XoColor('%s,%s' % (style.COLOR_BUTTON_GREY.get_svg(),
                                           style.COLOR_TRANSPARENT.get_svg()))
         else:
             xo_color = misc.get_icon_color(metadata)
-        self._cached_row.append(xo_color)
+        row.append(xo_color)
 
         title = GObject.markup_escape_text(metadata.get('title',
                                                         _('Untitled')))
-        self._cached_row.append('<b>%s</b>' % (title, ))
+        row.append('<b>%s</b>' % (title, ))
 
         try:
             timestamp = float(metadata.get('timestamp', 0))
@@ -189,27 +329,26 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
             timestamp_content = _('Unknown')
         else:
             timestamp_content = util.timestamp_to_elapsed_string(timestamp)
-        self._cached_row.append(timestamp_content)
+        row.append(timestamp_content)
 
         try:
             creation_time = float(metadata.get('creation_time'))
         except (TypeError, ValueError):
-            self._cached_row.append(_('Unknown'))
+            row.append(_('Unknown'))
         else:
-            self._cached_row.append(
-                util.timestamp_to_elapsed_string(float(creation_time)))
+            row.append(util.timestamp_to_elapsed_string(creation_time))
 
         try:
             size = int(metadata.get('filesize'))
         except (TypeError, ValueError):
             size = None
-        self._cached_row.append(util.format_size(size))
+        row.append(util.format_size(size))
 
         try:
             progress = int(float(metadata.get('progress', 100)))
         except (TypeError, ValueError):
             progress = 100
-        self._cached_row.append(progress)
+        row.append(progress)
 
         buddies = []
         if metadata.get('buddies'):
@@ -232,12 +371,12 @@ class ListModel(GObject.GObject, Gtk.TreeModel, Gtk.TreeDragSource):
                     logging.warning('Malformed buddies for %r: %s',
                                     metadata['uid'], exception)
                 else:
-                    self._cached_row.append([nick, XoColor(color)])
+                    row.append([nick, XoColor(color)])
                     continue
 
-            self._cached_row.append(None)
+            row.append(None)
 
-        return self._cached_row[column]
+        return row
 
     def do_iter_nth_child(self, parent_iter, n):
         return (False, None)
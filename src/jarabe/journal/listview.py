@@ -16,6 +16,7 @@
 import logging
 from gettext import gettext as _
 import time
+from collections import OrderedDict
 
 from gi.repository import GLib
 from gi.repository import GObject
@@ -39,6 +40,10 @@ from jarabe.journal import journalwindow
 
 
 UPDATE_INTERVAL = 300
+# Milliseconds to collect datastore changes before applying them
+CHANGES_DELAY = 500
+# Beyond this many changes at once the model is rebuilt instead
+MAX_INCREMENTAL_CHANGES = 20
 PROJECT_BUNDLE_ID = 'org.sugarlabs.Project'
 
 
@@ -205,10 +210,13 @@ class BaseListView(Gtk.Bin):
         self._refresh_idle_handler = None
         self._update_dates_timer = None
         self._backup_selected = None
+        self._pending_changes = OrderedDict()
+        self._changes_timeout = None
 
         model.created.connect(self.__model_created_cb)
         model.updated.connect(self.__model_updated_cb)
         model.deleted.connect(self.__model_deleted_cb)
+        model.batch_changed.connect(self.__model_batch_changed_cb)
 
     def enable_drag_and_copy(self):
         self.tree_view.drag_source_set(Gdk.ModifierType.BUTTON1_MASK,
@@ -223,15 +231,46 @@ class BaseListView(Gtk.Bin):
 
     def __model_created_cb(self, sender, signal, object_id):
         if self._is_new_item_visible(object_id):
-            self._set_dirty()
+            self._queue_change(object_id, 'created')
 
     def __model_updated_cb(self, sender, signal, object_id):
         if self._is_new_item_visible(object_id):
-            self._set_dirty()
+            self._queue_change(object_id, 'updated')
 
     def __model_deleted_cb(self, sender, signal, object_id):
         if self._is_new_item_visible(object_id):
+            self._queue_change(object_id, 'deleted')
+
+    def __model_batch_changed_cb(self, sender, signal, changes):
+        for object_id, change in changes.iteritems():
+            if self._is_new_item_visible(object_id):
+                self._queue_change(object_id, change)
+
+    def _queue_change(self, object_id, change):
+        # Bursts of changes, eg. from an activity autosaving, are applied
+        # together
+        if change == 'deleted' or object_id not in self._pending_changes:
+            self._pending_changes[object_id] = change
+        if self._changes_timeout is None:
+            self._changes_timeout = GLib.timeout_add(
+                CHANGES_DELAY, self.__changes_timeout_cb)
+
+    def __changes_timeout_cb(self):
+        self._changes_timeout = None
+        changes = self._pending_changes
+        self._pending_changes = OrderedDict()
+
+        if self._fully_obscured or self._updates_disabled or \
+                self._model is None or \
+                self.tree_view.get_model() is not self._model or \
+                len(changes) > MAX_INCREMENTAL_CHANGES or \
+                not self._model.apply_changes(changes):
             self._set_dirty()
+        elif len(self._model) == 0:
+            self.refresh()
+        else:
+            self._clear_message()
+        return False
 
     def _is_new_item_visible(self, object_id):
         """Check if the created item is part of the currently selected view"""
@@ -366,6 +405,9 @@ class BaseListView(Gtk.Bin):
             self.get_child().size_request()
 
     def __destroy_cb(self, widget):
+        if self._changes_timeout is not None:
+            GLib.source_remove(self._changes_timeout)
+            self._changes_timeout = None
         if self._model is not None:
             self._model.stop()
 
@@ -632,6 +674,7 @@ class BaseListView(Gtk.Bin):
 
         path, end_path = visible_range
         tree_model = self.tree_view.get_model()
+        tree_model.invalidate_rows()
 
         while True:
             cel_rect = self.tree_view.get_cell_area(path,
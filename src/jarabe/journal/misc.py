@@ -18,11 +18,15 @@ import logging
 import time
 import os
 import hashlib
+from collections import OrderedDict
 from gettext import gettext as _
+from threading import Thread
+from Queue import Queue
 
 from gi.repository import Gio
 from gi.repository import Gtk
 from gi.repository import Gdk
+from gi.repository import GLib
 
 from sugar3.activity import activityfactory
 from sugar3.activity.activityhandle import ActivityHandle
@@ -31,12 +35,12 @@ from sugar3.graphics.xocolor import XoColor
 from sugar3.graphics.xocolor import colors
 from sugar3.graphics.alert import ConfirmationAlert
 from sugar3 import mime
-from sugar3.bundle.bundle import ZipExtractException, RegistrationException
 from sugar3.bundle.activitybundle import ActivityBundle, get_bundle_instance
 from sugar3.bundle.bundle import AlreadyInstalledException
 from sugar3.bundle.contentbundle import ContentBundle
 from sugar3 import util
 from sugar3 import profile
+from sugar3 import dispatch
 
 from jarabe.view import launcher
 from jarabe.view import alerts
@@ -47,8 +51,30 @@ from jarabe.journal import journalwindow
 
 PROJECT_BUNDLE_ID = 'org.sugarlabs.Project'
 
+# Icon file names resolved so far, by mime type, by bundle id and by
+# (uid, timestamp) of activity bundle entries; the last one is bounded
+_MAX_OBJECT_ICONS = 256
+_mime_icons = {}
+_bundle_icons = {}
+_object_icons = OrderedDict()
+_pending_object_icons = set()
+_registry_connected = False
+
+# Activity bundle entries are read by a single worker thread
+_bundle_reader_queue = None
+
+# Sent with the uid of an entry once the icon of the activity bundle it
+# contains has been read, see get_icon_name()
+icon_resolved = dispatch.Signal()
+
 
 def _get_icon_for_mime(mime_type):
+    if mime_type not in _mime_icons:
+        _mime_icons[mime_type] = _lookup_icon_for_mime(mime_type)
+    return _mime_icons[mime_type]
+
+
+def _lookup_icon_for_mime(mime_type):
     generic_types = mime.get_all_generic_types()
     for generic_type in generic_types:
         if mime_type in generic_type.mime_types:
@@ -81,7 +107,96 @@ def get_mount_icon_name(mount, size):
     return 'drive'
 
 
-def get_icon_name(metadata):
+def _get_icon_for_bundle_id(bundle_id):
+    global _registry_connected
+
+    if not _registry_connected:
+        registry = bundleregistry.get_registry()
+        for signal in ['bundle-added', 'bundle-removed', 'bundle-changed']:
+            registry.connect(signal, _registry_changed_cb)
+        _registry_connected = True
+
+    if bundle_id not in _bundle_icons:
+        file_name = None
+        activity_info = bundleregistry.get_registry().get_bundle(bundle_id)
+        if activity_info:
+            file_name = activity_info.get_icon()
+        _bundle_icons[bundle_id] = file_name
+    return _bundle_icons[bundle_id]
+
+
+def _registry_changed_cb(registry, bundle):
+    _bundle_icons.pop(bundle.get_bundle_id(), None)
+    # activities can provide icons for the mime types they handle
+    _mime_icons.clear()
+
+
+def _read_bundle_icon(file_path):
+    if file_path is not None and os.path.exists(file_path):
+        try:
+            bundle = get_bundle_instance(file_path)
+            return bundle.get_icon()
+        except Exception:
+            logging.exception('Could not read bundle')
+    return None
+
+
+def _get_icon_for_bundle_object(metadata):
+    return _read_bundle_icon(model.get_file(metadata['uid']))
+
+
+def _set_object_icon(key, file_name):
+    _object_icons.pop(key, None)
+    _object_icons[key] = file_name
+    while len(_object_icons) > _MAX_OBJECT_ICONS:
+        _object_icons.popitem(last=False)
+
+
+def _bundle_reader():
+    while True:
+        key, file_path = _bundle_reader_queue.get()
+        file_name = _read_bundle_icon(file_path)
+        # file_path is released here, so a temporary copy is removed
+        del file_path
+        GLib.idle_add(_object_icon_resolved_cb, key, file_name)
+
+
+def _resolve_object_icon(key, metadata):
+    global _bundle_reader_queue
+
+    if _bundle_reader_queue is None:
+        _bundle_reader_queue = Queue()
+        thread = Thread(target=_bundle_reader)
+        thread.daemon = True
+        thread.start()
+
+    def __get_file_reply_cb(file_path):
+        _bundle_reader_queue.put((key, file_path))
+
+    def __get_file_error_cb(error):
+        logging.error('Could not get the file of %r: %s', key[0], error)
+        _object_icon_resolved_cb(key, None)
+
+    model.get_file_async(metadata['uid'], __get_file_reply_cb,
+                         __get_file_error_cb)
+
+
+def _object_icon_resolved_cb(key, file_name):
+    _pending_object_icons.discard(key)
+    _set_object_icon(key, file_name)
+    if file_name is not None:
+        icon_resolved.send(None, uid=key[0])
+    return False
+
+
+def get_icon_name(metadata, blocking=True):
+    """Return the file name of the icon of an entry
+
+    Results are cached. If blocking is False, the icon of an activity
+    bundle entry is read in a worker thread, after an asynchronous
+    request for its file: the icon of its mime type is returned
+    meanwhile, and icon_resolved is sent once the bundle icon is known.
+    """
     file_name = None
 
     bundle_id = metadata.get('activity', '')
@@ -96,18 +211,19 @@ def get_icon_name(metadata):
                 'scalable/mimetypes/project-box.svg'
             return file_name
 
-        activity_info = bundleregistry.get_registry().get_bundle(bundle_id)
-        if activity_info:
-            file_name = activity_info.get_icon()
+        file_name = _get_icon_for_bundle_id(bundle_id)
 
     if file_name is None and is_activity_bundle(metadata):
-        file_path = model.get_file(metadata['uid'])
-        if file_path is not None and os.path.exists(file_path):
-            try:
-                bundle = get_bundle_instance(file_path)
-                file_name = bundle.get_icon()
-            except Exception:
-                logging.exception('Could not read bundle')
+        key = (metadata['uid'], metadata.get('timestamp'))
+        if key in _object_icons:
+            file_name = _object_icons.pop(key)
+            _object_icons[key] = file_name
+        elif blocking:
+            file_name = _get_icon_for_bundle_object(metadata)
+            _set_object_icon(key, file_name)
+        elif key not in _pending_object_icons:
+            _pending_object_icons.add(key)
+            _resolve_object_icon(key, metadata)
 
     if file_name is None:
         file_name = _get_icon_for_mime(metadata.get('mime_type', ''))
@@ -210,6 +326,29 @@ def get_bundle_id_from_metadata(metadata):
 def resume(metadata, bundle_id=None, alert_window=None,
            force_bundle_downgrade=False):
 
+    def bundle_installed_cb(ds_bundle, downgrade_required):
+        if ds_bundle is not None and downgrade_required:
+            # A bundle is being resumed but we didn't install it as that
+            # would require a downgrade.
+            _downgrade_option_alert(ds_bundle, metadata)
+            return
+
+        # Are we launching a bundle?
+        if ds_bundle is not None and bundle_id is None:
+            registry = bundleregistry.get_registry()
+            activity_bundle = registry.get_bundle(ds_bundle.get_bundle_id())
+            if activity_bundle is not None:
+                launch(activity_bundle)
+            return
+
+        _resume_entry(metadata, bundle_id, alert_window)
+
+    handle_bundle_installation(
+        metadata, force_bundle_downgrade, bundle_installed_cb,
+        bundleregistry.INSTALL_PRIORITY_INTERACTIVE)
+
+
+def _resume_entry(metadata, bundle_id, alert_window):
     # These are set later, and used in the following functions.
     bundle = None
     activity_id = None
@@ -223,23 +362,7 @@ def resume(metadata, bundle_id=None, alert_window=None,
 
     registry = bundleregistry.get_registry()
 
-    ds_bundle, downgrade_required = \
-        handle_bundle_installation(metadata, force_bundle_downgrade)
-
-    if ds_bundle is not None and downgrade_required:
-        # A bundle is being resumed but we didn't install it as that would
-        # require a downgrade.
-        _downgrade_option_alert(ds_bundle, metadata)
-        return
-
-    # Are we launching a bundle?
-    if ds_bundle is not None and bundle_id is None:
-        activity_bundle = registry.get_bundle(ds_bundle.get_bundle_id())
-        if activity_bundle is not None:
-            launch(activity_bundle)
-        return
-
-    # Otherwise we are launching a regular journal entry
+    # We are launching a regular journal entry
     activity_id = metadata.get('activity_id', '')
 
     if bundle_id is None:
@@ -354,53 +477,82 @@ def can_resume(metadata):
     return get_activities(metadata) or is_bundle(metadata)
 
 
-def handle_bundle_installation(metadata, force_downgrade=False):
+def handle_bundle_installation(metadata, force_downgrade=False,
+                               callback=None,
+                               priority=bundleregistry.INSTALL_PRIORITY_BATCH):
     """
     Check metadata for a journal entry. If the metadata corresponds to a
-    bundle, make sure that it is installed, and return the corresponding
-    Bundle object.
+    bundle, make sure that it is installed.
 
     Installation sometimes requires a downgrade. Downgrades will not happen
     unless force_downgrade is set to True.
 
-    Returns a tuple of two items:
+    The installation runs in the background, with the given install
+    priority. Once it is done, callback is called with two parameters:
     1. The corresponding Bundle object for the journal entry, or None if
        installation failed.
     2. A flag that indicates whether bundle installation was aborted due to
        a downgrade being required, and force_downgrade was False
     """
+    def complete(bundle, downgrade_required):
+        if callback is not None:
+            callback(bundle, downgrade_required)
+
     if metadata.get('progress', '').isdigit():
         if int(metadata['progress']) < 100:
-            return None, False
+            complete(None, False)
+            return
 
     bundle = get_bundle(metadata)
     if bundle is None:
-        return None, False
+        complete(None, False)
+        return
 
     registry = bundleregistry.get_registry()
+    _set_busy_cursor(True)
 
-    window = journalwindow.get_journal_window().get_window()
-    window.set_cursor(Gdk.Cursor(Gdk.CursorType.WATCH))
-    Gdk.flush()
+    def install_cb(bundle, result, user_data):
+        _set_busy_cursor(False)
 
-    try:
-        installed = registry.install(bundle, force_downgrade)
-    except AlreadyInstalledException:
-        return bundle, True
-    except (ZipExtractException, RegistrationException):
-        logging.exception('Could not install bundle %s', bundle.get_path())
-        return None, False
-    finally:
-        window.set_cursor(None)
+        if isinstance(result, AlreadyInstalledException):
+            complete(bundle, True)
+            return
+        if isinstance(result, Exception):
+            logging.error('Could not install bundle %s: %r',
+                          bundle.get_path(), result)
+            complete(None, False)
+            return
+
+        # If we just installed a bundle, update the datastore accordingly.
+        # We do not do this for JournalEntryBundles because the JEB code
+        # transforms its own datastore entry and writes appropriate
+        # metadata.
+        if result is True and not isinstance(bundle, JournalEntryBundle):
+            metadata['bundle_id'] = bundle.get_bundle_id()
+            model.write(metadata)
 
-    # If we just installed a bundle, update the datastore accordingly.
-    # We do not do this for JournalEntryBundles because the JEB code transforms
-    # its own datastore entry and writes appropriate metadata.
-    if installed and not isinstance(bundle, JournalEntryBundle):
-        metadata['bundle_id'] = bundle.get_bundle_id()
-        model.write(metadata)
+        complete(bundle, False)
 
-    return bundle, False
+    registry.install_async(bundle, install_cb, None, force_downgrade,
+                           priority)
+
+
+_installs_in_progress = 0
+
+
+def _set_busy_cursor(busy):
+    # The journal shows a busy cursor while any installation is running
+    global _installs_in_progress
+    _installs_in_progress += 1 if busy else -1
+
+    window = journalwindow.get_journal_window().get_window()
+    if window is None:
+        return
+    if busy and _installs_in_progress == 1:
+        window.set_cursor(Gdk.Cursor(Gdk.CursorType.WATCH))
+        Gdk.flush()
+    elif not busy and _installs_in_progress == 0:
+        window.set_cursor(None)
 
 
 def get_icon_color(metadata):
@@ -18,11 +18,10 @@ import os
 import errno
 import subprocess
 from datetime import datetime
+from operator import itemgetter
 import time
 import tempfile
-from stat import S_IFLNK, S_IFMT, S_IFDIR, S_IFREG
 import re
-from operator import itemgetter
 import json
 from gettext import gettext as _
 
@@ -36,6 +35,8 @@ from sugar3 import dispatch
 from sugar3 import mime
 from sugar3 import util
 
+from jarabe.journal import scanner
+
 
 DS_DBUS_SERVICE = 'org.laptop.sugar.DataStore'
 DS_DBUS_INTERFACE = 'org.laptop.sugar.DataStore'
@@ -52,10 +53,19 @@ MAX_PAGES_TO_CACHE = 5
 
 JOURNAL_METADATA_DIR = '.Sugar-Metadata'
 
+# Number of uids asked to the datastore at once by get_many()
+_GET_MANY_CHUNK = 100
+
 _datastore = None
 created = dispatch.Signal()
 updated = dispatch.Signal()
 deleted = dispatch.Signal()
+# Sent by end_batch() with changes, a dict mapping the object ids that
+# changed during the batch to 'created', 'updated' or 'deleted'
+batch_changed = dispatch.Signal()
+
+_batch_changes = None
+_expected_signals = set()
 
 
 class _Cache(object):
@@ -76,28 +86,49 @@ class _Cache(object):
     def __len__(self):
         return len(self._array)
 
+    def insert(self, index, entry):
+        self._array.insert(index, entry)
+
     def __getitem__(self, key):
         return self._array[key]
 
+    def __setitem__(self, key, value):
+        self._array[key] = value
+
     def __delitem__(self, key):
         del self._array[key]
 
 
 class BaseResultSet(object):
     """Encapsulates the result of a query
+
+    In read-ahead mode read() never blocks: entries that are not cached
+    yet are requested with find_async() and read() returns None in the
+    meantime. The entries_ready signal is sent when they arrive. Pages
+    are also requested ahead of time in the direction the reader is
+    moving in.
     """
 
-    def __init__(self, query, page_size):
+    def __init__(self, query, page_size, read_ahead=False):
         self._total_count = -1
         self._position = -1
         self._query = query
         self._page_size = page_size
+        self._read_ahead = read_ahead
 
         self._offset = 0
         self._cache = _Cache()
 
+        # read-ahead state
+        self._last_position = 0
+        self._direction = 1
+        self._request_serial = 0
+        self._pending_request = None
+        self._wanted_position = None
+
         self.ready = dispatch.Signal()
         self.progress = dispatch.Signal()
+        self.entries_ready = dispatch.Signal()
 
     def setup(self):
         self.ready.send(self)
@@ -119,6 +150,14 @@ class BaseResultSet(object):
     def find(self, query):
         raise NotImplementedError()
 
+    def find_async(self, query, reply_handler, error_handler):
+        try:
+            entries, total_count = self.find(query)
+        except Exception as e:
+            error_handler(e)
+        else:
+            reply_handler(entries, total_count)
+
     def seek(self, position):
         self._position = position
 
@@ -126,6 +165,9 @@ class BaseResultSet(object):
         if self._position == -1:
             self.seek(0)
 
+        if self._read_ahead:
+            return self._read_cached()
+
         if self._position < self._offset:
             remaining_forward_entries = 0
         else:
@@ -201,12 +243,176 @@ class BaseResultSet(object):
 
         return self._cache[self._position - self._offset]
 
+    def _read_cached(self):
+        position = self._position
+        if position != self._last_position:
+            self._direction = cmp(position, self._last_position)
+            self._last_position = position
+
+        if not self._is_cached(position):
+            self._wanted_position = position
+            self._request_window(position)
+            if not self._is_cached(position):
+                return None
+
+        self._prefetch(position)
+        return self._cache[position - self._offset]
+
+    def _is_cached(self, position):
+        return self._offset <= position < self._offset + len(self._cache)
+
+    def _request_window(self, position):
+        if self._pending_request is not None:
+            # Only one request in flight, the reply handler will ask
+            # again for the wanted position if it is still missing
+            return
+
+        # Leave most of the window in the direction we are moving in
+        limit = self._page_size * MIN_PAGES_TO_CACHE
+        if self._direction >= 0:
+            offset = max(0, position - self._page_size)
+        else:
+            offset = max(0, position - limit + self._page_size + 1)
+        logging.debug('requesting cache window, offset: %r limit: %r',
+                      offset, limit)
+        self._request('window', offset, limit)
+
+    def _prefetch(self, position):
+        if self._pending_request is not None:
+            return
+
+        last_cached_entry = self._offset + len(self._cache)
+        if self._direction >= 0:
+            if last_cached_entry - position <= self._page_size and \
+                    last_cached_entry < self._total_count:
+                logging.debug('prefetching one more page, offset: %r',
+                              last_cached_entry)
+                self._request('append', last_cached_entry, self._page_size)
+        elif position - self._offset < self._page_size and self._offset > 0:
+            limit = min(self._offset, self._page_size)
+            logging.debug('prefetching one previous page, offset: %r',
+                          self._offset - limit)
+            self._request('prepend', self._offset - limit, limit)
+
+    def _request(self, kind, offset, limit):
+        self._request_serial += 1
+        serial = self._request_serial
+        self._pending_request = serial
+
+        def reply_handler(entries, total_count):
+            self._request_reply_cb(serial, kind, offset, entries,
+                                   total_count)
+
+        def error_handler(error):
+            logging.error('Could not read journal entries: %s', error)
+            if self._pending_request == serial:
+                self._pending_request = None
+
+        query = self._query.copy()
+        query['limit'] = limit
+        query['offset'] = offset
+        self.find_async(query, reply_handler, error_handler)
+
+    def _request_reply_cb(self, serial, kind, offset, entries, total_count):
+        if serial != self._pending_request:
+            return
+        self._pending_request = None
+        self._total_count = total_count
+
+        cache_limit = self._page_size * MAX_PAGES_TO_CACHE
+        if kind == 'window':
+            del self._cache[:]
+            self._cache.append_all(entries)
+            self._offset = offset
+        elif kind == 'append':
+            if offset != self._offset + len(self._cache):
+                return
+            self._cache.append_all(entries)
+            objects_excess = len(self._cache) - cache_limit
+            if objects_excess > 0:
+                self._offset += objects_excess
+                del self._cache[:objects_excess]
+        elif kind == 'prepend':
+            if offset + len(entries) != self._offset:
+                return
+            self._cache.prepend_all(entries)
+            self._offset = offset
+            objects_excess = len(self._cache) - cache_limit
+            if objects_excess > 0:
+                del self._cache[-objects_excess:]
+
+        if self._wanted_position is not None and \
+                not self._is_cached(self._wanted_position) and \
+                self._wanted_position < self._total_count:
+            self._request_window(self._wanted_position)
+        else:
+            self._wanted_position = None
+
+        self.entries_ready.send(self)
+
+    def get_cached_position(self, uid):
+        """Return the position of an entry if it is cached, or None"""
+        for index in xrange(len(self._cache)):
+            if self._cache[index]['uid'] == uid:
+                return self._offset + index
+        return None
+
+    def get_sorted_position(self, metadata):
+        """Return where an entry goes in the sort order of the query
+
+        Returns None when that cannot be told from the cached entries
+        alone. The entry itself, if cached, is not taken into account.
+        """
+        sort = self._query.get('order_by', ['+timestamp'])[0]
+        property_ = sort[1:]
+
+        def sort_key(entry):
+            try:
+                value = float(entry.get(property_, 0))
+            except (TypeError, ValueError):
+                value = 0
+            # '+' means most recent or biggest first
+            if sort[0] == '+':
+                return -value
+            return value
+
+        key = sort_key(metadata)
+        others = [entry for entry in self._cache
+                  if entry['uid'] != metadata['uid']]
+        index = 0
+        while index < len(others) and sort_key(others[index]) <= key:
+            index += 1
+
+        if index == 0 and self._offset > 0:
+            return None
+        if index == len(others) and \
+                self._offset + len(self._cache) < self._total_count:
+            return None
+        return self._offset + index
+
+    def update_entry(self, position, metadata):
+        self._cache[position - self._offset] = metadata
+
+    def insert_entry(self, position, metadata):
+        self._cancel_request()
+        self._cache.insert(position - self._offset, metadata)
+        self._total_count += 1
+
+    def remove_entry(self, position):
+        self._cancel_request()
+        del self._cache[position - self._offset]
+        self._total_count -= 1
+
+    def _cancel_request(self):
+        # A reply computed before a change would use stale offsets
+        self._pending_request = None
+
 
 class DatastoreResultSet(BaseResultSet):
     """Encapsulates the result of a query on the datastore
     """
 
-    def __init__(self, query, page_size):
+    def __init__(self, query, page_size, read_ahead=False):
 
         if query.get('query', '') and not query['query'].startswith('"'):
             query_text = ''
@@ -219,7 +425,7 @@ class DatastoreResultSet(BaseResultSet):
 
             query['query'] = query_text
 
-        BaseResultSet.__init__(self, query, page_size)
+        BaseResultSet.__init__(self, query, page_size, read_ahead)
 
     def find(self, query):
         entries, total_count = _get_datastore().find(query, PROPERTIES,
@@ -230,6 +436,16 @@ class DatastoreResultSet(BaseResultSet):
 
         return entries, total_count
 
+    def find_async(self, query, reply_handler, error_handler):
+        def _reply_handler(entries, total_count):
+            for entry in entries:
+                entry['mountpoint'] = '/'
+            reply_handler(entries, total_count)
+
+        _get_datastore().find(query, PROPERTIES, byte_arrays=True,
+                              reply_handler=_reply_handler,
+                              error_handler=error_handler)
+
     def find_ids(self, query):
         copy = query.copy()
         copy.pop('mountpoints', '/')
@@ -240,13 +456,11 @@ class InplaceResultSet(BaseResultSet):
     """Encapsulates the result of a query on a mount point
     """
 
-    def __init__(self, query, page_size, mount_point):
-        BaseResultSet.__init__(self, query, page_size)
+    def __init__(self, query, page_size, mount_point, read_ahead=False):
+        BaseResultSet.__init__(self, query, page_size, read_ahead)
         self._mount_point = mount_point
         self._file_list = None
-        self._pending_directories = []
-        self._visited_directories = []
-        self._pending_files = []
+        self._scanner = None
         self._stopped = False
 
         query_text = query.get('query', '')
@@ -277,23 +491,42 @@ class InplaceResultSet(BaseResultSet):
 
     def setup(self):
         self._file_list = []
-        self._pending_directories = [self._mount_point]
-        self._visited_directories = []
-        self._pending_files = []
-        GLib.idle_add(self._scan)
+        filters = {'regex': self._regex,
+                   'only_favorites': self._only_favorites,
+                   'activity': self._filter_by_activity,
+                   'date_start': self._date_start,
+                   'date_end': self._date_end,
+                   'mime_types': self._mime_types,
+                   'order_by': self._sort}
+        self._scanner = scanner.MountScanner(self._mount_point,
+                                             JOURNAL_METADATA_DIR, filters)
+        self._scanner.start(self.__scanner_progress_cb,
+                            self.__scanner_files_cb,
+                            self.setup_ready)
 
     def stop(self):
         self._stopped = True
+        if self._scanner is not None:
+            self._scanner.stop()
+
+    def __scanner_progress_cb(self):
+        self.progress.send(self)
+
+    def __scanner_files_cb(self, indexed_files):
+        for indexed_file in indexed_files:
+            self._file_list.append((indexed_file.path, indexed_file,
+                                    int(indexed_file.st_mtime),
+                                    indexed_file.st_size, None))
+        self.progress.send(self)
 
     def setup_ready(self):
+        # The scanner hands the files over in the order of its walk, sort
+        # them the way the mount index does; ties keep that order
         if self._sort[1:] == 'filesize':
-            keygetter = itemgetter(3)
+            sort_key = itemgetter(3)
         else:
-            # timestamp
-            keygetter = itemgetter(2)
-        self._file_list.sort(lambda a, b: cmp(b, a),
-                             key=keygetter,
-                             reverse=(self._sort[0] == '-'))
+            sort_key = itemgetter(2)
+        self._file_list.sort(key=sort_key, reverse=self._sort[0] != '-')
         self.ready.send(self)
 
     def find(self, query):
@@ -334,136 +567,6 @@ class InplaceResultSet(BaseResultSet):
             ids.append(file_path)
         return ids
 
-    def _scan(self):
-        if self._stopped:
-            return False
-
-        self.progress.send(self)
-
-        if self._pending_files:
-            self._scan_a_file()
-            return True
-
-        if self._pending_directories:
-            self._scan_a_directory()
-            return True
-
-        self.setup_ready()
-        self._visited_directories = []
-        return False
-
-    def _scan_a_file(self):
-        full_path = self._pending_files.pop(0)
-        metadata = None
-
-        try:
-            stat = os.lstat(full_path)
-        except OSError as e:
-            if e.errno != errno.ENOENT:
-                logging.exception(
-                    'Error reading metadata of file %r', full_path)
-            return
-
-        if S_IFMT(stat.st_mode) == S_IFLNK:
-            try:
-                link = os.readlink(full_path)
-            except OSError as e:
-                logging.exception(
-                    'Error reading target of link %r', full_path)
-                return
-
-            if not os.path.abspath(link).startswith(self._mount_point):
-                return
-
-            try:
-                stat = os.stat(full_path)
-
-            except OSError as e:
-                if e.errno != errno.ENOENT:
-                    logging.exception(
-                        'Error reading metadata of linked file %r', full_path)
-                return
-
-        if S_IFMT(stat.st_mode) == S_IFDIR:
-            id_tuple = stat.st_ino, stat.st_dev
-            if id_tuple not in self._visited_directories:
-                self._visited_directories.append(id_tuple)
-                self._pending_directories.append(full_path)
-            return
-
-        if S_IFMT(stat.st_mode) != S_IFREG:
-            return
-
-        if self._regex is not None and \
-                not self._regex.match(full_path):
-            metadata = _get_file_metadata(full_path, stat,
-                                          fetch_preview=False)
-            if not metadata:
-                return
-            add_to_list = False
-            for f in ['fulltext', 'title',
-                      'description', 'tags']:
-                if f in metadata and \
-                        self._regex.match(metadata[f]):
-                    add_to_list = True
-                    break
-            if not add_to_list:
-                return
-
-        if self._only_favorites:
-            if not metadata:
-                metadata = _get_file_metadata(full_path, stat,
-                                              fetch_preview=False)
-            if 'keep' not in metadata:
-                return
-            try:
-                if int(metadata['keep']) == 0:
-                    return
-            except ValueError:
-                return
-
-        if self._filter_by_activity:
-            if not metadata:
-                metadata = _get_file_metadata(full_path, stat,
-                                              fetch_preview=False)
-            if 'activity' not in metadata or \
-                    metadata['activity'] != self._filter_by_activity:
-                return
-
-        if self._date_start is not None and stat.st_mtime < self._date_start:
-            return
-
-        if self._date_end is not None and stat.st_mtime > self._date_end:
-            return
-
-        if self._mime_types:
-            mime_type, uncertain_result_ = \
-                Gio.content_type_guess(filename=full_path, data=None)
-            if mime_type not in self._mime_types:
-                return
-
-        file_info = (full_path, stat, int(stat.st_mtime), stat.st_size,
-                     metadata)
-        self._file_list.append(file_info)
-
-        return
-
-    def _scan_a_directory(self):
-        dir_path = self._pending_directories.pop(0)
-
-        try:
-            entries = os.listdir(dir_path)
-        except OSError as e:
-            if e.errno != errno.EACCES:
-                logging.exception('Error reading directory %r', dir_path)
-            return
-
-        for entry in entries:
-            if entry.startswith('.'):
-                continue
-            self._pending_files.append(dir_path + '/' + entry)
-        return
-
 
 def _get_file_metadata(path, stat, fetch_preview=True):
     """Return the metadata from the corresponding file.
@@ -557,19 +660,65 @@ def _get_datastore():
 
 
 def _datastore_created_cb(object_id):
-    created.send(None, object_id=object_id)
+    _send_change('created', object_id, from_datastore=True)
 
 
 def _datastore_updated_cb(object_id):
-    updated.send(None, object_id=object_id)
+    _send_change('updated', object_id, from_datastore=True)
 
 
 def _datastore_deleted_cb(object_id):
-    deleted.send(None, object_id=object_id)
+    _send_change('deleted', object_id, from_datastore=True)
+
+
+def _send_change(change, object_id, from_datastore=False):
+    if from_datastore and (change, object_id) in _expected_signals:
+        # Already reported by the batch that caused it
+        _expected_signals.discard((change, object_id))
+        return
+
+    if _batch_changes is not None:
+        _record_batch_change(change, object_id, expect_signal=False)
+        return
+
+    signal = {'created': created, 'updated': updated, 'deleted': deleted}
+    signal[change].send(None, object_id=object_id)
+
+
+def _record_batch_change(change, object_id, expect_signal):
+    if expect_signal and object_id not in _batch_changes:
+        # The datastore signal has not arrived yet and may only arrive
+        # once the batch is over
+        _expected_signals.add((change, object_id))
+    if change == 'deleted' or object_id not in _batch_changes:
+        _batch_changes[object_id] = change
+
 
+def begin_batch():
+    """Start collecting the change notifications of a batch operation
 
-def find(query_, page_size):
+    Until end_batch() is called, created, updated and deleted are not
+    sent; a single batch_changed is sent at the end instead.
+    """
+    global _batch_changes
+    if _batch_changes is None:
+        _batch_changes = {}
+
+
+def end_batch():
+    global _batch_changes
+    if _batch_changes is None:
+        return
+    changes = _batch_changes
+    _batch_changes = None
+    if changes:
+        batch_changed.send(None, changes=changes)
+
+
+def find(query_, page_size, read_ahead=False):
     """Returns a ResultSet
+
+    With read_ahead the ResultSet never blocks on reads, see BaseResultSet.
     """
     query = query_.copy()
 
@@ -578,9 +727,10 @@ def find(query_, page_size):
         raise ValueError('Exactly one mount point must be specified')
 
     if mount_points[0] == '/':
-        return DatastoreResultSet(query, page_size)
+        return DatastoreResultSet(query, page_size, read_ahead)
     else:
-        return InplaceResultSet(query, page_size, mount_points[0])
+        return InplaceResultSet(query, page_size, mount_points[0],
+                                read_ahead)
 
 
 def _get_mount_point(path):
@@ -609,6 +759,33 @@ def get(object_id):
     return metadata
 
 
+def get_many(object_ids):
+    """Returns the metadata for several objects, in the same order
+
+    Entries of the datastore are read with one query per
+    _GET_MANY_CHUNK uids instead of one call each. Objects that do not
+    exist are left out.
+    """
+    metadata_by_id = {}
+    uids = []
+    for object_id in object_ids:
+        if os.path.exists(object_id):
+            metadata_by_id[object_id] = get(object_id)
+        else:
+            uids.append(object_id)
+
+    for start in xrange(0, len(uids), _GET_MANY_CHUNK):
+        query = {'uid': uids[start:start + _GET_MANY_CHUNK]}
+        entries, total_count_ = _get_datastore().find(query, [],
+                                                      byte_arrays=True)
+        for entry in entries:
+            entry['mountpoint'] = '/'
+            metadata_by_id[entry['uid']] = entry
+
+    return [metadata_by_id[object_id] for object_id in object_ids
+            if object_id in metadata_by_id]
+
+
 def get_file(object_id):
     """Returns the file for an object
     """
@@ -624,6 +801,24 @@ def get_file(object_id):
             return None
 
 
+def get_file_async(object_id, reply_handler, error_handler):
+    """Like get_file(), without blocking on the datastore
+    """
+    if os.path.exists(object_id):
+        reply_handler(object_id)
+        return
+
+    def __get_filename_reply_cb(file_path):
+        if file_path:
+            reply_handler(util.TempFilePath(file_path))
+        else:
+            reply_handler(None)
+
+    _get_datastore().get_filename(object_id,
+                                  reply_handler=__get_filename_reply_cb,
+                                  error_handler=error_handler)
+
+
 def get_file_size(object_id):
     """Return the file size for an object
     """
@@ -652,6 +847,8 @@ def delete(object_id):
     """
     if not os.path.exists(object_id):
         _get_datastore().delete(object_id)
+        if _batch_changes is not None:
+            _record_batch_change('deleted', object_id, expect_signal=True)
     else:
         os.unlink(object_id)
         dir_path = os.path.dirname(object_id)
@@ -680,13 +877,20 @@ def delete(object_id):
         except:
             # if can't remove is because there are other metadata
             pass
-        deleted.send(None, object_id=object_id)
+        _send_change('deleted', object_id)
 
 
-def copy(metadata, mount_point, ready_callback=None):
+def copy(metadata, mount_point, ready_callback=None, error_callback=None,
+         fetch_metadata=True):
     """Copies an object to another mount point
+
+    Pass fetch_metadata=False if metadata is already complete, eg. read
+    with get_many().
     """
-    metadata = get(metadata['uid'])
+    if fetch_metadata:
+        metadata = get(metadata['uid'])
+    else:
+        metadata = metadata.copy()
     if mount_point == '/' and metadata.get('icon-color') == '#000000,#ffffff':
         settings = Gio.Settings('org.sugarlabs.user')
         metadata['icon-color'] = settings.get_string('color')
@@ -698,23 +902,30 @@ def copy(metadata, mount_point, ready_callback=None):
     del metadata['uid']
 
     write(metadata, file_path, transfer_ownership=False,
-          ready_callback=ready_callback)
+          ready_callback=ready_callback, error_callback=error_callback)
 
 
 def write(metadata, file_path='', update_mtime=True, transfer_ownership=True,
-          ready_callback=None):
+          ready_callback=None, error_callback=None):
     """Creates or updates an entry for that id
     """
     def created_reply_handler(object_id):
+        if _batch_changes is not None:
+            _record_batch_change('created', object_id, expect_signal=True)
         if ready_callback:
             ready_callback(metadata, file_path, object_id)
 
     def updated_reply_handler():
+        if _batch_changes is not None:
+            _record_batch_change('updated', metadata['uid'],
+                                 expect_signal=True)
         if ready_callback:
             ready_callback(metadata, file_path, metadata['uid'])
 
     def error_handler(error):
         logging.error('Could not create/update datastore entry')
+        if error_callback:
+            error_callback(metadata, error)
 
     logging.debug('model.write %r %r %r', metadata.get('uid', ''), file_path,
                   update_mtime)
@@ -779,11 +990,11 @@ def _write_entry_on_external_device(metadata, file_path, ready_callback=None):
             ready_callback(metadata, file_path, destination_path)
 
     def _updated_cb(*args):
-        updated.send(None, object_id=destination_path)
+        _send_change('updated', destination_path)
         _ready_cb()
 
     def _splice_cb(*args):
-        created.send(None, object_id=destination_path)
+        _send_change('created', destination_path)
         _ready_cb()
 
     if 'uid' in metadata and os.path.exists(metadata['uid']):
@@ -0,0 +1,331 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Persistent index of the files found on a mount point.
+
+The index remembers, for every directory of a removable device or of
+the Documents folder, the directory mtime and the mtime of its
+.Sugar-Metadata counterpart at the time it was scanned, together with
+the files and subdirectories found there. A directory whose mtimes
+have not changed since does not need to be listed again, and queries
+and sorts are answered by the index instead of by the scanner.
+
+Changes to the content of a file that leave its directory untouched
+are not noticed until the directory changes.
+"""
+
+import os
+import errno
+import logging
+import hashlib
+import sqlite3
+from collections import namedtuple
+
+from sugar3 import env
+
+
+_INDEX_FILE_NAME = 'index.db'
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE directories (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    metadata_mtime REAL
+);
+CREATE TABLE subdirectories (
+    directory TEXT,
+    path TEXT
+);
+CREATE INDEX subdirectories_directory ON subdirectories (directory);
+CREATE TABLE entries (
+    path TEXT PRIMARY KEY,
+    directory TEXT,
+    mtime REAL,
+    size INTEGER,
+    mime_type TEXT,
+    title TEXT,
+    description TEXT,
+    tags TEXT,
+    fulltext TEXT,
+    activity TEXT,
+    keep INTEGER,
+    has_metadata INTEGER
+);
+CREATE INDEX entries_directory ON entries (directory);
+"""
+
+# Columns of the entries table, in the order used by IndexRecord
+_ENTRY_COLUMNS = ['path', 'mtime', 'size', 'mime_type', 'title',
+                  'description', 'tags', 'fulltext', 'activity', 'keep',
+                  'has_metadata']
+
+# Fields a text search is matched against
+_SEARCH_COLUMNS = ['path', 'fulltext', 'title', 'description', 'tags']
+
+IndexRecord = namedtuple('IndexRecord', _ENTRY_COLUMNS)
+
+# Looks enough like an os.stat result for the metadata helpers in model
+IndexedFile = namedtuple('IndexedFile', ['path', 'st_mtime', 'st_size',
+                                         'mime_type', 'has_metadata'])
+
+
+class MountIndex(object):
+    """Encapsulates the on-disk index of one mount point
+
+    The index lives in the .Sugar-Metadata directory of the mount point
+    when there is a writable one, and in the profile otherwise. It is a
+    cache: if it cannot be read it is thrown away and rebuilt. Corruption
+    found after opening it is reported as sqlite3.DatabaseError, and the
+    caller is expected to discard() it.
+
+    A MountIndex must only be used from the thread that created its
+    connection, that is, the first thread that queried it.
+    """
+
+    def __init__(self, mount_point, metadata_dir_name):
+        self._mount_point = mount_point
+        self._metadata_dir_name = metadata_dir_name
+        self._connection = None
+        self._in_memory = False
+
+    def get_metadata_dir(self, dir_path):
+        """Return the .Sugar-Metadata directory matching dir_path"""
+        metadata_dir = os.path.join(self._mount_point,
+                                    self._metadata_dir_name)
+        if dir_path != self._mount_point:
+            subdir = os.path.relpath(dir_path, self._mount_point)
+            metadata_dir = os.path.join(metadata_dir, subdir)
+        return metadata_dir
+
+    def _get_index_path(self):
+        metadata_dir = self.get_metadata_dir(self._mount_point)
+        if os.path.isdir(metadata_dir) and os.access(metadata_dir, os.W_OK):
+            return os.path.join(metadata_dir, _INDEX_FILE_NAME)
+
+        index_dir = env.get_profile_path('journal-index')
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        mount_point = self._mount_point
+        if isinstance(mount_point, unicode):
+            mount_point = mount_point.encode('utf-8')
+        return os.path.join(index_dir,
+                            hashlib.sha1(mount_point).hexdigest() + '.db')
+
+    def _get_connection(self):
+        if self._connection is not None:
+            return self._connection
+
+        if self._in_memory:
+            self._connection = self._open(':memory:')
+            return self._connection
+
+        try:
+            path = self._get_index_path()
+        except EnvironmentError:
+            logging.exception('Could not find a place for the index of %r',
+                              self._mount_point)
+            path = ':memory:'
+
+        try:
+            self._connection = self._open(path)
+        except sqlite3.DatabaseError:
+            logging.warning('Discarding unreadable journal index %r', path)
+            try:
+                os.unlink(path)
+                self._connection = self._open(path)
+            except (EnvironmentError, sqlite3.DatabaseError):
+                logging.exception('Could not create journal index %r', path)
+                self._connection = self._open(':memory:')
+
+        return self._connection
+
+    def _open(self, path):
+        connection = sqlite3.connect(path)
+        # File names are byte strings and need not be valid UTF-8
+        connection.text_factory = str
+        # The index is a cache, losing it on a crash is fine. Keeping the
+        # rollback journal in memory also avoids creating files next to
+        # the index, which would change the mtime of .Sugar-Metadata.
+        connection.execute('PRAGMA journal_mode = MEMORY')
+        connection.execute('PRAGMA synchronous = OFF')
+
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != _SCHEMA_VERSION:
+            for table in ['directories', 'subdirectories', 'entries']:
+                connection.execute('DROP TABLE IF EXISTS %s' % table)
+            connection.executescript(_SCHEMA)
+            connection.execute('PRAGMA user_version = %d' % _SCHEMA_VERSION)
+            connection.commit()
+
+        return connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def discard(self):
+        """Throw the index away, eg. because it turned out to be corrupt
+
+        An empty index is created the next time it is queried; it is kept
+        in memory if the index file cannot be removed.
+        """
+        try:
+            self.close()
+        except sqlite3.Error:
+            logging.exception('Error closing the journal index of %r',
+                              self._mount_point)
+            self._connection = None
+
+        try:
+            os.unlink(self._get_index_path())
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                logging.exception('Could not remove the journal index of %r',
+                                  self._mount_point)
+                self._in_memory = True
+
+    def get_subdirectories(self, dir_path, mtime, metadata_mtime):
+        """Return the subdirectories of dir_path if the index is current
+
+        Returns None when the directory is not in the index or has changed
+        since it was indexed, in which case it needs to be scanned again.
+        """
+        connection = self._get_connection()
+        row = connection.execute(
+            'SELECT mtime, metadata_mtime FROM directories WHERE path = ?',
+            (dir_path, )).fetchone()
+        if row is None or row[0] != mtime or row[1] != metadata_mtime:
+            return None
+
+        cursor = connection.execute(
+            'SELECT path FROM subdirectories WHERE directory = ?',
+            (dir_path, ))
+        return [path for (path, ) in cursor]
+
+    def update_directory(self, dir_path, mtime, metadata_mtime, records,
+                         subdirectories):
+        """Replace what the index knows about the contents of dir_path
+
+        records is a list of IndexRecord, one for every regular file
+        found in the directory.
+        """
+        connection = self._get_connection()
+
+        cursor = connection.execute(
+            'SELECT path FROM subdirectories WHERE directory = ?',
+            (dir_path, ))
+        removed = set(path for (path, ) in cursor) - set(subdirectories)
+        for path in removed:
+            self._purge_tree(path)
+
+        connection.execute('DELETE FROM entries WHERE directory = ?',
+                           (dir_path, ))
+        connection.execute('DELETE FROM subdirectories WHERE directory = ?',
+                           (dir_path, ))
+        connection.executemany(
+            'INSERT OR REPLACE INTO entries (directory, %s) '
+            'VALUES (?, %s)' % (', '.join(_ENTRY_COLUMNS),
+                                ', '.join(['?'] * len(_ENTRY_COLUMNS))),
+            [(dir_path, ) + tuple(record) for record in records])
+        connection.executemany(
+            'INSERT INTO subdirectories (directory, path) VALUES (?, ?)',
+            [(dir_path, path) for path in subdirectories])
+        connection.execute(
+            'INSERT OR REPLACE INTO directories (path, mtime, metadata_mtime) '
+            'VALUES (?, ?, ?)', (dir_path, mtime, metadata_mtime))
+        connection.commit()
+
+    def _purge_tree(self, path):
+        connection = self._get_connection()
+        prefix = path + '/'
+        for table, column in [('directories', 'path'),
+                              ('subdirectories', 'directory'),
+                              ('entries', 'directory')]:
+            connection.execute(
+                'DELETE FROM %s WHERE %s = ? OR substr(%s, 1, ?) = ?' %
+                (table, column, column), (path, len(prefix), prefix))
+
+    def find(self, directories, regex=None, only_favorites=False,
+             activity=None, date_start=None, date_end=None, mime_types=None,
+             order_by='+timestamp'):
+        """Return the files in directories that match the given filters
+
+        The result is a list of IndexedFile sorted the same way the
+        Journal sorts the entries of a mount point.
+        """
+        connection = self._get_connection()
+
+        connection.execute('CREATE TEMP TABLE IF NOT EXISTS visited '
+                           '(path TEXT PRIMARY KEY)')
+        connection.execute('DELETE FROM visited')
+        connection.executemany('INSERT OR IGNORE INTO visited VALUES (?)',
+                               [(path, ) for path in directories])
+
+        conditions = []
+        parameters = []
+
+        if regex is not None:
+            def _matches(value):
+                if value is None:
+                    return False
+                if isinstance(value, str):
+                    value = value.decode('utf-8', 'replace')
+                return regex.match(value) is not None
+            connection.create_function('journal_matches', 1, _matches)
+            conditions.append('(%s)' % ' OR '.join(
+                ['journal_matches(entries.%s)' % column
+                 for column in _SEARCH_COLUMNS]))
+
+        if only_favorites:
+            conditions.append('keep != 0')
+
+        if activity:
+            conditions.append('activity = ?')
+            parameters.append(activity)
+
+        if date_start is not None:
+            conditions.append('mtime >= ?')
+            parameters.append(date_start)
+
+        if date_end is not None:
+            conditions.append('mtime <= ?')
+            parameters.append(date_end)
+
+        if mime_types:
+            conditions.append('mime_type IN (%s)' %
+                              ', '.join(['?'] * len(mime_types)))
+            parameters.extend(mime_types)
+
+        if order_by[1:] == 'filesize':
+            sort_key = 'size'
+        else:
+            sort_key = 'CAST(mtime AS INTEGER)'
+        # '+' means most recent or biggest first
+        if order_by[0] == '-':
+            direction = 'ASC'
+        else:
+            direction = 'DESC'
+
+        statement = 'SELECT entries.path, mtime, size, mime_type, ' \
+            'has_metadata FROM entries ' \
+            'JOIN visited ON entries.directory = visited.path'
+        if conditions:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        statement += ' ORDER BY %s %s, entries.rowid' % (sort_key, direction)
+
+        cursor = connection.execute(statement, parameters)
+        return [IndexedFile(*row) for row in cursor]
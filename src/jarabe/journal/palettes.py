@@ -18,6 +18,7 @@ from gettext import gettext as _
 from gettext import ngettext
 import logging
 import os
+import time
 
 from gi.repository import GObject
 from gi.repository import Gtk
@@ -33,6 +34,7 @@ from sugar3.graphics.xocolor import XoColor
 from sugar3.graphics.alert import Alert
 from sugar3 import mime
 from sugar3 import profile
+from sugar3.util import format_size
 
 from jarabe.model import friends
 from jarabe.model import filetransfer
@@ -45,6 +47,13 @@ from jarabe.journal.misc import get_mount_color
 
 PROJECT_BUNDLE_ID = 'org.sugarlabs.Project'
 
+# Number of entries BatchOperator reads from the datastore at once
+_BATCH_READ_CHUNK = 100
+# Seconds BatchOperator keeps the main loop busy at a time
+_BATCH_TIME_SLICE = 0.1
+# Number of entries copied to a volume at the same time
+COPY_WORKERS = 4
+
 
 class ObjectPalette(Palette):
 
@@ -405,23 +414,33 @@ class VolumeMenu(MenuItem):
             BatchOperator(
                 self._journalactivity, uid_list, _('Copy'),
                 self._get_confirmation_alert_message(len(uid_list)),
-                self._perform_copy)
+                self._perform_copy, workers=COPY_WORKERS)
 
     def _get_confirmation_alert_message(self, entries_len):
         return ngettext('Do you want to copy %d entry?',
                         'Do you want to copy %d entries?',
                         entries_len) % (entries_len)
 
-    def _perform_copy(self, metadata):
+    def _perform_copy(self, metadata, done_cb):
         file_path = model.get_file(metadata['uid'])
         if not file_path or not os.path.exists(file_path):
             logging.warn('Entries without a file cannot be copied.')
+            done_cb(metadata)
             return
+
+        def ready_cb(metadata_, file_path_, object_id_):
+            done_cb(metadata)
+
+        def error_cb(metadata_, error_):
+            done_cb(metadata)
+
         try:
-            model.copy(metadata, self._mount_point)
+            model.copy(metadata, self._mount_point, ready_callback=ready_cb,
+                       error_callback=error_cb, fetch_metadata=False)
         except IOError as e:
             logging.exception('Error while copying the entry. %s',
                               e.strerror)
+            done_cb(metadata)
 
 
 class ClipboardMenu(MenuItem):
@@ -577,12 +596,18 @@ class BatchOperator(GObject.GObject):
                              Batch-Copy-To-Mounted-Drive-button;
                              Batch-Copy-To-Clipboard-button;
                              Batch-Erase-Button;
+
+    The metadata of all the entries is read in bulk first. Then
+    operation_cb(metadata, done_cb) is called for every entry, with up to
+    workers operations in progress at once; each of them must call
+    done_cb(metadata) when it is over. The change notifications of the
+    whole batch are sent once at the end, see model.begin_batch().
     """
 
     def __init__(self, journalactivity,
                  uid_list,
                  alert_title, alert_message,
-                 operation_cb):
+                 operation_cb, workers=1):
         GObject.GObject.__init__(self)
 
         self._journalactivity = journalactivity
@@ -591,6 +616,19 @@ class BatchOperator(GObject.GObject):
         self._alert_title = alert_title
         self._alert_message = alert_message
         self._operation_cb = operation_cb
+        self._workers = workers
+
+        self._started = False
+        self._stopped = False
+        self._finished = False
+        self._operating = False
+        self._operate_hid = None
+        self._metadata_list = []
+        self._next_index = 0
+        self._in_flight = 0
+        self._done_items = 0
+        self._done_bytes = 0
+        self._total_bytes = 0
 
         self._show_confirmation_alert()
 
@@ -626,43 +664,133 @@ class BatchOperator(GObject.GObject):
             # this is only in the case the operation already started
             # and the user want stop it.
             self._stop_batch_execution()
-        elif hasattr(self, '_object_index') == False:
-            self._object_index = 0
-            GObject.idle_add(self._operate_by_uid_internal)
-
-    def _operate_by_uid_internal(self):
-        # If there is still some uid left, proceed with the operation.
-        # Else, proceed to post-operations.
-        if self._object_index < len(self._uid_list):
-            uid = self._uid_list[self._object_index]
-            metadata = model.get(uid)
-            title = None
-            if 'title' in metadata:
-                title = metadata['title']
-            if title is None or title == '':
-                title = _('Untitled')
-            alert_message = _('%(index)d of %(total)d : %(object_title)s') % {
-                'index': self._object_index + 1,
-                'total': len(self._uid_list),
-                'object_title': title}
-
-            self._confirmation_alert.props.msg = alert_message
-            GObject.idle_add(self._operate_per_metadata, metadata)
-        else:
+        elif not self._started:
+            self._started = True
+            model.begin_batch()
+            GObject.idle_add(self._read_metadata_internal)
+
+    def _read_metadata_internal(self):
+        # Read the metadata of the entries a chunk per idle tick
+        start = len(self._metadata_list)
+        if self._stopped or start >= len(self._uid_list):
+            self._total_bytes = sum([_get_entry_size(metadata)
+                                     for metadata in self._metadata_list])
+            self._schedule_operate()
+            return False
+
+        uids = self._uid_list[start:start + _BATCH_READ_CHUNK]
+        try:
+            metadata_list = model.get_many(uids)
+        except Exception:
+            logging.exception('Could not read the entries of the batch')
+            # give up, but still close the batch in the model
+            self._stopped = True
+            self._schedule_operate()
+            return False
+        if len(metadata_list) != len(uids):
+            logging.warning('%d entries disappeared',
+                            len(uids) - len(metadata_list))
+            # Keep the uid list in step with the metadata read so far
+            self._uid_list[start:start + len(uids)] = \
+                [metadata['uid'] for metadata in metadata_list]
+        self._metadata_list.extend(metadata_list)
+        self._confirmation_alert.props.msg = \
+            _('Reading %(index)d of %(total)d') % {
+                'index': len(self._metadata_list),
+                'total': len(self._uid_list)}
+        return True
+
+    def _schedule_operate(self):
+        if self._operate_hid is None:
+            self._operate_hid = GObject.idle_add(self._operate_internal)
+
+    def _operate_internal(self):
+        # Start operations until the workers are busy or the time slice is
+        # over. Synchronous operations are done right away, so many of
+        # them run in a single idle tick.
+        self._operate_hid = None
+        self._operating = True
+        deadline = time.time() + _BATCH_TIME_SLICE
+        try:
+            while not self._stopped and \
+                    self._in_flight < self._workers and \
+                    self._next_index < len(self._metadata_list):
+                metadata = self._metadata_list[self._next_index]
+                self._next_index += 1
+                self._in_flight += 1
+                self._start_operation(metadata)
+                if time.time() > deadline:
+                    break
+        except Exception:
+            logging.exception('Batch operation failed')
+            self._stopped = True
+        finally:
+            self._operating = False
+
+        all_started = self._stopped or \
+            self._next_index >= len(self._metadata_list)
+        if all_started and self._in_flight == 0:
             self._finish_batch_execution()
+        elif not all_started and self._in_flight < self._workers:
+            self._schedule_operate()
+        return False
 
-    def _operate_per_metadata(self, metadata):
-        self._operation_cb(metadata)
+    def _start_operation(self, metadata):
+        # An operation that fails counts as done, so the batch goes on
+        # and is always closed in the model
+        done = []
 
-        # process the next
-        self._object_index = self._object_index + 1
-        GObject.idle_add(self._operate_by_uid_internal)
+        def __done_cb(metadata):
+            if not done:
+                done.append(True)
+                self.__operation_done_cb(metadata)
+
+        try:
+            self._operation_cb(metadata, __done_cb)
+        except Exception:
+            logging.exception('Batch operation failed on %r',
+                              metadata.get('uid'))
+            __done_cb(metadata)
+
+    def __operation_done_cb(self, metadata):
+        self._in_flight -= 1
+        self._done_items += 1
+        self._done_bytes += _get_entry_size(metadata)
+
+        title = metadata.get('title') or _('Untitled')
+        alert_message = _('%(index)d of %(total)d : %(object_title)s') % {
+            'index': self._done_items,
+            'total': len(self._metadata_list),
+            'object_title': title}
+        if self._total_bytes:
+            # TRANS: Do not translate %(done)s and %(total)s.
+            alert_message += ' ' + _('(%(done)s of %(total)s)') % {
+                'done': format_size(self._done_bytes),
+                'total': format_size(self._total_bytes)}
+        self._confirmation_alert.props.msg = alert_message
+
+        if not self._operating:
+            self._schedule_operate()
 
     def _stop_batch_execution(self):
-        self._object_index = len(self._uid_list)
+        self._stopped = True
+        if self._started:
+            self._schedule_operate()
 
     def _finish_batch_execution(self):
-        del self._object_index
-        self._journalactivity.unfreeze_ui()
-        self._journalactivity.remove_alert(self._confirmation_alert)
-        self._journalactivity.update_selected_items_ui()
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            model.end_batch()
+        finally:
+            self._journalactivity.unfreeze_ui()
+            self._journalactivity.remove_alert(self._confirmation_alert)
+            self._journalactivity.update_selected_items_ui()
+
+
+def _get_entry_size(metadata):
+    try:
+        return int(metadata.get('filesize', 0))
+    except (TypeError, ValueError):
+        return 0
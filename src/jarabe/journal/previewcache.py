@@ -0,0 +1,271 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the decoded previews of Journal entries
+
+Previews are decoded and scaled to PREVIEW_SIZE once and kept in memory,
+keyed by uid and timestamp, up to _MAX_MEMORY_BYTES of pixel data.
+When the thumbnail-cache setting is on, the scaled previews are also
+saved as small PNG files in the profile, from an idle callback, so they
+can be loaded later without decoding and scaling the full preview again.
+The least recently used files are pruned when the directory grows over
+_MAX_DISK_BYTES.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+
+from gi.repository import Gio
+from gi.repository import GLib
+from gi.repository import GdkPixbuf
+
+from sugar3 import env
+from sugar3.graphics.objectchooser import get_preview_pixbuf
+
+from jarabe.journal import model
+
+
+_MAX_MEMORY_BYTES = 24 * 1024 * 1024
+_MAX_DISK_BYTES = 32 * 1024 * 1024
+_THUMBNAILS_DIR = 'journal-thumbnails'
+_TIMESTAMP_OPTION = 'tEXt::sugar-timestamp'
+
+_pixbufs = OrderedDict()
+_memory_bytes = 0
+_thumbnails_enabled = None
+
+# thumbnails waiting to be written, path -> (timestamp, pixbuf)
+_pending_saves = OrderedDict()
+_save_sid = None
+_disk_bytes = None
+
+
+def get_pixbuf(uid, timestamp, preview_data):
+    """Return the scaled preview pixbuf of an entry, or None"""
+    if not preview_data:
+        return None
+
+    key = (uid, str(timestamp or 0))
+    pixbuf = _pixbufs.pop(key, None)
+    if pixbuf is None:
+        pixbuf = _load_thumbnail(uid, key[1])
+        if pixbuf is None:
+            pixbuf = get_preview_pixbuf(preview_data)
+            if pixbuf is None:
+                return None
+            _queue_thumbnail(uid, key[1], pixbuf)
+        _add(key, pixbuf)
+    else:
+        _pixbufs[key] = pixbuf
+
+    return pixbuf
+
+
+def invalidate(uid):
+    global _memory_bytes
+
+    for key in [key for key in _pixbufs if key[0] == uid]:
+        _memory_bytes -= _get_size(_pixbufs.pop(key))
+
+    if _use_thumbnails():
+        path = _get_thumbnail_path(uid)
+        _pending_saves.pop(path, None)
+        _remove_thumbnail(path)
+
+
+def _add(key, pixbuf):
+    global _memory_bytes
+
+    _pixbufs[key] = pixbuf
+    _memory_bytes += _get_size(pixbuf)
+    while _memory_bytes > _MAX_MEMORY_BYTES and len(_pixbufs) > 1:
+        key_, evicted = _pixbufs.popitem(last=False)
+        _memory_bytes -= _get_size(evicted)
+
+
+def _get_size(pixbuf):
+    return pixbuf.get_rowstride() * pixbuf.get_height()
+
+
+def _use_thumbnails():
+    global _thumbnails_enabled
+
+    if _thumbnails_enabled is None:
+        settings = Gio.Settings('org.sugarlabs.journal')
+        _thumbnails_enabled = settings.get_boolean('thumbnail-cache')
+        if _thumbnails_enabled:
+            # drop what earlier sessions left over the limit
+            GLib.idle_add(_prune_thumbnails_cb, priority=GLib.PRIORITY_LOW)
+    return _thumbnails_enabled
+
+
+def _get_thumbnails_dir():
+    return env.get_profile_path(_THUMBNAILS_DIR)
+
+
+def _get_thumbnail_path(uid):
+    if isinstance(uid, unicode):
+        uid = uid.encode('utf-8')
+    return os.path.join(_get_thumbnails_dir(),
+                        hashlib.sha1(uid).hexdigest() + '.png')
+
+
+def _load_thumbnail(uid, timestamp):
+    if not _use_thumbnails():
+        return None
+
+    path = _get_thumbnail_path(uid)
+    pending = _pending_saves.get(path)
+    if pending is not None:
+        if pending[0] == timestamp:
+            return pending[1]
+        return None
+
+    try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+    except GLib.GError:
+        return None
+
+    if pixbuf.get_option(_TIMESTAMP_OPTION) != timestamp:
+        return None
+
+    try:
+        # keep track of use, for pruning
+        os.utime(path, None)
+    except OSError:
+        pass
+    return pixbuf
+
+
+def _queue_thumbnail(uid, timestamp, pixbuf):
+    global _save_sid
+
+    if not _use_thumbnails():
+        return
+
+    _pending_saves[_get_thumbnail_path(uid)] = (timestamp, pixbuf)
+    if _save_sid is None:
+        _save_sid = GLib.idle_add(_save_thumbnail_cb,
+                                  priority=GLib.PRIORITY_LOW)
+
+
+def _save_thumbnail_cb():
+    global _save_sid, _disk_bytes
+
+    if not _pending_saves:
+        _save_sid = None
+        return False
+
+    path, (timestamp, pixbuf) = _pending_saves.popitem(last=False)
+    temp_path = None
+    try:
+        dir_path = os.path.dirname(path)
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        fd, temp_path = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+        os.close(fd)
+        pixbuf.savev(temp_path, 'png', [_TIMESTAMP_OPTION], [timestamp])
+        os.rename(temp_path, path)
+    except (EnvironmentError, GLib.GError):
+        logging.exception('Could not save the thumbnail %r', path)
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return True
+
+    if _disk_bytes is None:
+        _prune_thumbnails()
+    else:
+        _disk_bytes += os.path.getsize(path)
+        if _disk_bytes > _MAX_DISK_BYTES:
+            _prune_thumbnails()
+    return True
+
+
+def _remove_thumbnail(path):
+    global _disk_bytes
+
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        return
+    if _disk_bytes is not None:
+        _disk_bytes -= size
+
+
+def _prune_thumbnails_cb():
+    _prune_thumbnails()
+    return False
+
+
+def _prune_thumbnails():
+    """Remove the least recently used thumbnails, and any leftovers of
+    interrupted saves, until the directory fits in _MAX_DISK_BYTES
+    with some room to spare.
+    """
+    global _disk_bytes
+
+    dir_path = _get_thumbnails_dir()
+    files = []
+    total = 0
+    try:
+        names = os.listdir(dir_path)
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(dir_path, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if not name.endswith('.png'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    if total > _MAX_DISK_BYTES:
+        files.sort()
+        for mtime_, size, path in files:
+            if total <= _MAX_DISK_BYTES * 3 / 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    _disk_bytes = total
+
+
+def _model_changed_cb(sender, signal, object_id):
+    invalidate(object_id)
+
+
+def _model_batch_changed_cb(sender, signal, changes):
+    for object_id, change in changes.iteritems():
+        if change != 'created':
+            invalidate(object_id)
+
+
+model.updated.connect(_model_changed_cb)
+model.deleted.connect(_model_changed_cb)
+model.batch_changed.connect(_model_batch_changed_cb)
@@ -0,0 +1,59 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+
+
+class RowCache(object):
+    """Bounded LRU of the rows computed by the Journal tree models
+
+    Rows are keyed by the uid of the entry they were computed from, so
+    they survive the entry moving around in the result set. The models
+    invalidate a row when its entry is updated or deleted.
+    """
+
+    def __init__(self, max_rows):
+        self._max_rows = max_rows
+        self._rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid):
+        row = self._rows.pop(uid, None)
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._rows[uid] = row
+        return row
+
+    def set(self, uid, row):
+        self._rows.pop(uid, None)
+        self._rows[uid] = row
+        while len(self._rows) > self._max_rows:
+            self._rows.popitem(last=False)
+
+    def invalidate(self, uid):
+        self._rows.pop(uid, None)
+
+    def clear(self):
+        self._rows.clear()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, uid):
+        return uid in self._rows
@@ -0,0 +1,377 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import errno
+import json
+import sqlite3
+import time
+from collections import deque
+from stat import S_IFLNK, S_IFMT, S_IFDIR, S_IFREG
+from threading import Thread, Event
+from Queue import Queue
+
+from gi.repository import Gio
+from gi.repository import GLib
+
+from jarabe.journal import mountindex
+
+
+# Number of threads listing directories that are not current in the index
+_WORKERS = 4
+
+# Number of matching files handed to the main loop at once
+_CHUNK_SIZE = 500
+
+# Number of walked directories whose matching files are looked up at once,
+# and maximum time to wait for that many, in seconds
+_DIRECTORY_BATCH = 100
+_FILES_INTERVAL = 0.5
+
+# Minimum time between two progress notifications, in seconds
+_PROGRESS_INTERVAL = 0.1
+
+
+class MountScanner(object):
+    """Walks a mount point away from the main loop
+
+    A coordinator thread walks the directory tree using the MountIndex of
+    the mount point: directories that have not changed since the last walk
+    are taken from the index, the others are handed to a pool of worker
+    threads that list and stat their entries in one go. As directories
+    are done with, the coordinator queries the index for their matching
+    files and streams them to the main loop in chunks.
+
+    All the callbacks are called from the main loop:
+    progress_cb() while scanning, files_cb(indexed_files) for every chunk
+    of matching files, and ready_cb() at the end. Each chunk is sorted,
+    but the chunks follow the order of the walk, so the files have to be
+    sorted again once they all arrived.
+    """
+
+    def __init__(self, mount_point, metadata_dir_name, filters):
+        self._mount_point = mount_point
+        self._filters = filters
+        self._index = mountindex.MountIndex(mount_point, metadata_dir_name)
+        self._stopped = Event()
+        self._progress_pending = False
+        self._last_progress = 0
+        self._last_files = 0
+        self._posted_directories = set()
+
+        self._progress_cb = None
+        self._files_cb = None
+        self._ready_cb = None
+
+    def start(self, progress_cb, files_cb, ready_cb):
+        self._progress_cb = progress_cb
+        self._files_cb = files_cb
+        self._ready_cb = ready_cb
+
+        thread = Thread(target=self._thread_func)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _thread_func(self):
+        index = self._index
+        try:
+            t = time.time()
+            try:
+                completed = self._run_walk(index)
+            except sqlite3.DatabaseError:
+                # The index is written without syncing, a device removed
+                # meanwhile can leave it corrupt in ways only found now
+                logging.exception('Discarding the index of %r and '
+                                  'scanning again', self._mount_point)
+                index.discard()
+                completed = self._run_walk(index)
+            if not completed:
+                return
+            logging.debug('MountScanner walked %r in %f s.',
+                          self._mount_point, time.time() - t)
+        except Exception:
+            logging.exception('Error scanning %r', self._mount_point)
+        finally:
+            index.close()
+
+        GLib.idle_add(self._ready_idle_cb)
+
+    def _run_walk(self, index):
+        # Each walk gets its own workers, so that the results of a failed
+        # one cannot get mixed with those of the next
+        tasks = Queue()
+        results = Queue()
+        workers = []
+        for i_ in range(_WORKERS):
+            worker = Thread(target=self._worker_func, args=(tasks, results))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        try:
+            return self._walk(index, tasks, results)
+        finally:
+            for worker in workers:
+                tasks.put(None)
+
+    def _walk(self, index, tasks, results):
+        # Returns False if the scan was stopped
+        pending = deque([self._mount_point])
+        visited = set()
+        finished = []
+        outstanding = 0
+
+        while pending or outstanding:
+            if self._stopped.is_set():
+                return False
+
+            while pending:
+                dir_path = pending.popleft()
+                stat = self._stat_directory(dir_path)
+                if stat is None:
+                    continue
+                stamp, dir_id = stat
+
+                # the same directory can be reached through links,
+                # whether it is scanned or taken from the index
+                if dir_id in visited:
+                    continue
+                visited.add(dir_id)
+
+                subdirs = index.get_subdirectories(dir_path, *stamp)
+                if subdirs is not None:
+                    pending.extend(subdirs)
+                    finished.append(dir_path)
+                else:
+                    tasks.put((dir_path, stamp))
+                    outstanding += 1
+
+            self._queue_files(index, finished)
+
+            if not outstanding:
+                continue
+
+            result = results.get()
+            outstanding -= 1
+            if result is None:
+                continue
+
+            dir_path, stamp, records, subdirs = result
+            new_subdirs = [subdir_path for subdir_path, id_tuple in subdirs
+                           if id_tuple not in visited]
+            index.update_directory(dir_path, stamp[0], stamp[1], records,
+                                   new_subdirs)
+            pending.extend(new_subdirs)
+            finished.append(dir_path)
+            self._queue_progress()
+
+        self._queue_files(index, finished, force=True)
+        return True
+
+    def _queue_files(self, index, finished, force=False):
+        # Hand the matching files of the finished directories over to the
+        # main loop, a batch of directories at a time
+        if not finished:
+            return
+        if not force and len(finished) < _DIRECTORY_BATCH and \
+                time.time() - self._last_files < _FILES_INTERVAL:
+            return
+
+        # after a rescan, leave out what was already handed over
+        directories = [dir_path for dir_path in finished
+                       if dir_path not in self._posted_directories]
+        indexed_files = index.find(directories, **self._filters)
+        self._posted_directories.update(directories)
+        del finished[:]
+        self._last_files = time.time()
+
+        for i in range(0, len(indexed_files), _CHUNK_SIZE):
+            GLib.idle_add(self._files_idle_cb,
+                          indexed_files[i:i + _CHUNK_SIZE])
+
+    def _stat_directory(self, dir_path):
+        # Returns the stamp of dir_path and its (st_ino, st_dev). The
+        # metadata directory is part of the stamp, as metadata is written
+        # there without touching dir_path itself
+        try:
+            stat = os.stat(dir_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logging.exception('Error reading directory %r', dir_path)
+            return None
+
+        metadata_dir = self._index.get_metadata_dir(dir_path)
+        try:
+            metadata_mtime = os.stat(metadata_dir).st_mtime
+        except OSError:
+            metadata_mtime = 0
+
+        return (stat.st_mtime, metadata_mtime), (stat.st_ino, stat.st_dev)
+
+    def _worker_func(self, tasks, results):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+
+            dir_path, stamp = task
+            if self._stopped.is_set():
+                results.put(None)
+                continue
+
+            try:
+                results.put(self._scan_directory(dir_path, stamp))
+            except Exception:
+                logging.exception('Error scanning directory %r', dir_path)
+                results.put(None)
+
+    def _scan_directory(self, dir_path, stamp):
+        try:
+            entries = os.listdir(dir_path)
+        except OSError as e:
+            if e.errno != errno.EACCES:
+                logging.exception('Error reading directory %r', dir_path)
+            return None
+
+        metadata_dir = self._index.get_metadata_dir(dir_path)
+        try:
+            metadata_names = set(os.listdir(metadata_dir))
+        except OSError:
+            metadata_names = set()
+
+        records = []
+        subdirs = []
+        for entry in entries:
+            if entry.startswith('.'):
+                continue
+
+            full_path = dir_path + '/' + entry
+            stat = self._stat_file(full_path)
+            if stat is None:
+                continue
+
+            if S_IFMT(stat.st_mode) == S_IFDIR:
+                subdirs.append((full_path, (stat.st_ino, stat.st_dev)))
+            elif S_IFMT(stat.st_mode) == S_IFREG:
+                metadata = None
+                if entry + '.metadata' in metadata_names:
+                    metadata = _read_metadata_json(
+                        os.path.join(metadata_dir, entry + '.metadata'))
+                records.append(_get_index_record(full_path, stat, metadata))
+
+        return dir_path, stamp, records, subdirs
+
+    def _stat_file(self, full_path):
+        try:
+            stat = os.lstat(full_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logging.exception(
+                    'Error reading metadata of file %r', full_path)
+            return None
+
+        if S_IFMT(stat.st_mode) != S_IFLNK:
+            return stat
+
+        try:
+            link = os.readlink(full_path)
+        except OSError as e:
+            logging.exception('Error reading target of link %r', full_path)
+            return None
+
+        if not os.path.abspath(link).startswith(self._mount_point):
+            return None
+
+        try:
+            return os.stat(full_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logging.exception(
+                    'Error reading metadata of linked file %r', full_path)
+            return None
+
+    def _queue_progress(self):
+        # Called from the coordinator thread, avoid flooding the main loop
+        if self._progress_pending or \
+                time.time() - self._last_progress < _PROGRESS_INTERVAL:
+            return
+        self._progress_pending = True
+        self._last_progress = time.time()
+        GLib.idle_add(self._progress_idle_cb)
+
+    def _progress_idle_cb(self):
+        self._progress_pending = False
+        if not self._stopped.is_set():
+            self._progress_cb()
+        return False
+
+    def _files_idle_cb(self, indexed_files):
+        if not self._stopped.is_set():
+            self._files_cb(indexed_files)
+        return False
+
+    def _ready_idle_cb(self):
+        if not self._stopped.is_set():
+            self._ready_cb()
+        return False
+
+
+def _read_metadata_json(metadata_path):
+    try:
+        return json.load(open(metadata_path))
+    except (ValueError, EnvironmentError):
+        logging.error('Could not read metadata %r on external device.',
+                      metadata_path)
+        return None
+
+
+def _get_index_record(path, stat, metadata=None):
+    """Return the mountindex.IndexRecord describing a file.
+
+    metadata is the content of the json file stored for it on the
+    device, if any.
+
+    """
+    mime_type, uncertain_result_ = Gio.content_type_guess(filename=path,
+                                                          data=None)
+    if metadata is None:
+        # Same fields model._get_file_metadata() makes up for plain files
+        return mountindex.IndexRecord(
+            path=path, mtime=stat.st_mtime, size=stat.st_size,
+            mime_type=mime_type, title=os.path.basename(path),
+            description=path, tags=None, fulltext=None, activity='',
+            keep=0, has_metadata=0)
+
+    def _get_text(key):
+        value = metadata.get(key)
+        if value is None or isinstance(value, basestring):
+            return value
+        return unicode(value)
+
+    try:
+        keep = int(metadata.get('keep', 0))
+    except (TypeError, ValueError):
+        keep = 0
+
+    return mountindex.IndexRecord(
+        path=path, mtime=stat.st_mtime, size=stat.st_size,
+        mime_type=mime_type, title=_get_text('title'),
+        description=_get_text('description'), tags=_get_text('tags'),
+        fulltext=_get_text('fulltext'), activity=_get_text('activity'),
+        keep=keep, has_metadata=1)
@@ -90,6 +90,9 @@ from jarabe.view.service import UIService
 from jarabe import apisocket
 from jarabe import testrunner
 from jarabe.model import brightness
+from jarabe.model import bundleregistry
+from jarabe.model import friends
+from jarabe.model import network
 
 
 _metacity_process = None
@@ -224,6 +227,10 @@ def _begin_desktop_startup():
 
     UIService()
 
+    # start loading the saved network connections while the desktop is
+    # coming up, the neighborhood view needs them
+    network.get_connections()
+
     session_manager = get_session_manager()
     session_manager.start()
 
@@ -486,6 +493,8 @@ def main():
     except KeyboardInterrupt:
         print 'Ctrl+C pressed, exiting...'
 
+    bundleregistry.flush()
+    friends.flush()
     _stop_window_manager()
 
 main()
@@ -70,13 +70,17 @@ class AdHocManager(GObject.GObject):
                           self._CHANNEL_6: None,
                           self._CHANNEL_11: None}
 
-        for channel in (self._CHANNEL_1, self._CHANNEL_6, self._CHANNEL_11):
-            if not self._find_connection(channel):
-                self._add_connection(channel)
+        network.get_connections().call_when_loaded(
+            self.__connections_loaded_cb)
 
         settings = Gio.Settings('org.sugarlabs.network')
         self._autoconnect_enabled = settings.get_boolean('adhoc-autoconnect')
 
+    def __connections_loaded_cb(self):
+        for channel in (self._CHANNEL_1, self._CHANNEL_6, self._CHANNEL_11):
+            if not self._find_connection(channel):
+                self._add_connection(channel)
+
     def start_listening(self, device):
         self._listening_called += 1
         if self._listening_called > 1:
@@ -24,6 +24,7 @@ from telepathy.interfaces import CONNECTION
 from sugar3 import profile
 
 from jarabe.util.telepathy import connection_watcher
+from jarabe.util.normalize import normalize_string
 
 
 CONNECTION_INTERFACE_BUDDY_INFO = 'org.laptop.Telepathy.BuddyInfo'
@@ -37,6 +38,7 @@ class BaseBuddyModel(GObject.GObject):
     def __init__(self, **kwargs):
         self._key = None
         self._nick = None
+        self._search_key = None
         self._color = None
         self._tags = None
         self._current_activity = None
@@ -48,9 +50,17 @@ class BaseBuddyModel(GObject.GObject):
 
     def set_nick(self, nick):
         self._nick = nick
+        self._search_key = None
 
     nick = GObject.property(type=object, getter=get_nick, setter=set_nick)
 
+    def get_search_key(self):
+        """Return the nick normalized for searching"""
+        if self._search_key is None:
+            self._search_key = normalize_string(
+                (self._nick or '').decode('utf-8'))
+        return self._search_key
+
     def get_key(self):
         return self._key
 
@@ -16,6 +16,8 @@
 
 import os
 import logging
+import cPickle
+import tempfile
 from threading import Thread, Lock
 
 from gi.repository import GObject
@@ -25,6 +27,8 @@ from gi.repository import Gtk
 import json
 
 from sugar3.bundle.helpers import bundle_from_dir
+from sugar3.bundle import activitybundle
+from sugar3.bundle import contentbundle
 from sugar3.bundle.activitybundle import ActivityBundle
 from sugar3.bundle.bundleversion import NormalizedVersion
 from sugar3.bundle.bundle import MalformedBundleException, \
@@ -57,6 +61,19 @@ immediately by the shell.
 _DEFAULT_VIEW = 0
 _instance = None
 
+_CACHE_VERSION = 1
+# Milliseconds favorites changes are collected before being written
+_FAVORITES_WRITE_DELAY = 1000
+# Environment variables that change the translated bundle names
+_LOCALE_VARIABLES = ['LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG']
+# Number of threads installing bundles at the same time
+_MAX_INSTALL_WORKERS = 3
+
+# Install priorities: interactive installs, started by the user, run
+# before batch ones such as updates or restores.
+INSTALL_PRIORITY_INTERACTIVE = 0
+INSTALL_PRIORITY_BATCH = 1
+
 
 class BundleRegistry(GObject.GObject):
     """Tracks the available activity bundles"""
@@ -79,10 +96,19 @@ class BundleRegistry(GObject.GObject):
         # Queue of bundles to be installed/upgraded
         self._install_queue = _InstallQueue(self)
 
+        self._favorites_writer = _FavoritesWriter()
+
         # Bundle installation happens in a separate thread, which needs
         # access to _bundles. Protect all _bundles access with a lock.
         self._lock = Lock()
         self._bundles = []
+        # Indexes of _bundles, by bundle id, by path and by mime type
+        self._bundles_by_id = {}
+        self._bundles_by_path = {}
+        self._bundles_by_mime_type = {}
+
+        self._bundle_cache = _BundleCache(
+            env.get_profile_path('bundle_registry.cache'))
 
         # hold a reference to the monitors so they don't get disposed
         self._gio_monitors = []
@@ -99,6 +125,7 @@ class BundleRegistry(GObject.GObject):
                 flags=Gio.FileMonitorFlags.NONE, cancellable=None)
             monitor.connect('changed', self.__file_monitor_changed_cb)
             self._gio_monitors.append(monitor)
+        self._bundle_cache.save()
 
         self._favorite_bundles = []
         for i in range(desktop.get_number_of_views()):
@@ -149,7 +176,8 @@ class BundleRegistry(GObject.GObject):
                     continue
                 activity_dir = os.path.basename(one_file.get_path())
                 try:
-                    bundle = bundle_from_dir(os.path.join(root, activity_dir))
+                    bundle = self._bundle_cache.get_bundle(
+                        os.path.join(root, activity_dir))
                 except MalformedBundleException:
                     continue
 
@@ -244,10 +272,32 @@ class BundleRegistry(GObject.GObject):
     def get_bundle(self, bundle_id):
         """Returns an bundle given his service name"""
         with self._lock:
-            for bundle in self._bundles:
-                if bundle.get_bundle_id() == bundle_id:
-                    return bundle
-        return None
+            return self._bundles_by_id.get(bundle_id)
+
+    def _add_to_indexes(self, bundle):
+        # Must be called with the lock held
+        self._bundles.append(bundle)
+        self._bundles_by_id[bundle.get_bundle_id()] = bundle
+        self._bundles_by_path[bundle.get_path()] = bundle
+        if isinstance(bundle, ActivityBundle):
+            for mime_type in bundle.get_mime_types() or []:
+                self._bundles_by_mime_type.setdefault(mime_type, []).append(
+                    bundle)
+
+    def _remove_from_indexes(self, bundle):
+        # Must be called with the lock held
+        self._bundles.remove(bundle)
+        if self._bundles_by_id.get(bundle.get_bundle_id()) is bundle:
+            del self._bundles_by_id[bundle.get_bundle_id()]
+        if self._bundles_by_path.get(bundle.get_path()) is bundle:
+            del self._bundles_by_path[bundle.get_path()]
+        if isinstance(bundle, ActivityBundle):
+            for mime_type in bundle.get_mime_types() or []:
+                bundles = self._bundles_by_mime_type.get(mime_type, [])
+                if bundle in bundles:
+                    bundles.remove(bundle)
+                if not bundles:
+                    self._bundles_by_mime_type.pop(mime_type, None)
 
     def __iter__(self):
         with self._lock:
@@ -293,7 +343,7 @@ class BundleRegistry(GObject.GObject):
         failure.
         """
         try:
-            bundle = bundle_from_dir(bundle_path)
+            bundle = self._bundle_cache.get_bundle(bundle_path)
         except MalformedBundleException:
             logging.exception('Error loading bundle %r', bundle_path)
             return None
@@ -329,20 +379,17 @@ class BundleRegistry(GObject.GObject):
                                       favorite)
 
         with self._lock:
-            self._bundles.append(bundle)
+            self._add_to_indexes(bundle)
         if emit_signals:
             self.emit('bundle-added', bundle)
+            self._bundle_cache.save()
         return bundle
 
     def remove_bundle(self, bundle_path, emit_signals=True):
-        removed = None
-        self._lock.acquire()
-        for bundle in self._bundles:
-            if bundle.get_path() == bundle_path:
-                self._bundles.remove(bundle)
-                removed = bundle
-                break
-        self._lock.release()
+        with self._lock:
+            removed = self._bundles_by_path.get(bundle_path)
+            if removed is not None:
+                self._remove_from_indexes(removed)
 
         if emit_signals and removed is not None:
             self.emit('bundle-removed', removed)
@@ -355,17 +402,17 @@ class BundleRegistry(GObject.GObject):
         default_bundle_id = mime.get_default_activity(mime_type)
         default_bundle = None
 
-        for bundle in self:
-            if not isinstance(bundle, ActivityBundle):
-                continue
-            if mime_type in (bundle.get_mime_types() or []):
-                if bundle.get_bundle_id() == default_bundle_id:
-                    default_bundle = bundle
-                elif self.get_default_for_type(mime_type) == \
-                        bundle.get_bundle_id():
-                    result.insert(0, bundle)
-                else:
-                    result.append(bundle)
+        with self._lock:
+            bundles = list(self._bundles_by_mime_type.get(mime_type, []))
+
+        for bundle in bundles:
+            if bundle.get_bundle_id() == default_bundle_id:
+                default_bundle = bundle
+            elif self.get_default_for_type(mime_type) == \
+                    bundle.get_bundle_id():
+                result.insert(0, bundle)
+            else:
+                result.append(bundle)
 
         if default_bundle is not None:
             result.insert(0, default_bundle)
@@ -376,11 +423,9 @@ class BundleRegistry(GObject.GObject):
         return self._mime_defaults.get(mime_type)
 
     def _find_bundle(self, bundle_id, version):
-        with self._lock:
-            for bundle in self._bundles:
-                if bundle.get_bundle_id() == bundle_id and \
-                        bundle.get_activity_version() == version:
-                    return bundle
+        bundle = self.get_bundle(bundle_id)
+        if bundle is not None and bundle.get_activity_version() == version:
+            return bundle
         raise ValueError('No bundle %r with version %r exists.' %
                          (bundle_id, version))
 
@@ -458,15 +503,17 @@ class BundleRegistry(GObject.GObject):
                                         (favorite_view))
         favorites_data = {
             'favorites': self._favorite_bundles[favorite_view]}
-        json.dump(favorites_data, open(path, 'w'), indent=1)
+        self._favorites_writer.write(path, favorites_data)
+
+    def flush(self):
+        """Write the pending favorites changes to disk now"""
+        self._favorites_writer.flush()
 
     def is_installed(self, bundle):
-        for installed_bundle in self:
-            if bundle.get_bundle_id() == installed_bundle.get_bundle_id() and \
-                    NormalizedVersion(bundle.get_activity_version()) == \
-                    NormalizedVersion(installed_bundle.get_activity_version()):
-                return True
-        return False
+        installed_bundle = self.get_bundle(bundle.get_bundle_id())
+        return installed_bundle is not None and \
+            NormalizedVersion(bundle.get_activity_version()) == \
+            NormalizedVersion(installed_bundle.get_activity_version())
 
     def install(self, bundle, force_downgrade=False):
         """
@@ -488,6 +535,9 @@ class BundleRegistry(GObject.GObject):
 
         RegistrationException is raised if the bundle cannot be registered
         after it is installed.
+
+        This runs the main loop while waiting for the installation; use
+        install_async() where possible.
         """
         result = [None]
         self.install_async(bundle, self._sync_install_cb, result,
@@ -504,7 +554,8 @@ class BundleRegistry(GObject.GObject):
         user_data[0] = result
 
     def install_async(self, bundle, callback, user_data,
-                      force_downgrade=False):
+                      force_downgrade=False,
+                      priority=INSTALL_PRIORITY_INTERACTIVE):
         """
         Asynchronous version of install().
         The result of the installation is presented to a user-defined callback
@@ -515,10 +566,13 @@ class BundleRegistry(GObject.GObject):
           3. The user_data passed to this method
 
         The callback is always invoked from main-loop context.
+
+        Installations start in the order they are requested, those with
+        INSTALL_PRIORITY_INTERACTIVE before those with INSTALL_PRIORITY_BATCH.
         """
         self._install_queue.enqueue(bundle, force_downgrade,
                                     self._bundle_installed_cb,
-                                    [callback, user_data])
+                                    [callback, user_data], priority)
 
     def _bundle_installed_cb(self, bundle, result, data):
         """
@@ -602,58 +656,255 @@ class BundleRegistry(GObject.GObject):
 
             for activity_dir in dir_list:
                 try:
-                    bundle = bundle_from_dir(os.path.join(root, activity_dir))
+                    bundle = self._bundle_cache.get_bundle(
+                        os.path.join(root, activity_dir))
                 except MalformedBundleException:
                     continue
 
-                if bundle.get_bundle_id() == bundle_id:
+                if bundle is not None and bundle.get_bundle_id() == bundle_id:
                     bundles.append(bundle)
+        self._bundle_cache.save()
         return bundles
 
 
+class _BundleCache(object):
+    """
+    Bundles parsed from activity directories, persisted in the profile so
+    that activity.info and library.info files do not need to be parsed
+    again on the next startup. Only for internal bundleregistry use.
+
+    A cached bundle is used as long as the mtimes of its directory and of
+    its info file have not changed. The whole cache is discarded when the
+    toolkit bundle classes or the locale change.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._entries = {}
+        self._dirty = False
+        self._load()
+
+    def _get_header(self):
+        header = [_CACHE_VERSION]
+        for module in [activitybundle, contentbundle]:
+            try:
+                header.append(os.stat(module.__file__).st_mtime)
+            except OSError:
+                header.append(None)
+        header.extend([os.environ.get(name) for name in _LOCALE_VARIABLES])
+        return header
+
+    def _load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                header, entries = cPickle.load(f)
+        except IOError:
+            return
+        except Exception:
+            logging.exception('Error while loading the bundle cache')
+            return
+
+        if header == self._get_header():
+            self._entries = entries
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        for bundle_path in self._entries.keys():
+            if not os.path.exists(bundle_path):
+                del self._entries[bundle_path]
+
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self._path))
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump((self._get_header(), self._entries), f,
+                             cPickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self._path)
+        except Exception:
+            logging.exception('Error while saving the bundle cache')
+            return
+        self._dirty = False
+
+    def get_bundle(self, bundle_path):
+        """
+        Like bundle_from_dir(), returns None if bundle_path is not a bundle
+        and raises MalformedBundleException if it is a malformed one.
+        """
+        stamp = self._get_stamp(bundle_path)
+        entry = self._entries.get(bundle_path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        bundle = bundle_from_dir(bundle_path)
+        self._entries[bundle_path] = (stamp, bundle)
+        self._dirty = True
+        return bundle
+
+    def _get_stamp(self, bundle_path):
+        stamp = []
+        for name in ['', os.path.join('activity', 'activity.info'),
+                     os.path.join('library', 'library.info')]:
+            try:
+                stamp.append(os.stat(os.path.join(bundle_path,
+                                                  name)).st_mtime)
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+
+class _FavoritesWriter(object):
+    """
+    Writes the favorites files behind the registry. Only for internal
+    bundleregistry use.
+
+    Changes are collected for _FAVORITES_WRITE_DELAY, so dragging an icon
+    or favoriting many bundles writes each file once. The data is
+    serialized in the main loop, where it is modified, and written by a
+    thread to a temporary file that is then renamed over the old one.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._write_lock = Lock()
+        # path -> data to serialize, filled in the main loop
+        self._changed = {}
+        # path -> serialized data, consumed by the thread
+        self._queue = {}
+        self._thread_running = False
+        self._timeout_id = None
+
+    def write(self, path, data):
+        self._changed[path] = data
+        if self._timeout_id is None:
+            self._timeout_id = GLib.timeout_add(_FAVORITES_WRITE_DELAY,
+                                                self.__timeout_cb)
+
+    def __timeout_cb(self):
+        self._timeout_id = None
+        self._serialize()
+        self._lock.acquire()
+        if not self._thread_running:
+            self._thread_running = True
+            Thread(target=self._thread_func).start()
+        self._lock.release()
+        return False
+
+    def _serialize(self):
+        changed = self._changed
+        self._changed = {}
+        serialized = {}
+        for path, data in changed.iteritems():
+            serialized[path] = json.dumps(data, indent=1)
+        with self._lock:
+            self._queue.update(serialized)
+
+    def flush(self):
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+        self._serialize()
+        self._write_queued()
+
+    def _thread_func(self):
+        while self._write_queued():
+            pass
+        with self._lock:
+            self._thread_running = False
+        # Something may have been queued after the last check
+        self._write_queued()
+
+    def _write_queued(self):
+        # Returns whether anything was written
+        with self._write_lock:
+            with self._lock:
+                queue = self._queue
+                self._queue = {}
+            for path, data in queue.iteritems():
+                try:
+                    fd, temp_path = tempfile.mkstemp(
+                        dir=os.path.dirname(path))
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(data)
+                    os.rename(temp_path, path)
+                except EnvironmentError:
+                    logging.exception('Error while writing %s', path)
+            return bool(queue)
+
+
 class _InstallQueue(object):
     """
     A class to represent a queue of bundles to be installed, and to handle
     execution of each task in the queue. Only for internal bundleregistry use.
 
-    The use of a queue means that we serialize all bundle upgrade processing.
-    This is necessary to avoid many difficult corner-cases like: what happens
-    if two users try to asynchronously and simultaenously install different
+    Tasks start in FIFO order, with one lane per install priority; the
+    interactive lane is always served first. Up to _MAX_INSTALL_WORKERS
+    threads do the actual bundle installs, each picking the oldest task
+    it can run. Two tasks for the same bundle ID never run at the same
+    time, which avoids many difficult corner-cases like: what happens if
+    two users try to asynchronously and simultaenously install different
     version of the same bundle?
 
-    We maintain at maximum one thread to do the actual bundle install. When
-    done, the thread enqueues a callback in the main thread (via the GLib
-    main loop).
+    When a task is done, its callback is invoked in the main thread (via
+    the GLib main loop), so the registration of installed bundles is
+    serialized. A bundle ID is only released once its callback returned.
     """
 
     def __init__(self, registry):
         self._lock = Lock()
-        self._queue = []
-        self._thread_running = False
+        self._lanes = ([], [])
+        self._running_ids = set()
+        self._n_workers = 0
         self._registry = registry
 
-    def enqueue(self, bundle, force_downgrade, callback, user_data):
+    def enqueue(self, bundle, force_downgrade, callback, user_data,
+                priority=INSTALL_PRIORITY_INTERACTIVE):
         task = _InstallTask(bundle, force_downgrade, callback, user_data)
+        task.done_cb = self._task_done_cb
         self._lock.acquire()
-        self._queue.append(task)
-        if not self._thread_running:
-            self._thread_running = True
-            Thread(target=self._thread_func).start()
+        self._lanes[priority].append(task)
+        self._start_worker()
         self._lock.release()
 
+    def _start_worker(self):
+        # Called with the lock held
+        if self._n_workers < _MAX_INSTALL_WORKERS and \
+                any(self._lanes):
+            self._n_workers += 1
+            Thread(target=self._thread_func).start()
+
+    def _pop_task(self):
+        # Called with the lock held
+        for lane in self._lanes:
+            for task in lane:
+                bundle_id = task.bundle.get_bundle_id()
+                if bundle_id is None or bundle_id not in self._running_ids:
+                    lane.remove(task)
+                    if bundle_id is not None:
+                        self._running_ids.add(bundle_id)
+                    return task
+        return None
+
     def _thread_func(self):
         while True:
             self._lock.acquire()
-            if len(self._queue) == 0:
-                self._thread_running = False
+            task = self._pop_task()
+            if task is None:
+                self._n_workers -= 1
                 self._lock.release()
                 return
-
-            task = self._queue.pop()
             self._lock.release()
 
             self._do_work(task)
 
+    def _task_done_cb(self, task):
+        # Called in the main loop after the task callback
+        self._lock.acquire()
+        self._running_ids.discard(task.bundle.get_bundle_id())
+        self._start_worker()
+        self._lock.release()
+
     def _do_work(self, task):
         bundle = task.bundle
         bundle_id = bundle.get_bundle_id()
@@ -705,9 +956,18 @@ class _InstallTask(object):
         self.callback = callback
         self.force_downgrade = force_downgrade
         self.user_data = user_data
+        self.done_cb = None
 
     def queue_callback(self, result):
-        GLib.idle_add(self.callback, self.bundle, result, self.user_data)
+        GLib.idle_add(self._complete, result)
+
+    def _complete(self, result):
+        try:
+            self.callback(self.bundle, result, self.user_data)
+        finally:
+            if self.done_cb is not None:
+                self.done_cb(self)
+        return False
 
 
 def get_registry():
@@ -715,3 +975,9 @@ def get_registry():
     if not _instance:
         _instance = BundleRegistry()
     return _instance
+
+
+def flush():
+    """Write the pending changes of the registry, if it was loaded"""
+    if _instance is not None:
+        _instance.flush()
@@ -96,7 +96,12 @@ class BaseFileTransfer(GObject.GObject):
         self.mime_type = props['ContentType']
 
         handle = channel_properties.Get(CHANNEL, 'TargetHandle')
-        self.buddy = neighborhood.get_model().get_buddy_by_handle(handle)
+        # handles are only unique within the connection they belong to
+        neighborhood_model = neighborhood.get_model()
+        account_path = neighborhood_model.get_account_path(
+            self._connection.object_path)
+        self.buddy = neighborhood_model.get_buddy_by_handle(handle,
+                                                            account_path)
 
     def __transferred_bytes_changed_cb(self, transferred_bytes):
         logging.debug('__transferred_bytes_changed_cb %r', transferred_bytes)
@@ -15,9 +15,11 @@
 
 import os
 import logging
+import tempfile
 from ConfigParser import ConfigParser
 
 from gi.repository import GObject
+from gi.repository import GLib
 
 from sugar3 import env
 from sugar3.graphics.xocolor import XoColor
@@ -28,6 +30,9 @@ from jarabe.model import neighborhood
 
 _model = None
 
+# Milliseconds friends list changes are collected before being saved
+_SAVE_DELAY = 1000
+
 
 class FriendBuddyModel(BuddyModel):
     __gtype_name__ = 'SugarFriendBuddyModel'
@@ -36,26 +41,21 @@ class FriendBuddyModel(BuddyModel):
 
     def __init__(self, nick, key, account=None, contact_id=None):
         self._online_buddy = None
+        self._color_hid = None
 
         BuddyModel.__init__(self, nick=nick, key=key, account=account,
                             contact_id=contact_id)
 
-        neighborhood_model = neighborhood.get_model()
-        neighborhood_model.connect('buddy-added', self.__buddy_added_cb)
-        neighborhood_model.connect('buddy-removed', self.__buddy_removed_cb)
-
-        buddy = neighborhood_model.get_buddy_by_key(key)
+        buddy = neighborhood.get_model().get_buddy_by_key(key)
         if buddy is not None:
             self._set_online_buddy(buddy)
 
-    def __buddy_added_cb(self, model_, buddy):
-        if buddy.key != self.key:
-            return
-        self._set_online_buddy(buddy)
-
     def _set_online_buddy(self, buddy):
+        # Called by Friends when a buddy with our key appears
+        self._clear_online_buddy()
         self._online_buddy = buddy
-        self._online_buddy.connect('notify::color', self.__notify_color_cb)
+        self._color_hid = self._online_buddy.connect('notify::color',
+                                                     self.__notify_color_cb)
         self.notify('color')
         self.notify('present')
 
@@ -66,13 +66,19 @@ class FriendBuddyModel(BuddyModel):
         if buddy.account != self.account:
             self.account = buddy.account
 
-    def __buddy_removed_cb(self, model_, buddy):
-        if buddy.key != self.key:
-            return
-        self._online_buddy = None
+    def _remove_online_buddy(self):
+        # Called by Friends when the buddy with our key goes away
+        self._clear_online_buddy()
         self.notify('color')
         self.notify('present')
 
+    def _clear_online_buddy(self):
+        if self._online_buddy is None:
+            return
+        self._online_buddy.disconnect(self._color_hid)
+        self._color_hid = None
+        self._online_buddy = None
+
     def __notify_color_cb(self, buddy, pspec):
         self.notify('color')
 
@@ -111,9 +117,26 @@ class Friends(GObject.GObject):
 
         self._friends = {}
         self._path = os.path.join(env.get_profile_path(), 'friends')
+        self._save_sid = None
 
         self.load()
 
+        # Presence events are routed to the friend with the buddy's key,
+        # instead of every friend listening to the neighborhood
+        neighborhood_model = neighborhood.get_model()
+        neighborhood_model.connect('buddy-added', self.__buddy_added_cb)
+        neighborhood_model.connect('buddy-removed', self.__buddy_removed_cb)
+
+    def __buddy_added_cb(self, model_, buddy):
+        friend = self._friends.get(buddy.key)
+        if friend is not None:
+            friend._set_online_buddy(buddy)
+
+    def __buddy_removed_cb(self, model_, buddy):
+        friend = self._friends.get(buddy.key)
+        if friend is not None:
+            friend._remove_online_buddy()
+
     def has_buddy(self, buddy):
         return buddy.get_key() in self._friends
 
@@ -153,6 +176,26 @@ class Friends(GObject.GObject):
             logging.exception('Error parsing friends file')
 
     def save(self):
+        """
+        Save the friends list. Saves are collected for _SAVE_DELAY, so
+        adding or removing many friends writes the file once; use flush()
+        to write it right away.
+        """
+        if self._save_sid is None:
+            self._save_sid = GLib.timeout_add(_SAVE_DELAY, self.__save_cb)
+
+    def __save_cb(self):
+        self._save_sid = None
+        self._write()
+        return False
+
+    def flush(self):
+        if self._save_sid is not None:
+            GLib.source_remove(self._save_sid)
+            self._save_sid = None
+            self._write()
+
+    def _write(self):
         cp = ConfigParser()
 
         for friend in self:
@@ -160,9 +203,14 @@ class Friends(GObject.GObject):
             cp.add_section(section)
             cp.set(section, 'nick', friend.get_nick())
 
-        fileobject = open(self._path, 'w')
-        cp.write(fileobject)
-        fileobject.close()
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self._path))
+            with os.fdopen(fd, 'w') as fileobject:
+                cp.write(fileobject)
+            os.rename(temp_path, self._path)
+        except EnvironmentError:
+            logging.exception('Error while writing %s', self._path)
 
 
 def get_model():
@@ -170,3 +218,9 @@ def get_model():
     if _model is None:
         _model = Friends()
     return _model
+
+
+def flush():
+    """Write the pending changes of the friends list, if it was loaded"""
+    if _model is not None:
+        _model.flush()
@@ -18,6 +18,7 @@ from functools import partial
 from hashlib import sha1
 
 from gi.repository import GObject
+from gi.repository import GLib
 from gi.repository import Gio
 import dbus
 from dbus import PROPERTIES_IFACE
@@ -66,6 +67,12 @@ Time in seconds to wait when querying contact properties. Some jabber servers
 will be very slow in returning these queries, so just be patient.
 """
 
+_HANDLE_BATCH_DELAY = 100
+"""
+Time in milliseconds new contact handles are collected before they are
+resolved together with a single GetContactAttributes call.
+"""
+
 _model = None
 
 
@@ -195,17 +202,46 @@ class _Account(GObject.GObject):
         self._buddies_per_activity = {}
         self._activities_per_buddy = {}
 
+        # Contact attributes by handle; a handle keeps its contact id for
+        # the lifetime of the connection, so a buddy that comes back online
+        # does not need to be resolved again.
+        self._contact_attributes = {}
+        # BuddyInfo properties, activities and current activity by handle,
+        # kept up to date from the BuddyInfo signals, so a buddy that comes
+        # back online is announced again without querying the connection.
+        self._buddy_info = {}
+        self._buddy_activities = {}
+        self._current_activities = {}
+        self._pending_handles = set()
+        self._pending_handles_sid = None
+
         self._home_changed_hid = None
 
         self._start_listening()
 
     def _close_connection(self):
         self._connection = None
+        self._clear_contact_cache()
+        self._pending_handles = set()
+        if self._pending_handles_sid is not None:
+            GLib.source_remove(self._pending_handles_sid)
+            self._pending_handles_sid = None
         if self._home_changed_hid is not None:
             model = shell.get_model()
             model.disconnect(self._home_changed_hid)
             self._home_changed_hid = None
 
+    def _clear_contact_cache(self):
+        self._contact_attributes = {}
+        self._buddy_info = {}
+        self._buddy_activities = {}
+        self._current_activities = {}
+
+    def get_connection_path(self):
+        if self._connection is None:
+            return None
+        return self._connection.object_path
+
     def _start_listening(self):
         bus = dbus.Bus()
         obj = bus.get_object(ACCOUNT_MANAGER_SERVICE, self.object_path)
@@ -311,6 +347,8 @@ class _Account(GObject.GObject):
             self._activity_handles = {}
             self._buddies_per_activity = {}
             self._activities_per_buddy = {}
+            self._clear_contact_cache()
+            self._pending_handles = set()
 
             self.emit('disconnected')
 
@@ -427,6 +465,9 @@ class _Account(GObject.GObject):
     def __aliases_changed_cb(self, aliases):
         logging.debug('_Account.__aliases_changed_cb')
         for handle, alias in aliases:
+            if handle in self._contact_attributes:
+                self._contact_attributes[handle][
+                    CONNECTION_INTERFACE_ALIASING + '/alias'] = alias
             if handle in self._buddy_handles:
                 logging.debug('Got handle %r with nick %r, going to update',
                               handle, alias)
@@ -446,6 +487,8 @@ class _Account(GObject.GObject):
 
     def __buddy_info_updated_cb(self, handle, properties):
         logging.debug('_Account.__buddy_info_updated_cb %r', handle)
+        if handle in self._buddy_info:
+            self._buddy_info[handle].update(properties)
         if handle in self._buddy_handles:
             self.emit('buddy-updated', self._buddy_handles[handle], properties)
 
@@ -453,17 +496,20 @@ class _Account(GObject.GObject):
                                       room_handle):
         logging.debug('_Account.__current_activity_changed_cb %r %r %r',
                       contact_handle, activity_id, room_handle)
-        if contact_handle in self._buddy_handles:
-            contact_id = self._buddy_handles[contact_handle]
-            if not activity_id and room_handle:
-                activity_id = self._activity_handles.get(room_handle, '')
-            self.emit('current-activity-updated', contact_id, activity_id)
+        self._current_activities[contact_handle] = (activity_id, room_handle)
+        self._update_current_activity(contact_handle, activity_id,
+                                      room_handle)
 
     def __get_current_activity_cb(self, contact_handle, activity_id,
                                   room_handle):
         logging.debug('_Account.__get_current_activity_cb %r %r %r',
                       contact_handle, activity_id, room_handle)
+        self._current_activities[contact_handle] = (activity_id, room_handle)
+        self._update_current_activity(contact_handle, activity_id,
+                                      room_handle)
 
+    def _update_current_activity(self, contact_handle, activity_id,
+                                 room_handle):
         if contact_handle in self._buddy_handles:
             contact_id = self._buddy_handles[contact_handle]
             if not activity_id and room_handle:
@@ -471,9 +517,13 @@ class _Account(GObject.GObject):
             self.emit('current-activity-updated', contact_id, activity_id)
 
     def __buddy_activities_changed_cb(self, buddy_handle, activities):
-        self._update_buddy_activities(buddy_handle, activities)
+        self._buddy_activities[buddy_handle] = activities
+        if buddy_handle in self._buddy_handles or \
+                buddy_handle == self._self_handle:
+            self._update_buddy_activities(buddy_handle, activities)
 
-    def _update_buddy_activities(self, buddy_handle, activities):
+    def _update_buddy_activities(self, buddy_handle, activities,
+                                 query_current_activity=False):
         logging.debug('_Account._update_buddy_activities')
 
         if buddy_handle not in self._activities_per_buddy:
@@ -510,14 +560,7 @@ class _Account(GObject.GObject):
                     # Sometimes we'll get CurrentActivityChanged before we get
                     # to know about the activity so we miss the event. In that
                     # case, request again the current activity for this buddy.
-                    connection = self._connection[
-                        CONNECTION_INTERFACE_BUDDY_INFO]
-                    connection.GetCurrentActivity(
-                        buddy_handle,
-                        reply_handler=partial(self.__get_current_activity_cb,
-                                              buddy_handle),
-                        error_handler=partial(self.__error_handler_cb,
-                                              'BuddyInfo.GetCurrentActivity'))
+                    query_current_activity = True
 
             if activity_id not in self._buddies_per_activity:
                 self._buddies_per_activity[activity_id] = set()
@@ -535,6 +578,18 @@ class _Account(GObject.GObject):
             if activity_id not in current_activity_ids:
                 self._remove_buddy_from_activity(buddy_handle, activity_id)
 
+        # A buddy that is in no activity has no current activity either
+        if query_current_activity and activities and \
+                buddy_handle != self._self_handle:
+            connection = self._connection[CONNECTION_INTERFACE_BUDDY_INFO]
+            connection.GetCurrentActivity(
+                buddy_handle,
+                reply_handler=partial(self.__get_current_activity_cb,
+                                      buddy_handle),
+                error_handler=partial(self.__error_handler_cb,
+                                      'BuddyInfo.GetCurrentActivity'),
+                timeout=_QUERY_DBUS_TIMEOUT)
+
     def __get_properties_cb(self, room_handle, properties):
         logging.debug('_Account.__get_properties_cb %r %r', room_handle,
                       properties)
@@ -599,21 +654,50 @@ class _Account(GObject.GObject):
 
     def _add_buddy_handles(self, handles):
         logging.debug('_Account._add_buddy_handles %r', handles)
-        interfaces = [CONNECTION, CONNECTION_INTERFACE_ALIASING]
-        self._connection[CONNECTION_INTERFACE_CONTACTS].GetContactAttributes(
-            handles, interfaces, False,
-            reply_handler=self.__get_contact_attributes_cb,
-            error_handler=partial(self.__error_handler_cb,
-                                  'Contacts.GetContactAttributes'))
-
-    def __got_buddy_info_cb(self, handle, nick, properties):
+        self._pending_handles.update(handles)
+        if self._pending_handles_sid is None:
+            self._pending_handles_sid = GLib.timeout_add(
+                _HANDLE_BATCH_DELAY, self.__resolve_pending_handles_cb)
+
+    def __resolve_pending_handles_cb(self):
+        self._pending_handles_sid = None
+        handles = self._pending_handles
+        self._pending_handles = set()
+        if self._connection is None:
+            return False
+
+        cached = dict((handle, self._contact_attributes[handle])
+                      for handle in handles
+                      if handle in self._contact_attributes)
+        if cached:
+            self._add_contacts(cached)
+
+        handles = [handle for handle in handles if handle not in cached]
+        if handles:
+            logging.debug('_Account resolving %d handles', len(handles))
+            interfaces = [CONNECTION, CONNECTION_INTERFACE_ALIASING]
+            contacts = self._connection[CONNECTION_INTERFACE_CONTACTS]
+            contacts.GetContactAttributes(
+                handles, interfaces, False,
+                reply_handler=self.__get_contact_attributes_cb,
+                error_handler=partial(self.__error_handler_cb,
+                                      'Contacts.GetContactAttributes'))
+        return False
+
+    def __got_buddy_info_cb(self, handle, properties):
         logging.debug('_Account.__got_buddy_info_cb %r', handle)
-        self.emit('buddy-updated', self._buddy_handles[handle], properties)
+        self._buddy_info[handle] = properties
+        if handle in self._buddy_handles:
+            self.emit('buddy-updated', self._buddy_handles[handle],
+                      properties)
 
     def __get_contact_attributes_cb(self, attributes):
         logging.debug('_Account.__get_contact_attributes_cb %r',
                       attributes.keys())
+        self._contact_attributes.update(attributes)
+        self._add_contacts(attributes)
 
+    def _add_contacts(self, attributes):
         for handle in attributes.keys():
             nick = attributes[handle][CONNECTION_INTERFACE_ALIASING + '/alias']
 
@@ -634,43 +718,57 @@ class _Account(GObject.GObject):
 
                 contact_id = attributes[handle][CONNECTION + '/contact-id']
                 self._buddy_handles[handle] = contact_id
+                self.emit('buddy-added', contact_id, nick, handle)
 
                 if CONNECTION_INTERFACE_BUDDY_INFO in self._connection:
-                    connection = \
-                        self._connection[CONNECTION_INTERFACE_BUDDY_INFO]
-
-                    connection.GetProperties(
-                        handle,
-                        reply_handler=partial(self.__got_buddy_info_cb, handle,
-                                              nick),
-                        error_handler=partial(self.__error_handler_cb,
-                                              'BuddyInfo.GetProperties'),
-                        byte_arrays=True,
-                        timeout=_QUERY_DBUS_TIMEOUT)
-
-                    connection.GetActivities(
-                        handle,
-                        reply_handler=partial(self.__got_activities_cb,
-                                              handle),
-                        error_handler=partial(self.__error_handler_cb,
-                                              'BuddyInfo.GetActivities'),
-                        timeout=_QUERY_DBUS_TIMEOUT)
-
-                    connection.GetCurrentActivity(
-                        handle,
-                        reply_handler=partial(self.__get_current_activity_cb,
-                                              handle),
-                        error_handler=partial(self.__error_handler_cb,
-                                              'BuddyInfo.GetCurrentActivity'),
-                        timeout=_QUERY_DBUS_TIMEOUT)
+                    self._add_buddy_info(handle)
 
-                self.emit('buddy-added', contact_id, nick, handle)
+    def _add_buddy_info(self, handle):
+        connection = self._connection[CONNECTION_INTERFACE_BUDDY_INFO]
+
+        if handle in self._buddy_info:
+            self.emit('buddy-updated', self._buddy_handles[handle],
+                      self._buddy_info[handle])
+        else:
+            connection.GetProperties(
+                handle,
+                reply_handler=partial(self.__got_buddy_info_cb, handle),
+                error_handler=partial(self.__error_handler_cb,
+                                      'BuddyInfo.GetProperties'),
+                byte_arrays=True,
+                timeout=_QUERY_DBUS_TIMEOUT)
+
+        if handle in self._buddy_activities:
+            current_activity = self._current_activities.get(handle)
+            self._update_buddy_activities(
+                handle, self._buddy_activities[handle],
+                query_current_activity=current_activity is None)
+            if current_activity is not None:
+                self._update_current_activity(handle, *current_activity)
+        else:
+            # the current activity is asked for once the
+            # activities are known, and only if there are any
+            connection.GetActivities(
+                handle,
+                reply_handler=partial(self.__got_buddy_activities_cb,
+                                      handle),
+                error_handler=partial(self.__error_handler_cb,
+                                      'BuddyInfo.GetActivities'),
+                timeout=_QUERY_DBUS_TIMEOUT)
 
     def __got_activities_cb(self, buddy_handle, activities):
         logging.debug('_Account.__got_activities_cb %r %r', buddy_handle,
                       activities)
         self._update_buddy_activities(buddy_handle, activities)
 
+    def __got_buddy_activities_cb(self, buddy_handle, activities):
+        logging.debug('_Account.__got_buddy_activities_cb %r %r',
+                      buddy_handle, activities)
+        self._buddy_activities[buddy_handle] = activities
+        if buddy_handle in self._buddy_handles:
+            self._update_buddy_activities(buddy_handle, activities,
+                                          query_current_activity=True)
+
     def enable(self):
         logging.debug('_Account.enable %s', self.object_path)
         self._set_enabled(True)
@@ -693,6 +791,77 @@ class _Account(GObject.GObject):
         logging.debug('_Account.__set_enabled_cb success')
 
 
+class _Registry(object):
+    """
+    The buddies and activities in the neighborhood.
+
+    Buddies are stored by contact id and activities by activity id. The
+    registry also maintains indexes of buddies by key and by (account,
+    handle), and of activities by room handle, so that presence events can
+    be handled without scanning every buddy.
+    """
+
+    def __init__(self, owner):
+        self.buddies = {None: owner}
+        self.activities = {}
+        self._buddies_by_key = {}
+        self._buddies_by_handle = {}
+        self._activities_by_room = {}
+        if owner.key is not None:
+            self._buddies_by_key[owner.key] = owner
+
+    def add_buddy(self, contact_id, buddy):
+        self.buddies[contact_id] = buddy
+        if buddy.key is not None:
+            self._buddies_by_key[buddy.key] = buddy
+        if buddy.handle is not None:
+            accounts = self._buddies_by_handle.setdefault(buddy.handle, {})
+            accounts[buddy.account] = buddy
+
+    def remove_buddy(self, contact_id):
+        buddy = self.buddies.pop(contact_id)
+        if self._buddies_by_key.get(buddy.key) is buddy:
+            del self._buddies_by_key[buddy.key]
+
+        accounts = self._buddies_by_handle.get(buddy.handle, {})
+        if accounts.get(buddy.account) is buddy:
+            del accounts[buddy.account]
+            if not accounts:
+                del self._buddies_by_handle[buddy.handle]
+        return buddy
+
+    def set_buddy_key(self, buddy, key):
+        if self._buddies_by_key.get(buddy.key) is buddy:
+            del self._buddies_by_key[buddy.key]
+        buddy.props.key = key
+        if key is not None:
+            self._buddies_by_key[key] = buddy
+
+    def get_buddy_by_key(self, key):
+        return self._buddies_by_key.get(key, None)
+
+    def get_buddy_by_handle(self, contact_handle, account=None):
+        accounts = self._buddies_by_handle.get(contact_handle)
+        if not accounts:
+            return None
+        if account is not None:
+            return accounts.get(account, None)
+        return accounts.itervalues().next()
+
+    def add_activity(self, activity_id, activity):
+        self.activities[activity_id] = activity
+        self._activities_by_room[activity.room_handle] = activity
+
+    def remove_activity(self, activity_id):
+        activity = self.activities.pop(activity_id)
+        if self._activities_by_room.get(activity.room_handle) is activity:
+            del self._activities_by_room[activity.room_handle]
+        return activity
+
+    def get_activity_by_room(self, room_handle):
+        return self._activities_by_room.get(room_handle, None)
+
+
 class Neighborhood(GObject.GObject):
     __gsignals__ = {
         'activity-added': (GObject.SignalFlags.RUN_FIRST, None,
@@ -708,8 +877,9 @@ class Neighborhood(GObject.GObject):
     def __init__(self):
         GObject.GObject.__init__(self)
 
-        self._buddies = {None: get_owner_instance()}
-        self._activities = {}
+        self._registry = _Registry(get_owner_instance())
+        self._buddies = self._registry.buddies
+        self._activities = self._registry.activities
         self._link_local_account = None
         self._server_account = None
         self._shell_model = shell.get_model()
@@ -921,7 +1091,7 @@ class Neighborhood(GObject.GObject):
             account=account.object_path,
             contact_id=contact_id,
             handle=handle)
-        self._buddies[contact_id] = buddy
+        self._registry.add_buddy(contact_id, buddy)
 
     def __buddy_updated_cb(self, account, contact_id, properties):
         logging.debug('__buddy_updated_cb %r', contact_id)
@@ -943,7 +1113,7 @@ class Neighborhood(GObject.GObject):
             buddy.props.color = XoColor(str(properties['color']))
 
         if 'key' in properties:
-            buddy.props.key = properties['key']
+            self._registry.set_buddy_key(buddy, properties['key'])
 
         nick_key = CONNECTION_INTERFACE_ALIASING + '/alias'
         if nick_key in properties:
@@ -959,8 +1129,7 @@ class Neighborhood(GObject.GObject):
                           'contact_id %r', contact_id)
             return
 
-        buddy = self._buddies[contact_id]
-        del self._buddies[contact_id]
+        buddy = self._registry.remove_buddy(contact_id)
 
         if buddy.props.key is not None:
             self.emit('buddy-removed', buddy)
@@ -972,7 +1141,7 @@ class Neighborhood(GObject.GObject):
             return
 
         activity = ActivityModel(activity_id, room_handle)
-        self._activities[activity_id] = activity
+        self._registry.add_activity(activity_id, activity)
 
     def __activity_updated_cb(self, account, activity_id, properties):
         logging.debug('__activity_updated_cb %r %r', activity_id, properties)
@@ -1008,8 +1177,7 @@ class Neighborhood(GObject.GObject):
             logging.debug('Unknown activity with id %s. Already removed?',
                           activity_id)
             return
-        activity = self._activities[activity_id]
-        del self._activities[activity_id]
+        activity = self._registry.remove_activity(activity_id)
         self._shell_model.remove_shared_activity(activity_id)
 
         if activity.props.bundle is not None:
@@ -1070,25 +1238,23 @@ class Neighborhood(GObject.GObject):
         return self._buddies.values()
 
     def get_buddy_by_key(self, key):
-        for buddy in self._buddies.values():
-            if buddy.key == key:
-                return buddy
-        return None
+        return self._registry.get_buddy_by_key(key)
 
-    def get_buddy_by_handle(self, contact_handle):
-        for buddy in self._buddies.values():
-            if not buddy.is_owner() and buddy.handle == contact_handle:
-                return buddy
+    def get_buddy_by_handle(self, contact_handle, account=None):
+        return self._registry.get_buddy_by_handle(contact_handle, account)
+
+    def get_account_path(self, connection_path):
+        for account in (self._link_local_account, self._server_account):
+            if account is not None and \
+                    account.get_connection_path() == connection_path:
+                return account.object_path
         return None
 
     def get_activity(self, activity_id):
         return self._activities.get(activity_id, None)
 
     def get_activity_by_room(self, room_handle):
-        for activity in self._activities.values():
-            if activity.room_handle == room_handle:
-                return activity
-        return None
+        return self._registry.get_activity_by_room(room_handle)
 
     def get_activities(self):
         return self._activities.values()
@@ -25,6 +25,7 @@ import uuid
 import dbus
 import dbus.service
 from gi.repository import GObject
+from gi.repository import GLib
 import ConfigParser
 from gi.repository import Gio
 import ctypes
@@ -206,6 +207,9 @@ _interfaces = None
 
 _nm_device_state_reason_description = None
 
+# Interval (ms) at which coalesced signal strength updates are delivered
+_STRENGTH_REFRESH_INTERVAL = 2000
+
 
 def get_error_by_reason(reason):
     global _nm_device_state_reason_description
@@ -639,13 +643,14 @@ class AccessPoint(GObject.GObject):
                           ([GObject.TYPE_PYOBJECT])),
     }
 
-    def __init__(self, device, model):
+    def __init__(self, device, model, monitor=None):
         GObject.GObject.__init__(self)
         self.device = device
         self.model = model
 
         self._initialized = False
         self._bus = dbus.SystemBus()
+        self._monitor = monitor
 
         self.ssid = ''
         self.strength = 0
@@ -661,6 +666,10 @@ class AccessPoint(GObject.GObject):
                            reply_handler=self._ap_properties_changed_cb,
                            error_handler=self._get_all_props_error_cb)
 
+        if self._monitor is not None:
+            # property changes are dispatched by the monitor
+            return
+
         self._bus.add_signal_receiver(self._ap_properties_changed_cb,
                                       signal_name='PropertiesChanged',
                                       path=self.model.object_path,
@@ -734,13 +743,110 @@ class AccessPoint(GObject.GObject):
     def _ap_properties_changed_cb(self, properties):
         self._update_properties(properties)
 
+    def is_initialized(self):
+        return self._initialized
+
     def disconnect(self):
+        if self._monitor is not None:
+            self._monitor.remove(self)
+            return
+
         self._bus.remove_signal_receiver(self._ap_properties_changed_cb,
                                          signal_name='PropertiesChanged',
                                          path=self.model.object_path,
                                          dbus_interface=NM_ACCESSPOINT_IFACE)
 
 
+class AccessPointMonitor(GObject.GObject):
+    """Track the access points seen by a wireless device
+
+    A single PropertiesChanged receiver serves all the access points of
+    the device, which are kept by object path. Changes that only touch
+    the signal strength are coalesced and delivered together through the
+    'strength-changed' signal at most every _STRENGTH_REFRESH_INTERVAL.
+    """
+
+    __gsignals__ = {
+        'strength-changed': (GObject.SignalFlags.RUN_FIRST, None,
+                             ([GObject.TYPE_PYOBJECT])),
+    }
+
+    def __init__(self, device):
+        GObject.GObject.__init__(self)
+        self.device = device
+
+        self._bus = dbus.SystemBus()
+        self._access_points = {}
+        self._pending_strength = {}
+        self._refresh_sid = None
+
+        self._bus.add_signal_receiver(self.__properties_changed_cb,
+                                      signal_name='PropertiesChanged',
+                                      dbus_interface=NM_ACCESSPOINT_IFACE,
+                                      path_keyword='path',
+                                      byte_arrays=True)
+
+    def add(self, model):
+        ap = AccessPoint(self.device, model, self)
+        self._access_points[model.object_path] = ap
+        return ap
+
+    def remove(self, ap):
+        path = ap.model.object_path
+        if self._access_points.get(path) is ap:
+            del self._access_points[path]
+            self._pending_strength.pop(path, None)
+
+    def get(self, path):
+        return self._access_points.get(path)
+
+    def __properties_changed_cb(self, properties, path=None):
+        ap = self._access_points.get(path)
+        if ap is None:
+            return
+
+        if properties.keys() != ['Strength']:
+            # apply right away, along with any strength still pending
+            strength = self._pending_strength.pop(path, None)
+            if strength is not None and 'Strength' not in properties:
+                properties = dict(properties)
+                properties['Strength'] = strength
+            ap._update_properties(properties)
+            return
+
+        self._pending_strength[path] = properties['Strength']
+        if self._refresh_sid is None:
+            self._refresh_sid = GLib.timeout_add(
+                _STRENGTH_REFRESH_INTERVAL, self.__refresh_cb)
+
+    def __refresh_cb(self):
+        self._refresh_sid = None
+
+        changed = []
+        for path, strength in self._pending_strength.iteritems():
+            ap = self._access_points[path]
+            if ap.strength == strength:
+                continue
+            ap.strength = strength
+            if ap.is_initialized():
+                changed.append(ap)
+        self._pending_strength = {}
+
+        if changed:
+            self.emit('strength-changed', changed)
+        return False
+
+    def disconnect(self):
+        self._bus.remove_signal_receiver(self.__properties_changed_cb,
+                                         signal_name='PropertiesChanged',
+                                         dbus_interface=NM_ACCESSPOINT_IFACE)
+        if self._refresh_sid is not None:
+            GLib.source_remove(self._refresh_sid)
+            self._refresh_sid = None
+        self._access_points = {}
+        self._pending_strength = {}
+
+
 def get_manager():
     global _network_manager
     if _network_manager is None:
@@ -755,7 +861,6 @@ def _get_settings():
         obj = dbus.SystemBus().get_object(NM_SERVICE, NM_SETTINGS_PATH)
         _nm_settings = dbus.Interface(obj, NM_SETTINGS_IFACE)
         _migrate_old_wifi_connections()
-        _migrate_old_gsm_connection()
     return _nm_settings
 
 
@@ -785,6 +890,8 @@ def _add_and_activate_error_cb(err):
 class Connection(GObject.GObject):
     __gsignals__ = {
         'removed': (GObject.SignalFlags.RUN_LAST, None, ()),
+        'updated': (GObject.SignalFlags.RUN_LAST, None, ()),
+        'load-failed': (GObject.SignalFlags.RUN_LAST, None, ()),
     }
 
     def __init__(self, bus, path):
@@ -795,10 +902,32 @@ class Connection(GObject.GObject):
             'Removed', self._removed_cb)
         self._updated_handle = self._connection.connect_to_signal(
             'Updated', self._updated_cb)
-        self._settings = self._connection.GetSettings(byte_arrays=True)
+        self._settings = None
+
+    def load_settings(self):
+        """
+        Fetch the settings asynchronously; 'updated' is emitted once they
+        arrive.
+        """
+        self._connection.GetSettings(
+            byte_arrays=True,
+            reply_handler=self.__get_settings_cb,
+            error_handler=self.__get_settings_error_cb)
+
+    def __get_settings_cb(self, settings):
+        self._settings = settings
+        self.emit('updated')
+
+    def __get_settings_error_cb(self, error):
+        logging.error('Failed to get settings of %s: %s', self.get_path(),
+                      error)
+        self.emit('load-failed')
+
+    def is_loaded(self):
+        return self._settings is not None
 
     def _updated_cb(self):
-        self._settings = self._connection.GetSettings(byte_arrays=True)
+        self.load_settings()
 
     def _removed_cb(self):
         self._updated_handle.remove()
@@ -808,7 +937,7 @@ class Connection(GObject.GObject):
     def get_settings(self, stype=None):
         if not stype:
             return self._settings
-        elif stype in self._settings:
+        elif self._settings is not None and stype in self._settings:
             return self._settings[stype]
         else:
             return None
@@ -840,36 +969,176 @@ class Connection(GObject.GObject):
     def get_id(self):
         return self.get_settings('connection')['id']
 
+    def get_uuid(self):
+        return self.get_settings('connection').get('uuid')
+
     def get_path(self):
         return self._connection.object_path
 
 
-class Connections(object):
+class Connections(GObject.GObject):
+    """
+    The saved NetworkManager connections.
+
+    The connections are listed, and the settings of all of them requested,
+    without waiting for each other. A connection is listed once its
+    settings have arrived; 'connection-added' is emitted then, and
+    'connection-updated' each time its settings change afterwards. The
+    listed connections are indexed by SSID, by UUID and by id; lookups
+    only see the connections listed so far and never wait for the others,
+    so callers that need to know about a connection either listen to
+    these signals or use call_when_loaded().
+    """
+
+    __gsignals__ = {
+        'connection-added': (GObject.SignalFlags.RUN_FIRST, None,
+                             ([object])),
+        'connection-updated': (GObject.SignalFlags.RUN_FIRST, None,
+                               ([object])),
+        'connection-removed': (GObject.SignalFlags.RUN_FIRST, None,
+                               ([object])),
+    }
 
     def __init__(self):
+        GObject.GObject.__init__(self)
+
         self._bus = dbus.SystemBus()
         self._connections = []
+        self._pending = {}
+        self._paths = set()
+        self._listed = False
+        self._loaded = False
+        self._loaded_callbacks = []
+        self._indexed_keys = {}
+        self._by_ssid = {}
+        self._by_uuid = {}
+        self._by_id = {}
 
         settings = _get_settings()
         settings.connect_to_signal('NewConnection', self._new_connection_cb)
+        settings.ListConnections(
+            reply_handler=self.__list_connections_cb,
+            error_handler=self.__list_connections_error_cb)
 
-        for connection_o in settings.ListConnections():
+    def __list_connections_cb(self, connections_o):
+        for connection_o in connections_o:
             self._monitor_connection(connection_o)
+        self._listed = True
+        self._check_loaded()
+
+    def __list_connections_error_cb(self, error):
+        logging.error('Failed to list the connections: %s', error)
+        self._listed = True
+        self._check_loaded()
+
+    def is_loaded(self):
+        """
+        Whether the settings of the connections saved at startup have all
+        been received, or have failed to load.
+        """
+        return self._loaded
+
+    def call_when_loaded(self, callback):
+        if self._loaded:
+            callback()
+        else:
+            self._loaded_callbacks.append(callback)
+
+    def _check_loaded(self):
+        # a NewConnection received before the list must not count
+        if self._loaded or not self._listed or self._pending:
+            return
+
+        self._loaded = True
+        callbacks = self._loaded_callbacks
+        self._loaded_callbacks = []
+        for callback in callbacks:
+            callback()
 
     def get_list(self):
         return self._connections
 
+    def find_by_ssid(self, ssid):
+        return self._find(self._by_ssid, ssid)
+
+    def find_by_uuid(self, connection_uuid):
+        return self._find(self._by_uuid, connection_uuid)
+
+    def find_by_id(self, connection_id):
+        return self._find(self._by_id, connection_id)
+
+    def _find(self, index, key):
+        connections = index.get(key)
+        if connections:
+            return connections[0]
+        return None
+
     def _monitor_connection(self, connection_o):
+        # NewConnection may have been received for it before the list
+        if connection_o in self._paths:
+            return
+
+        self._paths.add(connection_o)
         connection = Connection(self._bus, connection_o)
+        connection.connect('updated', self._connection_updated_cb)
         connection.connect('removed', self._connection_removed_cb)
-        self._connections.append(connection)
+        connection.connect('load-failed', self._connection_load_failed_cb)
+        self._pending[connection_o] = connection
+        connection.load_settings()
 
     def _new_connection_cb(self, connection_o):
         self._monitor_connection(connection_o)
 
+    def _connection_updated_cb(self, connection):
+        self._unindex(connection)
+        self._index(connection)
+        if self._pending.pop(connection.get_path(), None) is not None:
+            self._connections.append(connection)
+            self.emit('connection-added', connection)
+            self._check_loaded()
+        else:
+            self.emit('connection-updated', connection)
+
+    def _connection_load_failed_cb(self, connection):
+        if self._pending.pop(connection.get_path(), None) is not None:
+            self._disconnect_connection(connection)
+            self._check_loaded()
+
     def _connection_removed_cb(self, connection):
+        self._disconnect_connection(connection)
+        if self._pending.pop(connection.get_path(), None) is None:
+            self._unindex(connection)
+            self._connections.remove(connection)
+            self.emit('connection-removed', connection)
+        else:
+            self._check_loaded()
+
+    def _disconnect_connection(self, connection):
+        self._paths.discard(connection.get_path())
+        connection.disconnect_by_func(self._connection_updated_cb)
         connection.disconnect_by_func(self._connection_removed_cb)
-        self._connections.remove(connection)
+        connection.disconnect_by_func(self._connection_load_failed_cb)
+
+    def _index(self, connection):
+        keys = (connection.get_ssid(), connection.get_uuid(),
+                connection.get_id())
+        self._indexed_keys[connection] = keys
+        for index, key in zip((self._by_ssid, self._by_uuid, self._by_id),
+                              keys):
+            if key is not None:
+                index.setdefault(key, []).append(connection)
+
+    def _unindex(self, connection):
+        keys = self._indexed_keys.pop(connection, None)
+        if keys is None:
+            return
+        for index, key in zip((self._by_ssid, self._by_uuid, self._by_id),
+                              keys):
+            if key is None:
+                continue
+            index[key].remove(connection)
+            if not index[key]:
+                del index[key]
 
 
 def get_wireless_interfaces():
@@ -894,6 +1163,8 @@ def get_connections():
     global _connections
     if _connections is None:
         _connections = Connections()
+        # the GSM connection can only be looked for once they are listed
+        _connections.call_when_loaded(_migrate_old_gsm_connection)
     return _connections
 
 
@@ -901,17 +1172,15 @@ def find_connection_by_ssid(ssid):
     # FIXME: this check should be more extensive.
     # it should look at mode (infra/adhoc), band, security, and really
     # anything that is stored in the settings.
-    for connection in get_connections().get_list():
-        if connection.get_ssid() == ssid:
-            return connection
-    return None
+    return get_connections().find_by_ssid(ssid)
 
 
 def find_connection_by_id(connection_id):
-    for connection in get_connections().get_list():
-        if connection.get_id() == connection_id:
-            return connection
-    return None
+    return get_connections().find_by_id(connection_id)
+
+
+def find_connection_by_uuid(connection_uuid):
+    return get_connections().find_by_uuid(connection_uuid)
 
 
 def _add_connection_reply_cb(connection):
@@ -43,11 +43,6 @@ class OlpcMeshManager(object):
            that works. Each entry in the list specifies the channel and
            whether to seek an XS or not."""
 
-        # Ensure that all the connections we'll use later are present
-        for channel in (1, 6, 11):
-            self._ensure_connection_exists(channel, xs_hosted=True)
-            self._ensure_connection_exists(channel, xs_hosted=False)
-
         props = dbus.Interface(self.mesh_device, dbus.PROPERTIES_IFACE)
         props.Get(network.NM_DEVICE_IFACE, 'State',
                   reply_handler=self.__get_mesh_state_reply_cb,
@@ -72,6 +67,15 @@ class OlpcMeshManager(object):
         self._mesh_device_state = network.NM_DEVICE_STATE_UNKNOWN
         self._eth_device_state = network.NM_DEVICE_STATE_UNKNOWN
 
+        network.get_connections().call_when_loaded(
+            self.__connections_loaded_cb)
+
+    def __connections_loaded_cb(self):
+        # Ensure that all the connections we'll use later are present
+        for channel in (1, 6, 11):
+            self._ensure_connection_exists(channel, xs_hosted=True)
+            self._ensure_connection_exists(channel, xs_hosted=False)
+
         if self._add_connections_pending == 0:
             self.ready()
 
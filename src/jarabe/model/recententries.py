@@ -0,0 +1,266 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from gi.repository import GObject
+from gi.repository import GLib
+
+from sugar3.datastore import datastore
+
+
+MAX_ENTRIES = 5
+PROPERTIES = ['uid', 'title', 'icon-color', 'activity', 'activity_id',
+              'mime_type', 'mountpoint', 'timestamp']
+
+_model = None
+
+
+class RecentEntriesModel(GObject.GObject):
+    """Most recent Journal entries of the activities being watched
+
+    The activities watched in the same main loop iteration are looked up
+    with a single datastore query, and the lists are then kept up to date
+    from the datastore signals instead of being queried again.
+
+    When the grouped query is truncated, the activities that came back
+    with a short list are marked incomplete; fetch() completes them, and
+    is meant to be called when their list is actually displayed. A list
+    is also marked incomplete when an update leaves it unclear which
+    entry belongs at its end.
+
+    Every watch() is meant to be balanced by an unwatch().
+    """
+
+    __gsignals__ = {
+        'changed': (GObject.SignalFlags.RUN_FIRST, None,
+                    ([GObject.TYPE_PYOBJECT])),
+    }
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+
+        self._entries = {}
+        self._watchers = {}
+        self._bundle_by_uid = {}
+        self._complete = set()
+        self._pending = set()
+        self._fetching = set()
+        self._query_sid = None
+
+        datastore.updated.connect(self.__datastore_updated_cb)
+        datastore.deleted.connect(self.__datastore_deleted_cb)
+
+    def watch(self, bundle_id):
+        self._watchers[bundle_id] = self._watchers.get(bundle_id, 0) + 1
+        if bundle_id in self._entries or bundle_id in self._pending:
+            return
+
+        self._pending.add(bundle_id)
+        if self._query_sid is None:
+            self._query_sid = GLib.idle_add(self.__query_pending_cb)
+
+    def unwatch(self, bundle_id):
+        watchers = self._watchers.get(bundle_id, 0) - 1
+        if watchers > 0:
+            self._watchers[bundle_id] = watchers
+            return
+
+        self._watchers.pop(bundle_id, None)
+        self._pending.discard(bundle_id)
+        self._complete.discard(bundle_id)
+        for entry in self._entries.pop(bundle_id, []):
+            del self._bundle_by_uid[entry['uid']]
+
+    def get_entries(self, bundle_id):
+        return self._entries.get(bundle_id, [])
+
+    def is_complete(self, bundle_id):
+        return bundle_id in self._complete
+
+    def fetch(self, bundle_id):
+        if bundle_id not in self._entries or \
+                bundle_id in self._complete or bundle_id in self._fetching:
+            return
+
+        self._fetching.add(bundle_id)
+        self._find([bundle_id], MAX_ENTRIES)
+
+    def _find(self, bundle_ids, limit):
+        datastore.find({'activity': bundle_ids}, sorting=['+timestamp'],
+                       limit=limit, properties=PROPERTIES,
+                       reply_handler=lambda entries, total_count:
+                       self.__find_reply_cb(bundle_ids, entries,
+                                            total_count),
+                       error_handler=lambda error:
+                       self.__find_error_cb(bundle_ids, error))
+
+    def __query_pending_cb(self):
+        self._query_sid = None
+
+        bundle_ids = list(self._pending)
+        self._pending = set()
+        if not bundle_ids:
+            return False
+
+        for bundle_id in bundle_ids:
+            self._entries.setdefault(bundle_id, [])
+        self._fetching.update(bundle_ids)
+        self._find(bundle_ids, MAX_ENTRIES * len(bundle_ids))
+        return False
+
+    def __find_reply_cb(self, bundle_ids, entries, total_count):
+        self._fetching.difference_update(bundle_ids)
+
+        found = dict((bundle_id, []) for bundle_id in bundle_ids)
+        for entry in entries:
+            # If there's a problem with the DS index, we may get entries
+            # not related to the activities we asked for.
+            bundle_entries = found.get(entry.get('activity'))
+            if bundle_entries is not None and \
+                    len(bundle_entries) < MAX_ENTRIES:
+                bundle_entries.append(entry)
+
+        truncated = total_count > len(entries)
+        missing = []
+        for bundle_id, bundle_entries in found.iteritems():
+            if bundle_id not in self._entries:
+                # stopped being watched in the meantime
+                continue
+
+            if truncated and not bundle_entries:
+                # older entries may exist, look for them in another round
+                missing.append(bundle_id)
+                continue
+
+            if not truncated or len(bundle_entries) == MAX_ENTRIES:
+                self._complete.add(bundle_id)
+            else:
+                self._complete.discard(bundle_id)
+            self._set_entries(bundle_id, bundle_entries)
+
+        if missing and len(missing) < len(bundle_ids):
+            self._fetching.update(missing)
+            self._find(missing, MAX_ENTRIES * len(missing))
+        elif missing:
+            # no progress was made, leave them to fetch()
+            for bundle_id in missing:
+                self._complete.discard(bundle_id)
+                self._set_entries(bundle_id, [])
+
+    def __find_error_cb(self, bundle_ids, error):
+        self._fetching.difference_update(bundle_ids)
+        logging.error('Error retrieving most recent activities: %r', error)
+
+    def _set_entries(self, bundle_id, entries):
+        for entry in self._entries.get(bundle_id, []):
+            del self._bundle_by_uid[entry['uid']]
+        for entry in entries:
+            self._bundle_by_uid[entry['uid']] = bundle_id
+        self._entries[bundle_id] = entries
+        self.emit('changed', bundle_id)
+
+    def _remove_uid(self, uid):
+        bundle_id = self._bundle_by_uid.pop(uid, None)
+        if bundle_id is None:
+            return None
+
+        entries = self._entries[bundle_id]
+        if len(entries) == MAX_ENTRIES:
+            # an older entry may now have to take its place
+            self._complete.discard(bundle_id)
+        self._entries[bundle_id] = \
+            [entry for entry in entries if entry['uid'] != uid]
+        return bundle_id
+
+    def __datastore_updated_cb(self, **kwargs):
+        uid = kwargs['object_id']
+        metadata = kwargs['metadata']
+        bundle_id = metadata.get('activity', '')
+
+        old_bundle_id = self._bundle_by_uid.get(uid)
+        if old_bundle_id is not None and old_bundle_id != bundle_id:
+            self._remove_uid(uid)
+            self.emit('changed', old_bundle_id)
+
+        if bundle_id not in self._entries:
+            return
+
+        entry = dict((key, metadata[key]) for key in PROPERTIES
+                     if key in metadata)
+        entry['uid'] = uid
+
+        # Metadata-only writes, like starring or renaming an entry, keep
+        # its timestamp, so it is placed by timestamp and not on top.
+        old_entries = self._entries[bundle_id]
+        entries = [old_entry for old_entry in old_entries
+                   if old_entry['uid'] != uid]
+        listed = len(entries) < len(old_entries)
+        complete = bundle_id in self._complete
+
+        position = _find_position(entries, entry)
+        if position is not None and position < len(entries):
+            entries.insert(position, entry)
+        elif position is not None and complete and \
+                len(old_entries) < MAX_ENTRIES:
+            # the list already held all the entries of the activity
+            entries.append(entry)
+        elif len(entries) == MAX_ENTRIES:
+            # older than all the entries of a full list
+            return
+        else:
+            # an entry that is not cached may belong before this one
+            self._complete.discard(bundle_id)
+            if not listed:
+                return
+
+        self._set_entries(bundle_id, entries[:MAX_ENTRIES])
+
+    def __datastore_deleted_cb(self, **kwargs):
+        bundle_id = self._remove_uid(kwargs['object_id'])
+        if bundle_id is not None:
+            self.emit('changed', bundle_id)
+
+
+def _get_timestamp(entry):
+    try:
+        return int(entry['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _find_position(entries, entry):
+    """
+    Position of entry in the most recent first entries, or None if it
+    cannot be told because a timestamp is missing.
+    """
+    timestamp = _get_timestamp(entry)
+    if timestamp is None:
+        return None
+
+    for position, listed_entry in enumerate(entries):
+        listed_timestamp = _get_timestamp(listed_entry)
+        if listed_timestamp is None:
+            return None
+        if timestamp >= listed_timestamp:
+            return position
+    return len(entries)
+
+
+def get_model():
+    global _model
+    if _model is None:
+        _model = RecentEntriesModel()
+    return _model
@@ -21,6 +21,8 @@ import os
 import logging
 
 from jarabe.model import shell
+from jarabe.model import bundleregistry
+from jarabe.model import friends
 
 
 _session_manager = None
@@ -94,6 +96,8 @@ class SessionManager(GObject.GObject):
         self.initiate_shutdown(self.MODE_REBOOT)
 
     def shutdown_completed(self):
+        bundleregistry.flush()
+        friends.flush()
         if self._logout_mode != self.MODE_LOGOUT:
             bus = dbus.SystemBus()
             if have_systemd():
@@ -48,103 +48,80 @@ An example::
 """
 
 import logging
+import hashlib
 from xml.etree.ElementTree import XML
 
-from gi.repository import GLib
-from gi.repository import GObject
-
 from sugar3.bundle.bundleversion import NormalizedVersion
 from sugar3.bundle.bundleversion import InvalidVersionError
 
 from jarabe import config
 from jarabe.model.update import BundleUpdate
-from jarabe.util.downloader import Downloader
+from jarabe.util.downloader import DownloadQueue
 
 _FIND_DESCRIPTION = \
     './/{http://www.w3.org/1999/02/22-rdf-syntax-ns#}Description'
 _FIND_VERSION = './/{http://www.mozilla.org/2004/em-rdf#}version'
 _FIND_LINK = './/{http://www.mozilla.org/2004/em-rdf#}updateLink'
 _FIND_SIZE = './/{http://www.mozilla.org/2004/em-rdf#}updateSize'
+_FIND_HASH = './/{http://www.mozilla.org/2004/em-rdf#}updateHash'
 
 _UPDATE_PATH = 'http://activities.sugarlabs.org/services/update-aslo.php'
 
 _logger = logging.getLogger('ASLO')
 
 
-class _UpdateChecker(GObject.GObject):
-    __gsignals__ = {
-        'check-complete': (GObject.SignalFlags.RUN_FIRST, None, (object,)),
-    }
-    _CHUNK_SIZE = 10240
+def _get_update_url(bundle):
+    # ASLO knows only about stable SP releases
+    major, minor = config.version.split('.')[0:2]
+    sp_version = '%s.%s' % (major, int(minor) + int(minor) % 2)
 
-    def __init__(self):
-        GObject.GObject.__init__(self)
-        self._bundle = None
+    return '%s?id=%s&appVersion=%s' % \
+        (_UPDATE_PATH, bundle.get_bundle_id(), sp_version)
 
-    def check(self, bundle):
-        # ASLO knows only about stable SP releases
-        major, minor = config.version.split('.')[0:2]
-        sp_version = '%s.%s' % (major, int(minor) + int(minor) % 2)
 
-        url = '%s?id=%s&appVersion=%s' % \
-            (_UPDATE_PATH, bundle.get_bundle_id(), sp_version)
+def _parse_update_info(bundle, data):
+    document = XML(data)
 
-        self._bundle = bundle
+    if document.find(_FIND_DESCRIPTION) is None:
+        _logger.debug('Bundle %s not available in the server for the '
+                      'version %s',
+                      bundle.get_bundle_id(),
+                      config.version)
+        return None
 
-        _logger.debug('Fetch %s', url)
-        self._downloader = Downloader(url)
-        self._downloader.connect('complete', self.__downloader_complete_cb)
-        self._downloader.download()
+    try:
+        version = NormalizedVersion(document.find(_FIND_VERSION).text)
+    except InvalidVersionError:
+        _logger.exception('Exception occurred while parsing version')
+        return None
 
-    def __downloader_complete_cb(self, downloader, result):
-        if isinstance(result, Exception):
-            self.emit('check-complete', result)
-            return
+    link = document.find(_FIND_LINK).text
 
-        if result is None:
-            _logger.error('No XML update data returned from ASLO')
-            return
+    try:
+        size = long(document.find(_FIND_SIZE).text) * 1024
+    except ValueError:
+        _logger.exception('Exception occurred while parsing size')
+        size = 0
 
-        document = XML(result.get_data())
-
-        if document.find(_FIND_DESCRIPTION) is None:
-            _logger.debug('Bundle %s not available in the server for the '
-                          'version %s',
-                          self._bundle.get_bundle_id(),
-                          config.version)
-            version = None
-            link = None
-            size = None
-            self.emit('check-complete', None)
-            return
-
-        try:
-            version = NormalizedVersion(document.find(_FIND_VERSION).text)
-        except InvalidVersionError:
-            _logger.exception('Exception occurred while parsing version')
-            self.emit('check-complete', None)
-            return
-
-        link = document.find(_FIND_LINK).text
-
-        try:
-            size = long(document.find(_FIND_SIZE).text) * 1024
-        except ValueError:
-            _logger.exception('Exception occurred while parsing size')
-            size = 0
-
-        if version > NormalizedVersion(self._bundle.get_activity_version()):
-            result = BundleUpdate(self._bundle.get_bundle_id(),
-                                  self._bundle.get_name(), version, link, size)
-        else:
-            result = None
+    update_hash = document.find(_FIND_HASH)
+    if update_hash is not None:
+        update_hash = update_hash.text
+        if update_hash.split(':', 1)[0] not in hashlib.algorithms:
+            _logger.debug('Ignoring unsupported update hash %s', update_hash)
+            update_hash = None
 
-        self.emit('check-complete', result)
+    if version > NormalizedVersion(bundle.get_activity_version()):
+        return BundleUpdate(bundle.get_bundle_id(), bundle.get_name(),
+                            version, link, size, update_hash=update_hash)
+    return None
 
 
 class AsloUpdater(object):
     """
     Track state while querying Activites.SugarLabs.Org for activity updates.
+
+    The bundles are checked concurrently through a DownloadQueue, and
+    progress is reported as each answer arrives.
     """
 
     def __init__(self):
@@ -152,33 +129,36 @@ class AsloUpdater(object):
         self._progress_cb = None
         self._cancelling = False
         self._updates = []
-        self._checker = _UpdateChecker()
-        self._checker.connect('check-complete', self._check_complete_cb)
+        self._queue = None
 
-    def _check_complete_cb(self, checker, result):
+    def _check_complete_cb(self, queue, bundle, result):
+        self._checked_bundles += 1
         if isinstance(result, Exception):
-            logging.warning("Failed to check bundle: %r", result)
-        elif isinstance(result, BundleUpdate):
-            self._updates.append(result)
-
+            logging.warning("Failed to check bundle %s: %r",
+                            bundle.get_bundle_id(), result)
+        elif result is None:
+            _logger.error('No XML update data returned from ASLO')
+        else:
+            try:
+                update = _parse_update_info(bundle, result.get_data())
+            except Exception:
+                _logger.exception('Failed to parse update data for %s',
+                                  bundle.get_bundle_id())
+                update = None
+            if update is not None:
+                self._updates.append(update)
+
+        if not self._cancelling:
+            progress = self._checked_bundles / \
+                float(self._total_bundles_to_check)
+            self._progress_cb(bundle.get_name(), progress)
+
+    def _queue_finished_cb(self, queue):
+        self._queue = None
         if self._cancelling:
             self._completion_cb(None)
         else:
-            GLib.idle_add(self._check_next_update)
-
-    def _check_next_update(self):
-        total = self._total_bundles_to_check
-        current = total - len(self._bundles_to_check)
-        progress = current / float(total)
-
-        if not self._bundles_to_check:
             self._completion_cb(self._updates)
-            return
-
-        bundle = self._bundles_to_check.pop()
-        _logger.debug("Checking %s", bundle.get_bundle_id())
-        self._progress_cb(bundle.get_name(), progress)
-        self._checker.check(bundle)
 
     def fetch_update_info(self, installed_bundles, auto, progress_cb,
                           completion_cb, error_cb):
@@ -187,12 +167,26 @@ class AsloUpdater(object):
         self._error_cb = error_cb
         self._cancelling = False
         self._updates = []
-        self._bundles_to_check = installed_bundles
-        self._total_bundles_to_check = len(self._bundles_to_check)
-        self._check_next_update()
+        self._checked_bundles = 0
+        self._total_bundles_to_check = len(installed_bundles)
+
+        if not installed_bundles:
+            self._completion_cb(self._updates)
+            return
+
+        self._progress_cb(None, 0)
+        self._queue = DownloadQueue()
+        self._queue.connect('complete', self._check_complete_cb)
+        self._queue.connect('finished', self._queue_finished_cb)
+        for bundle in installed_bundles:
+            url = _get_update_url(bundle)
+            _logger.debug('Fetch %s', url)
+            self._queue.add(bundle, url)
 
     def cancel(self):
         self._cancelling = True
+        if self._queue is not None:
+            self._queue.cancel()
 
     def clean(self):
         pass
@@ -43,6 +43,7 @@ from jarabe.util import httprange
 from jarabe.model import bundleregistry
 from jarabe.model.update import BundleUpdate
 from jarabe.util.downloader import Downloader
+from jarabe.util.downloader import DownloadQueue
 
 _logger = logging.getLogger('microformat')
 _MICROFORMAT_URL_PATH = 'org.sugarlabs.update'
@@ -186,9 +187,10 @@ class MicroformatUpdater(object):
      1. Query update URL and parse results
      2. For each activity update:
        a) If we already have this activity installed, use GIO to asynchronously
-          lookup the size of the download.
+          lookup the size of the download. These lookups run concurrently
+          through a DownloadQueue.
        b) If we don't have the activity installed, use MetadataLookup
-          to lookup activity name and size.
+          to lookup activity name and size, once the size lookups are done.
     """
     def __init__(self):
         self._icon_temp_files = []
@@ -224,13 +226,14 @@ class MicroformatUpdater(object):
         self._parser.close()
         _logger.debug("Found %d activities", len(self._parser.results))
         self._filter_results()
-        self._check_next_update()
+        self._check_sizes()
 
     def _filter_results(self):
         # Remove updates for which we already have an equivalent or newer
         # version installed. Queue the remaining ones to be checked.
         registry = bundleregistry.get_registry()
         self._bundles_to_check = []
+        self._bundles_to_lookup = []
         for bundle_id, data in self._parser.results.iteritems():
             # filter optional activities for automatic updates
             if self._auto and data[2] is True:
@@ -245,55 +248,77 @@ class MicroformatUpdater(object):
             name = bundle.get_name() if bundle else None
             bundle_update = BundleUpdate(bundle_id, name, data[0], data[1], 0,
                                          optional=data[2])
-            self._bundles_to_check.append(bundle_update)
-        self._total_bundles_to_check = len(self._bundles_to_check)
-        _logger.debug("%d results after filter", self._total_bundles_to_check)
 
-    def _check_next_update(self):
-        if self._cancelling or len(self._bundles_to_check) == 0:
-            self._completion_cb(self._updates)
-            return
+            # There is no need for a special name lookup for an automatic
+            # update. The name lookup is only for UI purposes, but we are
+            # running in the background.
+            if bundle_update.name is None and self._auto:
+                bundle_update.name = bundle_update.bundle_id
 
-        total = self._total_bundles_to_check
-        current = total - len(self._bundles_to_check)
-        progress = current / float(total)
+            if bundle_update.name is not None:
+                self._bundles_to_check.append(bundle_update)
+            else:
+                self._bundles_to_lookup.append(bundle_update)
+        self._total_bundles_to_check = len(self._bundles_to_check) + \
+            len(self._bundles_to_lookup)
+        self._checked_bundles = 0
+        _logger.debug("%d results after filter", self._total_bundles_to_check)
 
-        self._bundle_update = self._bundles_to_check.pop()
-        _logger.debug("Check %s", self._bundle_update.bundle_id)
+    def _check_sizes(self):
+        # if we know the name, we just perform an asynchronous size check;
+        # these run concurrently and are reported as they complete
+        if not self._bundles_to_check:
+            self._check_next_update()
+            return
 
-        # There is no need for a special name lookup for an automatic update.
-        # The name lookup is only for UI purposes, but we are running in the
-        # background.
-        if self._bundle_update.name is None and self._auto:
-            self._bundle_update.name = self._bundle_update.bundle_id
+        _logger.debug("Performing %d async size lookups",
+                      len(self._bundles_to_check))
+        self._queue = DownloadQueue()
+        self._queue.connect('complete', self._size_lookup_cb)
+        self._queue.connect('finished', self._size_lookups_finished_cb)
+        for bundle_update in self._bundles_to_check:
+            self._queue.add(bundle_update, bundle_update.link, 'get_size')
+        self._bundles_to_check = []
 
-        if self._bundle_update.name is not None:
-            # if we know the name, we just perform an asynchronous size check
-            _logger.debug("Performing async size lookup")
-            size_check = Downloader(self._bundle_update.link)
-            size_check.connect('complete', self._size_lookup_cb)
-            size_check.get_size()
-            self._progress_cb(self._bundle_update.name, progress)
-        else:
-            # if we don't know the name, we run a metadata lookup and get
-            # the size and name that way
-            _logger.debug("Performing metadata lookup")
-            namelookup = MetadataLookup(self._bundle_update.link)
-            namelookup.connect('complete', self._name_lookup_complete)
-            namelookup.run()
-            self._progress_cb(self._bundle_update.bundle_id, progress)
-
-    def _size_lookup_cb(self, downloader, result):
+    def _size_lookup_cb(self, queue, bundle_update, result):
+        self._checked_bundles += 1
         if isinstance(result, Exception):
-            _logger.warning("Failed to perform size lookup: %s", result)
+            _logger.warning("Failed to perform size lookup for %s: %s",
+                            bundle_update.bundle_id, result)
         else:
-            self._bundle_update.size = result
-            self._updates.append(self._bundle_update)
+            bundle_update.size = result
+            self._updates.append(bundle_update)
+
+        if not self._cancelling:
+            progress = self._checked_bundles / \
+                float(self._total_bundles_to_check)
+            self._progress_cb(bundle_update.name, progress)
 
+    def _size_lookups_finished_cb(self, queue):
+        self._queue = None
         GLib.idle_add(self._check_next_update)
 
+    def _check_next_update(self):
+        if self._cancelling or len(self._bundles_to_lookup) == 0:
+            self._completion_cb(self._updates)
+            return
+
+        progress = self._checked_bundles / float(self._total_bundles_to_check)
+
+        self._bundle_update = self._bundles_to_lookup.pop()
+        _logger.debug("Check %s", self._bundle_update.bundle_id)
+
+        # if we don't know the name, we run a metadata lookup and get
+        # the size and name that way
+        _logger.debug("Performing metadata lookup")
+        namelookup = MetadataLookup(self._bundle_update.link)
+        namelookup.connect('complete', self._name_lookup_complete)
+        namelookup.run()
+        self._progress_cb(self._bundle_update.bundle_id, progress)
+
     def _name_lookup_complete(self, lookup, result, size, icon_file_name):
         _logger.debug("Name lookup result: %r", result)
+        self._checked_bundles += 1
         if icon_file_name is not None:
             self._icon_temp_files.append(icon_file_name)
             logging.debug('Adding temporary file %s to list', icon_file_name)
@@ -325,12 +350,17 @@ class MicroformatUpdater(object):
         self._cancelling = False
         self._updates = []
         self._bundles_to_check = []
+        self._bundles_to_lookup = []
         self._total_bundles_to_check = 0
+        self._checked_bundles = 0
+        self._queue = None
         self._auto = auto
         self._query()
 
     def cancel(self):
         self._cancelling = True
+        if self._queue is not None:
+            self._queue.cancel()
 
     def clean(self):
         for filename in self._icon_temp_files:
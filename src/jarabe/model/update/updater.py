@@ -35,6 +35,7 @@ _UPDATE_KEYS_PATH = 'org.sugarlabs.update'
 _LAST_UPDATE_KEY = 'last-activity-update'
 _UPDATE_FREQUENCY_KEY = 'auto-update-frequency'
 _UPDATE_BACKEND_KEY = 'backend'
+_PARALLEL_DOWNLOADS_KEY = 'parallel-downloads'
 _URGENT_TRIGGER_FILE = os.path.expanduser('~/.sugar-update')
 
 STATE_IDLE = 0
@@ -77,12 +78,19 @@ class Updater(GObject.GObject):
 
         self._updates = None
         self._bundles_to_update = None
-        self._total_bundles_to_update = 0
-        self._bundle_update = None
         self._bundles_updated = None
         self._bundles_failed = None
 
-        self._downloader = None
+        # Updates are downloaded up to _max_downloads at a time, and each
+        # one is handed to the bundle registry for installation as soon as
+        # its download completes. Progress is weighted by download size.
+        self._max_downloads = 1
+        self._downloaders = {}
+        self._installs_pending = 0
+        self._weights = {}
+        self._total_weight = 0
+        self._done_weight = 0
+        self._downloaded_weight = {}
         self._cancelling = False
         self._state = STATE_IDLE
         self._auto = False
@@ -137,82 +145,122 @@ class Updater(GObject.GObject):
             raise UpdaterStateException()
 
         if bundle_ids is None:
-            self._bundles_to_update = self._updates
+            self._bundles_to_update = list(self._updates)
         else:
             self._bundles_to_update = []
             for bundle_update in self._updates:
                 if bundle_update.bundle_id in bundle_ids:
                     self._bundles_to_update.append(bundle_update)
 
-        self._total_bundles_to_update = len(self._bundles_to_update)
-        _logger.debug("Starting update of %d activities",
-                      self._total_bundles_to_update)
-        self._download_next_update()
-
-    def _download_next_update(self):
-        if self._cancelling:
-            self._finished(True)
-            return
+        settings = Gio.Settings(_UPDATE_KEYS_PATH)
+        self._max_downloads = max(1, settings.get_int(_PARALLEL_DOWNLOADS_KEY))
+        self._setup_progress(self._bundles_to_update)
+        _logger.debug("Starting update of %d activities, %d at a time",
+                      len(self._bundles_to_update), self._max_downloads)
 
-        if len(self._bundles_to_update) == 0:
+        if not self._bundles_to_update:
             self._finished()
             return
 
         self._state = STATE_DOWNLOADING
-        self._bundle_update = self._bundles_to_update.pop()
-        _logger.debug("Downloading update for %s",
-                      self._bundle_update.bundle_id)
+        self._start_downloads()
+
+    def _setup_progress(self, bundle_updates):
+        # Each update weighs its download size, twice: once for the
+        # download and once for the installation. Updates of unknown size
+        # weigh as much as the average known one.
+        sizes = [bundle_update.size for bundle_update in bundle_updates
+                 if bundle_update.size > 0]
+        default_weight = sum(sizes) / len(sizes) if sizes else 1
+
+        self._weights = {}
+        for bundle_update in bundle_updates:
+            self._weights[bundle_update] = bundle_update.size or default_weight
+        self._total_weight = sum(self._weights.values()) * 2
+        self._done_weight = 0
+        self._downloaded_weight = {}
+
+    def _emit_progress(self, state, name):
+        done = self._done_weight + sum(self._downloaded_weight.values())
+        progress = done / float(self._total_weight or 1)
+        self.emit('progress', state, name, progress)
+
+    def _start_downloads(self):
+        while self._bundles_to_update and not self._cancelling and \
+                len(self._downloaders) < self._max_downloads:
+            bundle_update = self._bundles_to_update.pop(0)
+            _logger.debug("Downloading update for %s",
+                          bundle_update.bundle_id)
+            self._emit_progress(STATE_DOWNLOADING, bundle_update.name)
+
+            downloader = Downloader(bundle_update.link)
+            downloader.connect('progress', self.__downloader_progress_cb,
+                               bundle_update)
+            downloader.connect('complete', self.__downloader_complete_cb,
+                               bundle_update)
+            self._downloaders[downloader] = bundle_update
+            self._downloaded_weight[bundle_update] = 0
+            downloader.download_to_temp(bundle_update.update_hash)
+
+    def __downloader_complete_cb(self, downloader, result, bundle_update):
+        del self._downloaders[downloader]
+        del self._downloaded_weight[bundle_update]
 
-        total = self._total_bundles_to_update * 2
-        current = total - len(self._bundles_to_update) * 2 - 2
-        progress = current / float(total)
-        self.emit('progress', self._state, self._bundle_update.name, progress)
+        if self._cancelling:
+            self._cleanup_downloader(downloader)
+        elif isinstance(result, Exception):
+            _logger.error('Error downloading update for %s: %s',
+                          bundle_update.bundle_id, result)
+            self._cleanup_downloader(downloader)
+            self._bundles_failed.append(bundle_update)
+            self._done_weight += self._weights[bundle_update] * 2
+        else:
+            self._done_weight += self._weights[bundle_update]
+            self._install_update(bundle_update,
+                                 downloader.get_local_file_path())
 
-        self._downloader = Downloader(self._bundle_update.link)
-        self._downloader.connect('progress', self.__downloader_progress_cb)
-        self._downloader.connect('complete', self.__downloader_complete_cb)
-        self._downloader.download_to_temp()
+        self._start_downloads()
+        self._check_finished()
 
-    def __downloader_complete_cb(self, downloader, result):
-        if self._cancelling:
-            self._cleanup_downloader()
-            self._finished(True)
+    def __downloader_progress_cb(self, downloader, progress, bundle_update):
+        if bundle_update not in self._downloaded_weight:
             return
 
-        if isinstance(result, Exception):
-            _logger.error('Error downloading update: %s', result)
-            self._cleanup_downloader()
-            self._bundles_failed.append(self._bundle_update)
-            self._download_next_update()
-        else:
-            self._install_update(self._bundle_update,
-                                 self._downloader.get_local_file_path())
-            self._downloader = None
-
-    def __downloader_progress_cb(self, downloader, progress):
-        total = self._total_bundles_to_update * 2
-        current = total - len(self._bundles_to_update) * 2 - 2 + progress
-        progress = current / float(total)
-        self.emit('progress', self._state, self._bundle_update.name, progress)
+        self._downloaded_weight[bundle_update] = \
+            self._weights[bundle_update] * progress
+        self._emit_progress(STATE_DOWNLOADING, bundle_update.name)
 
     def _install_update(self, bundle_update, local_file_path):
-        self._state = STATE_UPDATING
-        total = self._total_bundles_to_update
-        current = total - len(self._bundles_to_update) - 0.5
-        progress = current / float(total)
+        if not self._downloaders and not self._bundles_to_update:
+            self._state = STATE_UPDATING
 
         _logger.debug("Installing update for %s", bundle_update.bundle_id)
-        self.emit('progress', self._state, bundle_update.name, progress)
+        self._emit_progress(STATE_UPDATING, bundle_update.name)
+
+        try:
+            bundle = bundle_from_archive(local_file_path)
+        except Exception:
+            _logger.exception('Error opening update for %s',
+                              bundle_update.bundle_id)
+            try:
+                os.unlink(local_file_path)
+            except OSError:
+                pass
+            self._bundles_failed.append(bundle_update)
+            self._done_weight += self._weights[bundle_update]
+            return
 
-        current += 0.5
-        bundle = bundle_from_archive(local_file_path)
+        self._installs_pending += 1
         registry = bundleregistry.get_registry()
-        registry.install_async(bundle, self._bundle_installed_cb, current)
+        registry.install_async(bundle, self._bundle_installed_cb,
+                               bundle_update,
+                               priority=bundleregistry.INSTALL_PRIORITY_BATCH)
 
-    def _bundle_installed_cb(self, bundle, result, progress):
+    def _bundle_installed_cb(self, bundle, result, bundle_update):
         _logger.debug("%s installed: %r", bundle.get_bundle_id(), result)
-        progress = progress / float(self._total_bundles_to_update)
-        self.emit('progress', self._state, bundle.get_name(), progress)
+        self._installs_pending -= 1
+        self._done_weight += self._weights[bundle_update]
+        self._emit_progress(STATE_UPDATING, bundle.get_name())
 
         # Remove downloaded bundle archive
         try:
@@ -226,7 +274,20 @@ class Updater(GObject.GObject):
             self._bundles_failed.append(bundle)
 
         # do it in idle so the UI has a chance to refresh
-        GLib.idle_add(self._download_next_update)
+        GLib.idle_add(self._check_finished)
+
+    def _check_finished(self):
+        if self._state not in (STATE_DOWNLOADING, STATE_UPDATING):
+            return False
+
+        if self._downloaders or self._installs_pending:
+            return False
+
+        if self._cancelling:
+            self._finished(True)
+        elif not self._bundles_to_update:
+            self._finished()
+        return False
 
     def _finished(self, cancelled=False):
         self._state = STATE_IDLE
@@ -251,14 +312,11 @@ class Updater(GObject.GObject):
 
         self._cancelling = True
         self._model.cancel()
-        if self._downloader:
-            self._downloader.cancel()
-
-    def _cleanup_downloader(self):
-        if self._downloader is None:
-            return
+        for downloader in self._downloaders.keys():
+            downloader.cancel()
 
-        file_path = self._downloader.get_local_file_path()
+    def _cleanup_downloader(self, downloader):
+        file_path = downloader.get_local_file_path()
         if file_path is not None:
             try:
                 os.unlink(file_path)
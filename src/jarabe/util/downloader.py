@@ -18,10 +18,13 @@
 import os
 from urlparse import urlparse
 import tempfile
+import hashlib
+from collections import deque
 
 import gi
 gi.require_version('Soup', '2.4')
 from gi.repository import GObject
+from gi.repository import GLib
 from gi.repository import Soup
 from gi.repository import Gio
 
@@ -31,6 +34,21 @@ from sugar3 import env
 _session = None
 
 SOUP_STATUS_CANCELLED = 1
+SOUP_STATUS_PARTIAL_CONTENT = 206
+SOUP_STATUS_RANGE_NOT_SATISFIABLE = 416
+
+# A download to a file is paused while more than this many bytes are
+# waiting to be written, and resumed once half of them have been written.
+_MAX_BUFFERED_SIZE = 1024 * 1024
+
+# An interrupted download to a file is resumed this many times, with a
+# Range request starting where the partial file ends.
+_MAX_RETRIES = 3
+
+# Number of requests a DownloadQueue keeps in flight. The shared session
+# allows as many keep-alive connections per host, so that the requests of
+# a queue do not wait on each other for a free connection.
+MAX_IN_FLIGHT = 6
 
 
 def soup_status_is_successful(status):
@@ -44,6 +62,7 @@ def get_soup_session():
         _session.set_property("timeout", 60)
         _session.set_property("idle-timeout", 60)
         _session.set_property("user-agent", "Sugar/%s" % config.version)
+        _session.set_property("max-conns-per-host", MAX_IN_FLIGHT)
         _session.add_feature_by_type(Soup.ProxyResolverDefault)
     return _session
 
@@ -66,8 +85,15 @@ class Downloader(GObject.GObject):
         self._uri = Soup.URI.new(url)
         self._session = session or get_soup_session()
         self._pending_buffers = []
+        self._pending_size = 0
+        self._paused = False
         self._downloaded_size = 0
         self._total_size = 0
+        self._content_size = None
+        self._resume_offset = 0
+        self._retries = 0
+        self._hash = None
+        self._expected_digest = None
         self._cancelling = False
         self._status_code = None
         self._output_file = None
@@ -84,19 +110,69 @@ class Downloader(GObject.GObject):
                 self._message.request_headers.append(
                     header_key, self._request_headers[header_key])
 
-    def download_to_temp(self):
+    def download_to_temp(self, expected_hash=None):
         """
         Download the contents of the provided URL to temporary file storage.
         Use .get_local_file_path() to find the location of where the file
         is saved. Upon completion, a successful download is indicated by a
         result of None in the complete signal parameters.
+        See download_to_file() for expected_hash.
         """
         url = self._uri.to_string(False)
-        temp_file_path = self._get_temp_file_path(url)
-        self._output_file = Gio.File.new_for_path(temp_file_path)
-        self._output_stream = self._output_file.create(
-            Gio.FileCreateFlags.PRIVATE, None)
-        self.download_chunked()
+        self.download_to_file(self._get_temp_file_path(url), expected_hash)
+
+    def download_to_file(self, file_path, expected_hash=None):
+        """
+        Download the contents of the provided URL to file_path. Upon
+        completion, a successful download is indicated by a result of None
+        in the complete signal parameters.
+        If file_path already exists, for example after an interrupted
+        download, it is taken as the start of the contents and only the
+        rest is requested, using the HTTP Range header. A transfer
+        interrupted by a network error is resumed the same way.
+        If expected_hash is given as 'algorithm:hexdigest' (for example
+        'sha256:816a7c...'), the downloaded file is checked against it and
+        the result is an IOError if it does not match.
+        """
+        self._output_file = Gio.File.new_for_path(file_path)
+        if expected_hash is not None:
+            algorithm, self._expected_digest = expected_hash.split(':', 1)
+            self._hash = hashlib.new(algorithm)
+        self._download_to_file()
+
+    def _download_to_file(self):
+        file_path = self._output_file.get_path()
+        offset = 0
+        if os.path.isfile(file_path):
+            offset = os.path.getsize(file_path)
+
+        if offset > 0:
+            self._output_stream = self._output_file.append_to(
+                Gio.FileCreateFlags.PRIVATE, None)
+            if self._hash is not None:
+                self._hash = hashlib.new(self._hash.name)
+                with open(file_path, 'rb') as f:
+                    for data in iter(lambda: f.read(65536), ''):
+                        self._hash.update(data)
+        else:
+            self._create_output_stream()
+
+        self._resume_offset = offset
+        self._downloaded_size = offset
+        self._pending_buffers = []
+        self._pending_size = 0
+        self._status_code = None
+        self._setup_message()
+        if offset > 0:
+            self._message.request_headers.set_range(offset, -1)
+        self._message.response_body.set_accumulate(False)
+        self._session.queue_message(self._message, self._message_cb, None)
+
+    def _create_output_stream(self):
+        self._output_stream = self._output_file.replace(
+            None, False, Gio.FileCreateFlags.PRIVATE, None)
+        if self._hash is not None:
+            self._hash = hashlib.new(self._hash.name)
 
     def download_chunked(self):
         """
@@ -132,15 +208,42 @@ class Downloader(GObject.GObject):
 
     def _message_cb(self, session, message, user_data):
         self._status_code = message.status_code
+        self._paused = False
         self._check_if_finished()
 
     def cancel(self):
         self._cancelling = True
+        if self._status_code is not None:
+            # the message is done, we may be writing out its last data or
+            # waiting to resume it
+            return
+        if self._paused:
+            self._paused = False
+            self._session.unpause_message(self._message)
         self._session.cancel_message(self._message, SOUP_STATUS_CANCELLED)
 
     def _headers_cb(self, message, user_data):
-        if soup_status_is_successful(message.status_code):
-            self._total_size = message.response_headers.get_content_length()
+        if not soup_status_is_successful(message.status_code):
+            return
+
+        self._total_size = message.response_headers.get_content_length()
+        self._content_size = self._total_size
+        if message.status_code == SOUP_STATUS_PARTIAL_CONTENT:
+            has_range, start_, end_, total = \
+                message.response_headers.get_content_range()
+            self._content_size = total if has_range and total >= 0 else None
+
+        if self._resume_offset == 0 or self._output_stream is None:
+            return
+
+        if message.status_code == SOUP_STATUS_PARTIAL_CONTENT:
+            self._total_size += self._resume_offset
+        else:
+            # the server ignored the Range header and sends everything
+            self._output_stream.close(None)
+            self._create_output_stream()
+            self._resume_offset = 0
+            self._downloaded_size = 0
 
     def _got_chunk_cb(self, message, buf):
         if self._cancelling or \
@@ -150,11 +253,26 @@ class Downloader(GObject.GObject):
         data = buf.get_as_bytes()
         self.emit('got-chunk', data)
         if self._output_stream:
+            if self._hash is not None:
+                self._hash.update(data.get_data())
             self._pending_buffers.append(data)
+            self._pending_size += data.get_size()
+            if self._pending_size > _MAX_BUFFERED_SIZE and not self._paused:
+                self._paused = True
+                self._session.pause_message(message)
             self._write_next_buffer()
 
     def __write_async_cb(self, output_stream, result, user_data):
         count = output_stream.write_bytes_finish(result)
+        if count < user_data.get_size():
+            # short write, the rest goes out next
+            self._pending_buffers.insert(0, GLib.Bytes.new_from_bytes(
+                user_data, count, user_data.get_size() - count))
+
+        self._pending_size -= count
+        if self._paused and self._pending_size <= _MAX_BUFFERED_SIZE / 2:
+            self._paused = False
+            self._session.unpause_message(self._message)
 
         self._downloaded_size += count
         if self._total_size > 0:
@@ -168,7 +286,12 @@ class Downloader(GObject.GObject):
             self._output_stream.close(None)
 
         result = None
-        if soup_status_is_successful(self._status_code):
+        if self._should_resume():
+            self._retries += 1
+            GLib.timeout_add_seconds(self._retries, self._resume)
+            return
+        elif soup_status_is_successful(self._status_code) or \
+                self._is_complete_file():
             if self._message.method == "HEAD":
                 # this is a get_size request
                 result = self._total_size
@@ -179,10 +302,39 @@ class Downloader(GObject.GObject):
                 # string
                 # https://bugzilla.gnome.org/show_bug.cgi?id=704105
                 result = self._message.response_body.flatten().get_as_bytes()
+            elif self._hash is not None and \
+                    self._hash.hexdigest() != self._expected_digest.lower():
+                self._output_file.delete(None)
+                result = IOError("Checksum mismatch for %s" %
+                                 self._uri.to_string(False))
         else:
             result = IOError("HTTP error code %d" % self._status_code)
         self.emit('complete', result)
 
+    def _should_resume(self):
+        # Only transport errors (Soup status codes below 100, such as a
+        # dropped connection) are worth a retry; HTTP errors are final.
+        return self._output_file is not None and \
+            not self._cancelling and \
+            self._status_code < 100 and \
+            self._status_code != SOUP_STATUS_CANCELLED and \
+            self._retries < _MAX_RETRIES
+
+    def _is_complete_file(self):
+        # A Range request past the end of the content means that the
+        # partial file already holds all of it.
+        return self._output_file is not None and \
+            self._resume_offset > 0 and \
+            self._status_code == SOUP_STATUS_RANGE_NOT_SATISFIABLE
+
+    def _resume(self):
+        if self._cancelling:
+            self.emit('complete', IOError("HTTP error code %d" %
+                                          SOUP_STATUS_CANCELLED))
+        else:
+            self._download_to_file()
+        return False
+
     def _check_if_finished(self):
         # To finish (for both successful completion and cancellation), we
         # require two conditions to become true:
@@ -206,7 +358,7 @@ class Downloader(GObject.GObject):
             data = self._pending_buffers.pop(0)
             self._output_stream.write_bytes_async(data, GObject.PRIORITY_LOW,
                                                   None, self.__write_async_cb,
-                                                  None)
+                                                  data)
 
     def _get_temp_file_path(self, uri):
         # TODO: Should we use the HTTP headers for the file name?
@@ -223,6 +375,83 @@ class Downloader(GObject.GObject):
 
         return file_path
 
+    def get_content_size(self):
+        """
+        Size of the whole remote content, as reported in the response
+        headers. For a partial download this comes from the Content-Range
+        header. None if it is not known.
+        """
+        return self._content_size
+
     def get_local_file_path(self):
         if self._output_file:
             return self._output_file.get_path()
+
+
+class DownloadQueue(GObject.GObject):
+    """
+    Run many Downloader requests with a bounded number of them in flight.
+
+    All the requests share one Soup session, so that connections to the
+    same server are kept alive and reused. The result of each request is
+    passed to the 'complete' signal as soon as it arrives, together with
+    the key it was added with. 'finished' is emitted once every request
+    has completed.
+    """
+    __gsignals__ = {
+        'complete': (GObject.SignalFlags.RUN_FIRST,
+                     None,
+                     (object, object)),
+        'finished': (GObject.SignalFlags.RUN_FIRST,
+                     None,
+                     ([])),
+    }
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, session=None):
+        GObject.GObject.__init__(self)
+        self._max_in_flight = max_in_flight
+        self._session = session or get_soup_session()
+        self._pending = deque()
+        self._active = {}
+        self._cancelling = False
+
+    def add(self, key, url, method='download', request_headers=None,
+            **kwargs):
+        """
+        Queue a request for url. method names the Downloader method to
+        run (download or get_size) and kwargs are passed on to it.
+        """
+        self._pending.append((key, url, method, request_headers, kwargs))
+        self._start_next()
+
+    def get_n_active(self):
+        return len(self._active)
+
+    def get_n_pending(self):
+        return len(self._pending)
+
+    def cancel(self):
+        self._cancelling = True
+        self._pending.clear()
+        for downloader in self._active.keys():
+            downloader.cancel()
+
+    def _start_next(self):
+        while self._pending and len(self._active) < self._max_in_flight:
+            key, url, method, request_headers, kwargs = \
+                self._pending.popleft()
+            downloader = Downloader(url, session=self._session,
+                                    request_headers=request_headers)
+            downloader.connect('complete', self.__complete_cb)
+            self._active[downloader] = key
+            getattr(downloader, method)(**kwargs)
+
+    def __complete_cb(self, downloader, result):
+        key = self._active.pop(downloader)
+        if not self._cancelling:
+            self._start_next()
+        self.emit('complete', key, result)
+
+        if not self._active and not self._pending:
+            self._cancelling = False
+            self.emit('finished')
@@ -19,21 +19,43 @@ A simple HTTP-based file-like object that supports seek() via the HTTP
 Range header. This means it doesn't have to download the whole file just
 to read a small part of it. Uses Downloader as a backend, and runs the
 regular main loop while waiting for data.
+
+Data is kept in a cache of aligned blocks. A read fetches the blocks it
+is missing in as few requests as possible, merging runs of adjacent
+blocks, and reads a few blocks ahead of the last one. The first request
+asks for the tail of the file, where a zip archive keeps its directory,
+and learns the size of the file from it.
+
+A server that ignores the Range header sends the whole file instead; it
+is then kept and every later read is served from it, without further
+requests.
 """
 
+from collections import OrderedDict
+
 from gi.repository import Gtk
 
 from jarabe.util.downloader import Downloader
 
+_BLOCK_SIZE = 16384
+_READ_AHEAD = 4
+_TAIL_SIZE = 65536
+_MAX_CACHED_BLOCKS = 256
+
 
 class _HttpRangeFileObject(object):
 
-    def __init__(self, url):
+    def __init__(self, url, block_size=_BLOCK_SIZE, read_ahead=_READ_AHEAD):
         self._url = url
+        self._block_size = block_size
+        self._read_ahead = read_ahead
+        self._blocks = OrderedDict()
         self._size = None
+        self._file_data = None
         self._offset = 0
         self._result = None
         self._complete = False
+        self.n_requests = 0
 
     def _downloader_complete_cb(self, downloader, result):
         self._result = result
@@ -46,17 +68,69 @@ class _HttpRangeFileObject(object):
         downloader = Downloader(self._url)
         downloader.connect('complete', self._downloader_complete_cb)
         getattr(downloader, method)(**kwargs)
+        self.n_requests += 1
 
         while not self._complete:
             Gtk.main_iteration()
 
         if isinstance(self._result, Exception):
             raise self._result
+        return downloader
+
+    def _fetch(self, start, end):
+        # Fetch bytes [start, end) and return them; a negative start asks
+        # for the last -start bytes of the file
+        if start < 0:
+            downloader = self._do_download('download', start=start, end=-1)
+        else:
+            downloader = self._do_download('download', start=start,
+                                           end=end - 1)
+        data = self._result.get_data()
+
+        if self._size is None:
+            self._size = downloader.get_content_size()
+        if len(data) == self._size:
+            # the whole file, asked for or because Range was ignored
+            requested = -start if start < 0 else end - start
+            if requested < self._size:
+                self._file_data = data
+                self._blocks.clear()
+            start = 0
+        elif start < 0:
+            if self._size is None:
+                raise IOError("No content range header")
+            start = self._size - len(data)
+
+        if self._file_data is None:
+            self._store(start, data)
+        return start, data
+
+    def _store(self, start, data):
+        bs = self._block_size
+        end = start + len(data)
+        index = (start + bs - 1) // bs
+        while index * bs < end:
+            block = data[index * bs - start:(index + 1) * bs - start]
+            # only whole blocks, or the last block of the file, are kept
+            if len(block) == bs or index * bs + len(block) == self._size:
+                self._blocks.pop(index, None)
+                self._blocks[index] = block
+            index += 1
+
+        while len(self._blocks) > _MAX_CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+
+    def _get_block(self, index):
+        block = self._blocks.pop(index)
+        self._blocks[index] = block
+        return block
 
     def tell(self):
         return self._offset
 
     def size(self):
+        if self._size is None:
+            self._fetch(-_TAIL_SIZE, None)
         if self._size is None:
             self._do_download('get_size')
             if self._result is None:
@@ -65,18 +139,78 @@ class _HttpRangeFileObject(object):
         return self._size
 
     def read(self, size=-1):
+        file_size = self.size()
         if size < 0:
-            end = self.size()
+            end = file_size
         else:
-            end = self._offset + size
+            end = min(self._offset + size, file_size)
+        if end <= self._offset:
+            return ''
+
+        bs = self._block_size
+        first = self._offset // bs
+        last = (end - 1) // bs
+
+        data = None
+        if self._file_data is None:
+            if last - first >= _MAX_CACHED_BLOCKS / 2:
+                # too large to go through the cache
+                start, data = self._fetch(self._offset, end)
+                data = data[self._offset - start:end - start]
+            else:
+                blocks = self._fetch_blocks(first, last)
+                if blocks is not None:
+                    data = ''.join(blocks)
+                    data = data[self._offset - first * bs:end - first * bs]
+        if self._file_data is not None:
+            # the server ignores Range, the whole file is at hand
+            data = self._file_data[self._offset:end]
+        if len(data) != end - self._offset:
+            raise IOError('Short read from %s' % self._url)
 
-        self._complete = False
-
-        self._do_download('download', start=self._offset, end=end - 1)
-        data = self._result.get_data()
         self._offset += len(data)
         return data
 
+    def _fetch_blocks(self, first, last):
+        # Return the blocks between first and last, fetching the missing
+        # ones and merging runs of adjacent ones into a single request.
+        # The last run reads ahead until the next cached block. The
+        # blocks are taken from the replies, as they may not all fit in
+        # the cache. Returns None if the server turns out to ignore Range.
+        blocks = {}
+        runs = []
+        for index in range(first, last + 1):
+            if index in self._blocks:
+                blocks[index] = self._get_block(index)
+                continue
+            if runs and runs[-1][1] == index:
+                runs[-1][1] = index + 1
+            else:
+                runs.append([index, index + 1])
+        if not runs:
+            return [blocks[index] for index in range(first, last + 1)]
+
+        n_blocks = (self._size + self._block_size - 1) // self._block_size
+        ahead = runs[-1][1]
+        while ahead < min(runs[-1][1] + self._read_ahead, n_blocks) and \
+                ahead not in self._blocks:
+            ahead += 1
+        runs[-1][1] = ahead
+
+        bs = self._block_size
+        for start, end in runs:
+            data_start, data = self._fetch(start * bs,
+                                           min(end * bs, self._size))
+            if self._file_data is not None:
+                return None
+            for index in range(max(start, first), min(end, last + 1)):
+                offset = index * bs - data_start
+                if offset < 0:
+                    raise IOError('Unexpected range from %s' % self._url)
+                blocks[index] = data[offset:offset + bs]
+
+        return [blocks[index] for index in range(first, last + 1)]
+
     def seek(self, offset, whence=0):
         if whence == 0:
             self._offset = offset
@@ -86,5 +220,5 @@ class _HttpRangeFileObject(object):
             self._offset = self.size() + offset
 
 
-def open(url):
-    return _HttpRangeFileObject(url)
+def open(url, block_size=_BLOCK_SIZE, read_ahead=_READ_AHEAD):
+    return _HttpRangeFileObject(url, block_size, read_ahead)
@@ -28,3 +28,20 @@ def normalize_string(unicode_string):
 
     """
     return normalize('NFKD', unicode_string).encode('ASCII', 'ignore').lower()
+
+
+def is_narrowing(old_query, new_query):
+    """Return whether whatever matches new_query also matched old_query,
+    so a filter only needs to look again at the previous matches.
+
+    >>> is_narrowing('ab', 'abc')
+    True
+
+    >>> is_narrowing('abc', 'ab')
+    False
+
+    >>> is_narrowing('', 'a')
+    False
+
+    """
+    return bool(old_query) and new_query.find(old_query) > -1
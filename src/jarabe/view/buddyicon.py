@@ -17,7 +17,6 @@ from sugar3.graphics import style
 from sugar3.graphics.icon import CanvasIcon
 
 from jarabe.view.buddymenu import BuddyMenu
-from jarabe.util.normalize import normalize_string
 
 
 _FILTERED_ALPHA = 0.33
@@ -66,11 +65,11 @@ class BuddyIcon(CanvasIcon):
                 palette.props.icon.props.xo_color = self._buddy.get_color()
 
     def set_filter(self, query):
-        normalized_name = normalize_string(
-            self._buddy.get_nick().decode('utf-8'))
-        self._filtered = (normalized_name.find(query) == -1) \
+        filtered = (self._buddy.get_search_key().find(query) == -1) \
             and not self._buddy.is_owner()
-        self._update_color()
+        if filtered != self._filtered:
+            self._filtered = filtered
+            self._update_color()
 
     def get_positioning_data(self):
         return self._buddy.get_key()
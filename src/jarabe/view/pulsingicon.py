@@ -13,8 +13,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 import math
 
+import dbus
 from gi.repository import GObject
 
 from sugar3.graphics.icon import Icon
@@ -25,14 +27,108 @@ from sugar3.graphics.icon import CanvasIcon
 _INTERVAL = 100
 _STEP = math.pi / 10  # must be a fraction of pi, for clean caching
 _MINIMAL_ALPHA_VALUE = 0.33
+# frames are this many times further apart when running on battery
+_BATTERY_FRAME_FACTOR = 2
+
+_UPOWER_SERVICE = 'org.freedesktop.UPower'
+_UPOWER_PATH = '/org/freedesktop/UPower'
+_UPOWER_IFACE = 'org.freedesktop.UPower'
+
+_clock = None
+
+
+class _AnimationClock(object):
+    """Single timer driving every running Pulser
+
+    Pulsers advance together on each frame, instead of each one waking
+    up on its own timeout. Frames are spaced _INTERVAL apart, or
+    _BATTERY_FRAME_FACTOR times that while the machine is on battery.
+    """
+
+    def __init__(self):
+        self._pulsers = []
+        self._frame_sid = None
+        self._factor = 1
+
+        try:
+            bus = dbus.SystemBus()
+            upower = bus.get_object(_UPOWER_SERVICE, _UPOWER_PATH)
+            props = dbus.Interface(upower, dbus.PROPERTIES_IFACE)
+            props.Get(_UPOWER_IFACE, 'OnBattery',
+                      reply_handler=self.__get_on_battery_reply_cb,
+                      error_handler=self.__get_on_battery_error_cb)
+            bus.add_signal_receiver(self.__upower_properties_changed_cb,
+                                    signal_name='PropertiesChanged',
+                                    path=_UPOWER_PATH,
+                                    dbus_interface=dbus.PROPERTIES_IFACE)
+        except dbus.DBusException:
+            logging.debug('UPower not available, assuming AC power')
+
+    def __get_on_battery_reply_cb(self, on_battery):
+        self._set_on_battery(on_battery)
+
+    def __get_on_battery_error_cb(self, err):
+        logging.debug('Error getting the power state: %s', err)
+
+    def __upower_properties_changed_cb(self, interface, changed,
+                                       invalidated):
+        if interface == _UPOWER_IFACE and 'OnBattery' in changed:
+            self._set_on_battery(changed['OnBattery'])
+
+    def _set_on_battery(self, on_battery):
+        if on_battery:
+            factor = _BATTERY_FRAME_FACTOR
+        else:
+            factor = 1
+        if factor == self._factor:
+            return
+
+        self._factor = factor
+        if self._frame_sid is not None:
+            GObject.source_remove(self._frame_sid)
+            self._frame_sid = None
+            self._start()
+
+    def _start(self):
+        self._frame_sid = GObject.timeout_add(_INTERVAL * self._factor,
+                                              self.__frame_cb)
+
+    def add(self, pulser):
+        if pulser in self._pulsers:
+            return
+        self._pulsers.append(pulser)
+        if self._frame_sid is None:
+            self._start()
+
+    def remove(self, pulser):
+        if pulser not in self._pulsers:
+            return
+        self._pulsers.remove(pulser)
+        if not self._pulsers and self._frame_sid is not None:
+            GObject.source_remove(self._frame_sid)
+            self._frame_sid = None
+
+    def __frame_cb(self):
+        for pulser in self._pulsers[:]:
+            pulser.advance(self._factor)
+        return True
+
+
+def _get_clock():
+    global _clock
+    if _clock is None:
+        _clock = _AnimationClock()
+    return _clock
 
 
 class Pulser(object):
 
     def __init__(self, icon, interval=_INTERVAL):
-        self._pulse_hid = None
+        self._running = False
         self._icon = icon
-        self._interval = interval
+        # number of clock ticks between two steps of this pulser
+        self._period = max(int(round(float(interval) / _INTERVAL)), 1)
+        self._ticks = 0
         self._phase = 0
         self._start_scale = 1.0
         self._end_scale = 1.0
@@ -52,17 +148,18 @@ class Pulser(object):
     def start(self, restart=False):
         if restart:
             self._phase = 0
-        if self._pulse_hid is None:
-            self._pulse_hid = GObject.timeout_add(self._interval,
-                                                  self.__pulse_cb)
+        if not self._running:
+            self._running = True
+            self._ticks = 0
+            _get_clock().add(self)
         if self._start_scale != self._end_scale:
             self._icon.scale = self._start_scale + \
                 self._current_scale_step * self._current_zoom_step
 
     def stop(self):
-        if self._pulse_hid is not None:
-            GObject.source_remove(self._pulse_hid)
-            self._pulse_hid = None
+        if self._running:
+            self._running = False
+            _get_clock().remove(self)
         self._icon.xo_color = self._icon.get_base_color()
         self._phase = 0
         self._icon.alpha = 1.0
@@ -72,15 +169,25 @@ class Pulser(object):
         self._icon.alpha = _MINIMAL_ALPHA_VALUE + \
             (1 - _MINIMAL_ALPHA_VALUE) * (math.cos(self._phase) + 1) / 2
 
-    def __pulse_cb(self):
-        self._phase += _STEP
+    def advance(self, ticks):
+        """Move the animation forward by a number of clock ticks."""
+        self._ticks += ticks
+        steps = self._ticks // self._period
+        self._ticks %= self._period
+        if not steps:
+            return
+
+        self._phase += _STEP * steps
         if self._current_zoom_step <= self._zoom_steps and \
                 self._start_scale != self._end_scale:
+            self._current_zoom_step = min(self._current_zoom_step + steps,
+                                          self._zoom_steps + 1)
             self._icon.scale = self._start_scale + \
-                self._current_scale_step * self._current_zoom_step
-            self._current_zoom_step += 1
-        self.update()
-        return True
+                self._current_scale_step * (self._current_zoom_step - 1)
+
+        # nothing to redraw for icons that are not on screen
+        if self._icon.get_mapped():
+            self.update()
 
 
 class PulsingIcon(Icon):
@@ -61,3 +61,54 @@ class TestBundleRegistry(unittest.TestCase):
         registry.install(bundle)
         installed_bundle = registry.get_bundle("org.sugarlabs.MyActivity")
         self.assertIsNotNone(installed_bundle)
+
+    def test_bundle_cache(self):
+        registry = bundleregistry.get_registry()
+        bundle = bundle_from_archive(os.path.join(data_dir, 'activity-1.xo'))
+        registry.install(bundle)
+        bundle_path = registry.get_bundle(
+            "org.sugarlabs.MyActivity").get_path()
+
+        cache_path = os.path.join(os.environ['SUGAR_LIBRARY_PATH'], 'cache')
+        cache = bundleregistry._BundleCache(cache_path)
+        cache.get_bundle(bundle_path)
+        cache.save()
+
+        def bundle_from_dir(path):
+            self.fail('Cached bundle parsed again')
+
+        original_bundle_from_dir = bundleregistry.bundle_from_dir
+        bundleregistry.bundle_from_dir = bundle_from_dir
+        try:
+            cached_bundle = bundleregistry._BundleCache(
+                cache_path).get_bundle(bundle_path)
+        finally:
+            bundleregistry.bundle_from_dir = original_bundle_from_dir
+        self.assertEqual(cached_bundle.get_bundle_id(),
+                         "org.sugarlabs.MyActivity")
+
+    def test_install_queue_order(self):
+        class FakeBundle(object):
+            def __init__(self, bundle_id):
+                self._bundle_id = bundle_id
+
+            def get_bundle_id(self):
+                return self._bundle_id
+
+        queue = bundleregistry._InstallQueue(None)
+        queue._start_worker = lambda: None
+        for bundle_id, priority in [
+                ('a', bundleregistry.INSTALL_PRIORITY_BATCH),
+                ('b', bundleregistry.INSTALL_PRIORITY_BATCH),
+                ('c', bundleregistry.INSTALL_PRIORITY_INTERACTIVE),
+                ('a', bundleregistry.INSTALL_PRIORITY_BATCH)]:
+            queue.enqueue(FakeBundle(bundle_id), False, None, None, priority)
+
+        order = [queue._pop_task().bundle.get_bundle_id() for i in range(3)]
+        self.assertEqual(['c', 'a', 'b'], order)
+
+        # the second task for 'a' waits until the first one is done
+        self.assertIsNone(queue._pop_task())
+        queue._running_ids.discard('a')
+        task = queue._pop_task()
+        self.assertEqual('a', task.bundle.get_bundle_id())
@@ -14,8 +14,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import hashlib
 import unittest
+import tempfile
 import threading
+import BaseHTTPServer
 import SimpleHTTPServer
 import SocketServer
 
@@ -24,6 +27,7 @@ from gi.repository import GLib
 
 from sugar3 import env
 from jarabe.util.downloader import Downloader
+from jarabe.util.downloader import DownloadQueue
 
 profile_data_dir = os.path.join(env.get_profile_path(), 'data')
 if not os.path.isdir(profile_data_dir):
@@ -34,6 +38,38 @@ data_dir = os.path.join(tests_dir, "data")
 
 GLib.threads_init()
 
+_CONTENT = ''.join(chr(i % 256) for i in range(100000))
+
+
+class _DroppingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serve _CONTENT, but drop the connection halfway through any request
+    that does not ask for a range.
+    """
+    requests = []
+
+    def do_GET(self):
+        range_header = self.headers.getheader('Range')
+        _DroppingHandler.requests.append(range_header)
+        if range_header is None:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(_CONTENT)))
+            self.end_headers()
+            self.wfile.write(_CONTENT[:len(_CONTENT) / 2])
+            self.close_connection = 1
+            return
+
+        start = int(range_header.split('=')[1].split('-')[0])
+        self.send_response(206)
+        self.send_header('Content-Length', str(len(_CONTENT) - start))
+        self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                         (start, len(_CONTENT) - 1, len(_CONTENT)))
+        self.end_headers()
+        self.wfile.write(_CONTENT[start:])
+
+    def log_message(self, *args):
+        pass
+
 
 class TestDownloader(unittest.TestCase):
     def setUp(self):
@@ -90,3 +126,96 @@ class TestDownloader(unittest.TestCase):
             Gtk.main_iteration()
 
         self.assertEqual(6, self._result)
+
+    def test_download_queue(self):
+        queue = DownloadQueue(max_in_flight=2)
+        results = {}
+        self._complete = False
+
+        def complete_cb(queue, key, result):
+            self.assertLessEqual(queue.get_n_active(), 2)
+            results[key] = result
+
+        def finished_cb(queue):
+            self._complete = True
+
+        queue.connect('complete', complete_cb)
+        queue.connect('finished', finished_cb)
+        url = "http://0.0.0.0:%d/data/test.txt" % self._port
+        for i in range(5):
+            queue.add(i, url)
+        queue.add('size', url, 'get_size')
+        self.assertEqual(2, queue.get_n_active())
+
+        while not self._complete:
+            Gtk.main_iteration()
+
+        self.assertEqual(6, len(results))
+        for i in range(5):
+            self.assertEqual("hello\n", results[i].get_data())
+        self.assertEqual(6, results['size'])
+        self.assertEqual(0, queue.get_n_pending())
+
+
+class TestResumableDownload(unittest.TestCase):
+    def setUp(self):
+        _DroppingHandler.requests = []
+        self._server = SocketServer.TCPServer(("", 0), _DroppingHandler)
+        self._port = self._server.server_address[1]
+        self._server_thread = threading.Thread(
+            target=self._server.serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+        fd, self._path = tempfile.mkstemp(dir=profile_data_dir)
+        os.close(fd)
+        os.unlink(self._path)
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server_thread.join()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def download_complete_cb(self, downloader, result):
+        self._complete = True
+        self._result = result
+
+    def _download(self, expected_hash=None):
+        downloader = Downloader("http://0.0.0.0:%d/file" % self._port)
+        self._complete = False
+        downloader.connect('complete', self.download_complete_cb)
+        downloader.download_to_file(self._path, expected_hash)
+
+        while not self._complete:
+            Gtk.main_iteration()
+
+    def test_resume_dropped_transfer(self):
+        self._download()
+
+        self.assertIsNone(self._result)
+        self.assertEqual(_CONTENT, open(self._path, 'rb').read())
+        self.assertIsNone(_DroppingHandler.requests[0])
+        self.assertEqual(2, len(_DroppingHandler.requests))
+
+    def test_resume_partial_file(self):
+        with open(self._path, 'wb') as f:
+            f.write(_CONTENT[:1000])
+        self._download()
+
+        self.assertIsNone(self._result)
+        self.assertEqual(_CONTENT, open(self._path, 'rb').read())
+        self.assertEqual(['bytes=1000-'], _DroppingHandler.requests)
+
+    def test_hash_verification(self):
+        digest = hashlib.sha256(_CONTENT).hexdigest()
+        self._download('sha256:%s' % digest)
+        self.assertIsNone(self._result)
+
+    def test_hash_mismatch(self):
+        with open(self._path, 'wb') as f:
+            f.write('x' * 1000)
+        digest = hashlib.sha256(_CONTENT).hexdigest()
+        self._download('sha256:%s' % digest)
+
+        self.assertIsInstance(self._result, IOError)
+        self.assertFalse(os.path.exists(self._path))
@@ -0,0 +1,60 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from jarabe.desktop.grid import Grid
+
+
+class TestGrid(unittest.TestCase):
+    def _assert_no_overlap(self, grid, children):
+        for child in children:
+            rect = grid.get_child_rect(child)
+            self.assertEqual(grid.compute_weight(rect),
+                             rect.width * rect.height)
+
+    def test_add_places_without_collisions(self):
+        grid = Grid(300, 225)
+        children = range(200)
+        for child in children:
+            grid.add(child, 11, 11)
+
+        self.assertEqual(grid._collisions, [])
+        self._assert_no_overlap(grid, children)
+
+    def test_move_relocates_in_one_pass(self):
+        grid = Grid(300, 225)
+        children = range(50)
+        for child in children:
+            grid.add(child, 11, 11)
+
+        for child in children[:10]:
+            grid.move(child, 100, 100)
+        self.assertNotEqual(grid._collisions, [])
+
+        self.assertFalse(grid._Grid__solve_collisions_cb())
+        self._assert_no_overlap(grid, children)
+
+    def test_remove(self):
+        grid = Grid(30, 30)
+        grid.add('a', 10, 10, 0, 0)
+        grid.add('b', 10, 10, 20, 20)
+        grid.remove('a')
+
+        self.assertFalse(grid.is_in_grid('a'))
+        self.assertEqual(grid._get_overlapping(grid.get_child_rect('b'),
+                                               exclude='b'), set())
+        grid.add('c', 10, 10)
+        self._assert_no_overlap(grid, ['b', 'c'])
@@ -0,0 +1,142 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import unittest
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from gi.repository import GLib
+
+from jarabe.util import httprange
+from jarabe.model.update.microformat import MetadataLookup
+
+tests_dir = os.getcwd()
+data_dir = os.path.join(tests_dir, "data")
+
+GLib.threads_init()
+
+
+class _RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve files from data_dir, honouring the Range header."""
+
+    def do_GET(self):
+        path = os.path.join(data_dir, os.path.basename(self.path))
+        content = open(path, 'rb').read()
+        size = len(content)
+
+        range_header = self.headers.getheader('Range')
+        if range_header is None:
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+
+        first, last = range_header.split('=')[1].split('-')
+        if first == '':
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        self.send_response(206)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Content-Range',
+                         'bytes %d-%d/%d' % (start, end, size))
+        self.end_headers()
+        self.wfile.write(content[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+class _NoRangeHandler(_RangeHandler):
+    """Serve whole files, ignoring the Range header."""
+
+    def do_GET(self):
+        del self.headers['Range']
+        _RangeHandler.do_GET(self)
+
+
+class _ServerTestCase(unittest.TestCase):
+    handler = _RangeHandler
+
+    def setUp(self):
+        self._server = SocketServer.TCPServer(("", 0), self.handler)
+        self._port = self._server.server_address[1]
+        self._server_thread = threading.Thread(
+            target=self._server.serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+        self._url = "http://0.0.0.0:%d/activity-1.xo" % self._port
+        self._content = open(os.path.join(data_dir, "activity-1.xo"),
+                             "rb").read()
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server_thread.join()
+
+
+class TestHttpRange(_ServerTestCase):
+
+    def test_read(self):
+        fd = httprange.open(self._url, block_size=64, read_ahead=1)
+        self.assertEqual(len(self._content), fd.size())
+
+        fd.seek(10)
+        self.assertEqual(self._content[10:110], fd.read(100))
+        self.assertEqual(110, fd.tell())
+        fd.seek(-20, 2)
+        self.assertEqual(self._content[-20:], fd.read())
+
+    def test_cached_blocks(self):
+        fd = httprange.open(self._url, block_size=64, read_ahead=0)
+        fd.seek(0)
+        fd.read(200)
+        n_requests = fd.n_requests
+        fd.seek(70)
+        fd.read(50)
+        self.assertEqual(n_requests, fd.n_requests)
+
+    def test_zip_name_lookup(self):
+        fd = httprange.open(self._url)
+        lookup = MetadataLookup(None)
+        self.assertEqual("My Activity", lookup._name_from_fd(fd))
+        self.assertLessEqual(fd.n_requests, 2)
+
+
+class TestHttpRangeIgnored(_ServerTestCase):
+    handler = _NoRangeHandler
+
+    def setUp(self):
+        _ServerTestCase.setUp(self)
+        # make the first request ask for less than the whole file
+        self._tail_size = httprange._TAIL_SIZE
+        httprange._TAIL_SIZE = 64
+
+    def tearDown(self):
+        httprange._TAIL_SIZE = self._tail_size
+        _ServerTestCase.tearDown(self)
+
+    def test_single_download(self):
+        fd = httprange.open(self._url, block_size=64, read_ahead=0)
+        fd.seek(100)
+        self.assertEqual(self._content[100:300], fd.read(200))
+        fd.seek(-20, 2)
+        self.assertEqual(self._content[-20:], fd.read())
+        fd.seek(0)
+        self.assertEqual(self._content[:10], fd.read(10))
+        self.assertEqual(1, fd.n_requests)
@@ -0,0 +1,112 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from jarabe.journal.mountindex import MountIndex, IndexRecord
+
+
+def _record(path, mtime, size, title=None, activity='', keep=0):
+    return IndexRecord(path=path, mtime=mtime, size=size,
+                       mime_type='text/plain', title=title or path,
+                       description=path, tags=None, fulltext=None,
+                       activity=activity, keep=keep, has_metadata=1)
+
+
+class TestMountIndex(unittest.TestCase):
+    def setUp(self):
+        self._mount_point = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self._mount_point, '.Sugar-Metadata'))
+        self._index = MountIndex(self._mount_point, '.Sugar-Metadata')
+
+    def tearDown(self):
+        self._index.close()
+        shutil.rmtree(self._mount_point)
+
+    def _path(self, *names):
+        return os.path.join(self._mount_point, *names)
+
+    def test_directory_validation(self):
+        root = self._mount_point
+        self.assertIsNone(self._index.get_subdirectories(root, 1.0, 0))
+
+        self._index.update_directory(root, 1.0, 0, [], [self._path('a')])
+        self.assertEqual(self._index.get_subdirectories(root, 1.0, 0),
+                         [self._path('a')])
+        self.assertIsNone(self._index.get_subdirectories(root, 2.0, 0))
+        self.assertIsNone(self._index.get_subdirectories(root, 1.0, 1.0))
+        self.assertTrue(os.path.exists(self._path('.Sugar-Metadata',
+                                                  'index.db')))
+
+    def test_find_sorted_and_filtered(self):
+        root = self._mount_point
+        self._index.update_directory(
+            root, 1.0, 0,
+            [_record(self._path('old'), 10, 300),
+             _record(self._path('new'), 30, 100, title='Drawing',
+                     activity='org.laptop.Paint', keep=1),
+             _record(self._path('mid'), 20, 200)], [])
+
+        paths = [f.path for f in self._index.find([root])]
+        self.assertEqual(paths, [self._path('new'), self._path('mid'),
+                                 self._path('old')])
+
+        paths = [f.path for f in
+                 self._index.find([root], order_by='-filesize')]
+        self.assertEqual(paths, [self._path('new'), self._path('mid'),
+                                 self._path('old')])
+
+        paths = [f.path for f in self._index.find([root], date_start=15)]
+        self.assertEqual(paths, [self._path('new'), self._path('mid')])
+
+        regex = re.compile('(?=.*drawing.*)', re.IGNORECASE)
+        found = self._index.find([root], regex=regex)
+        self.assertEqual([f.path for f in found], [self._path('new')])
+
+        found = self._index.find([root], only_favorites=True,
+                                 activity='org.laptop.Paint')
+        self.assertEqual([f.path for f in found], [self._path('new')])
+
+    def test_removed_directory_is_purged(self):
+        root = self._mount_point
+        sub = self._path('sub')
+        self._index.update_directory(root, 1.0, 0, [], [sub])
+        self._index.update_directory(sub, 1.0, 0,
+                                     [_record(self._path('sub', 'f'), 1, 1)],
+                                     [])
+        self.assertEqual(len(self._index.find([root, sub])), 1)
+
+        self._index.update_directory(root, 2.0, 0, [], [])
+        self.assertIsNone(self._index.get_subdirectories(sub, 1.0, 0))
+        self.assertEqual(self._index.find([root, sub]), [])
+
+    def test_discard(self):
+        root = self._mount_point
+        self._index.update_directory(root, 1.0, 0,
+                                     [_record(self._path('f'), 1, 1)], [])
+        self._index.close()
+        index_path = self._path('.Sugar-Metadata', 'index.db')
+        with open(index_path, 'r+b') as index_file:
+            index_file.seek(1024)
+            index_file.write('\xff' * 4096)
+
+        self._index.discard()
+        self.assertFalse(os.path.exists(index_path))
+        self.assertIsNone(self._index.get_subdirectories(root, 1.0, 0))
+        self.assertEqual(self._index.find([root]), [])
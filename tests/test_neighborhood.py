@@ -0,0 +1,112 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import time
+import unittest
+
+from jarabe.model.buddy import BuddyModel
+from jarabe.model.neighborhood import ActivityModel
+from jarabe.model.neighborhood import _Registry
+
+_ACCOUNT = '/org/freedesktop/Telepathy/Account/salut/local_xmpp/salut'
+_SERVER_ACCOUNT = '/org/freedesktop/Telepathy/Account/gabble/jabber/jabber'
+
+
+def _make_buddy(i, account=_ACCOUNT):
+    return BuddyModel(nick='buddy%d' % i, key='key%d' % i, account=account,
+                      contact_id='buddy%d@sugar' % i, handle=i)
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self._owner = BuddyModel(nick='owner', key='owner-key')
+        self._registry = _Registry(self._owner)
+
+    def test_buddy_indexes(self):
+        buddy = _make_buddy(1)
+        self._registry.add_buddy(buddy.contact_id, buddy)
+        self.assertIs(buddy, self._registry.get_buddy_by_key('key1'))
+        self.assertIs(buddy, self._registry.get_buddy_by_handle(1))
+        self.assertIs(buddy, self._registry.get_buddy_by_handle(1, _ACCOUNT))
+        self.assertIsNone(
+            self._registry.get_buddy_by_handle(1, _SERVER_ACCOUNT))
+        self.assertIs(self._owner,
+                      self._registry.get_buddy_by_key('owner-key'))
+
+        self._registry.remove_buddy(buddy.contact_id)
+        self.assertIsNone(self._registry.get_buddy_by_key('key1'))
+        self.assertIsNone(self._registry.get_buddy_by_handle(1))
+
+    def test_same_handle_on_two_accounts(self):
+        local = _make_buddy(1)
+        server = BuddyModel(nick='other', key='other-key',
+                            account=_SERVER_ACCOUNT,
+                            contact_id='other@server', handle=1)
+        self._registry.add_buddy(local.contact_id, local)
+        self._registry.add_buddy(server.contact_id, server)
+        self.assertIs(server,
+                      self._registry.get_buddy_by_handle(1, _SERVER_ACCOUNT))
+
+        self._registry.remove_buddy(server.contact_id)
+        self.assertIs(local, self._registry.get_buddy_by_handle(1))
+
+    def test_key_arrives_later(self):
+        buddy = BuddyModel(nick='late', account=_ACCOUNT,
+                           contact_id='late@sugar', handle=7)
+        self._registry.add_buddy(buddy.contact_id, buddy)
+        self.assertIsNone(self._registry.get_buddy_by_key(None))
+
+        self._registry.set_buddy_key(buddy, 'late-key')
+        self.assertEqual('late-key', buddy.key)
+        self.assertIs(buddy, self._registry.get_buddy_by_key('late-key'))
+
+    def test_activity_index(self):
+        activity = ActivityModel('activity-id', 42)
+        self._registry.add_activity('activity-id', activity)
+        self.assertIs(activity, self._registry.get_activity_by_room(42))
+
+        self._registry.remove_activity('activity-id')
+        self.assertIsNone(self._registry.get_activity_by_room(42))
+        self.assertNotIn('activity-id', self._registry.activities)
+
+
+def benchmark():
+    """
+    Time a burst of presence events (a lookup by key and by handle for each
+    buddy, then its removal) against neighborhoods of growing size. The
+    cost per event should stay flat.
+    """
+    for n_buddies in (100, 1000, 10000):
+        registry = _Registry(BuddyModel(nick='owner', key='owner-key'))
+        buddies = [_make_buddy(i) for i in range(n_buddies)]
+        for buddy in buddies:
+            registry.add_buddy(buddy.contact_id, buddy)
+
+        start = time.time()
+        for buddy in buddies:
+            registry.get_buddy_by_key(buddy.key)
+            registry.get_buddy_by_handle(buddy.handle, buddy.account)
+            registry.remove_buddy(buddy.contact_id)
+        elapsed = time.time() - start
+        print '%6d buddies: %.2f us per event' % \
+            (n_buddies, elapsed / n_buddies * 1e6)
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        unittest.main()
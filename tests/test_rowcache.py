@@ -0,0 +1,48 @@
+# Copyright (C) 2026 Sugar Labs
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from jarabe.journal.rowcache import RowCache
+
+
+class TestRowCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = RowCache(2)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', ['a'])
+        self.assertEqual(cache.get('a'), ['a'])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = RowCache(2)
+        cache.set('a', ['a'])
+        cache.set('b', ['b'])
+        cache.get('a')
+        cache.set('c', ['c'])
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_invalidate(self):
+        cache = RowCache(2)
+        cache.set('a', ['a'])
+        cache.set('b', ['b'])
+        cache.invalidate('a')
+        cache.invalidate('missing')
+        self.assertNotIn('a', cache)
+        cache.clear()
+        self.assertEqual(len(cache), 0)